@@ -0,0 +1 @@
+"""Endpoint benchmarks against a synthetic dataset (see benchmarks/run.py)."""
@@ -0,0 +1,164 @@
+"""The requests each benchmark run makes, grouped by the user that makes them.
+
+Every named URL of the app must be benchmarked or listed in ``SKIPPED`` with a
+reason; ``check_coverage`` fails the run otherwise, so new views can't slip
+past the budget unnoticed.
+
+An endpoint's ``path`` may be a callable. It is called before every request,
+outside the timed section, for requests that use something up, such as
+accepting a proposal or completing an upload.
+"""
+import io
+from collections import namedtuple
+
+from django.core.files.base import ContentFile
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from core.models import Project, Proposal, Message
+from core.uploads import append_chunk, start_upload
+
+
+Endpoint = namedtuple('Endpoint', 'name role method path data headers', defaults=[None])
+
+BENCHMARKED_NAMESPACES = ('core', 'client', 'freelancer')
+SKIPPED = {
+    'core:api_stream_messages': 'a long-lived SSE stream, not a request with a latency',
+    'core:api_query_budget_report': 'staff-only diagnostics',
+    'client:register': 'signed-out form',
+    'client:login': 'signed-out form',
+    'client:logout': 'ends the session',
+    'freelancer:register': 'signed-out form',
+    'freelancer:login': 'signed-out form',
+    'freelancer:logout': 'ends the session',
+}
+UPLOAD_CHUNK = b'\x00' * (64 * 1024)
+
+
+def pick_actors():
+    """A client and their hired freelancer on a busy in-progress project"""
+    active = Project.objects.filter(status='in_progress').select_related('client').order_by('id').first()
+    if active is None:
+        raise RuntimeError('The dataset has no in-progress project to benchmark against.')
+    freelancer = active.proposals.get(status='accepted').freelancer
+    open_project = Project.objects.filter(status='open').exclude(
+        proposals__freelancer=freelancer
+    ).order_by('id').first()
+    last_message = Message.objects.filter(project=active).order_by('-id').values_list('id', flat=True).first()
+    # The client's own open project, where they are shown suggested freelancers
+    client_open_project = Project.objects.filter(client=active.client, status='open').order_by('id').first()
+    if client_open_project is None:
+        client_open_project = Project.objects.create(
+            client=active.client, title='Benchmark project', description='Python Django API work', budget=1000,
+        )
+    attachment = Message.objects.create(
+        project=active, sender=active.client, content='Spec',
+        attachment=ContentFile(b'%PDF-1.4 benchmark' * 4096, name='spec.pdf'),
+    )
+    return {
+        'client': active.client,
+        'freelancer': freelancer,
+        'active_project': active,
+        'open_project': open_project,
+        'client_open_project': client_open_project,
+        'attachment_message': attachment,
+        'last_message_id': last_message or 0,
+    }
+
+
+def pending_proposal(actors):
+    """A fresh open project of the client with a pending bid from the freelancer"""
+    project = Project.objects.create(
+        client=actors['client'], title='Benchmark hire', description='Accepted by the benchmark', budget=500,
+    )
+    return Proposal.objects.create(
+        project=project, freelancer=actors['freelancer'], cover_letter='Benchmark bid', bid_amount=450,
+    )
+
+
+def new_upload(actors, received=0):
+    """A chunked upload by the client on the active project with ``received`` bytes in"""
+    upload = start_upload(actors['active_project'].id, actors['client'], 'data.bin', len(UPLOAD_CHUNK))
+    if received:
+        upload = append_chunk(upload, 0, io.BytesIO(UPLOAD_CHUNK[:received]), received)
+    return upload
+
+
+def _url_names(resolver, namespace=None):
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _url_names(pattern, pattern.namespace or namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name and namespace in BENCHMARKED_NAMESPACES:
+            yield f'{namespace}:{pattern.name}'
+
+
+def check_coverage(endpoints):
+    """Fail when a named URL is neither benchmarked nor listed in ``SKIPPED``"""
+    covered = {endpoint.name for endpoint in endpoints} | set(SKIPPED)
+    missing = sorted(set(_url_names(get_resolver())) - covered)
+    if missing:
+        raise RuntimeError(f'URLs without a benchmark (add them to build_endpoints or SKIPPED): {", ".join(missing)}')
+
+
+def build_endpoints(actors):
+    active = actors['active_project'].id
+    open_project = actors['open_project'].id
+    last_id = actors['last_message_id']
+
+    attachment = actors['attachment_message']
+
+    def get(name, role, *args, **query):
+        return Endpoint(name, role, 'get', reverse(name, args=args), query)
+
+    def upload_url(name, received):
+        return lambda: reverse(name, args=[new_upload(actors, received).pk])
+
+    endpoints = [
+        get('core:index', None),
+
+        # Client pages
+        get('client:dashboard', 'client'),
+        get('core:project_list', 'client'),
+        get('core:project_create', 'client'),
+        get('core:project_detail', 'client', active),
+        # Open project: ranks suggested freelancers
+        get('core:project_detail', 'client', actors['client_open_project'].id),
+        get('core:project_proposals', 'client', active),
+        get('core:proposal_list_client', 'client'),
+        get('core:browse_freelancers', 'client'),
+        get('core:browse_freelancers', 'client', sort='reviews', skill='Python'),
+        get('core:all_messages', 'client'),
+        get('core:project_messages', 'client', active),
+        get('core:message_attachment', 'client', attachment.id, attachment.attachment_filename),
+        Endpoint('core:proposal_accept', 'client', 'post',
+                 lambda: reverse('core:proposal_accept', args=[pending_proposal(actors).pk]), {}),
+
+        # Freelancer pages
+        get('freelancer:dashboard', 'freelancer'),
+        get('freelancer:profile_edit', 'freelancer'),
+        get('core:freelancer_find_work', 'freelancer'),
+        get('core:project_list', 'freelancer', q='python django', sort='relevance'),
+        get('core:project_list', 'freelancer', min_budget='1000', sort='-budget'),
+        get('core:project_detail', 'freelancer', open_project),
+        get('core:proposal_create', 'freelancer', open_project),
+        get('core:proposal_list', 'freelancer'),
+        get('core:all_messages', 'freelancer'),
+
+        # APIs
+        get('core:api_get_messages', 'freelancer', active),
+        get('core:api_get_new_messages', 'freelancer', active, last_id=last_id),
+        get('core:api_financial_summary', 'client', period='month'),
+        get('core:api_financial_summary', 'freelancer', period='year'),
+        Endpoint('core:api_send_message', 'client', 'post', reverse('core:api_send_message', args=[active]),
+                 {'content': 'Benchmark ping'}),
+
+        # Chunked attachment upload
+        Endpoint('core:api_start_attachment_upload', 'client', 'post',
+                 reverse('core:api_start_attachment_upload', args=[active]),
+                 {'filename': 'data.bin', 'size': len(UPLOAD_CHUNK)}),
+        Endpoint('core:api_attachment_upload', 'client', 'put', upload_url('core:api_attachment_upload', 0),
+                 UPLOAD_CHUNK, {'Upload-Offset': '0'}),
+        Endpoint('core:api_complete_attachment_upload', 'client', 'post',
+                 upload_url('core:api_complete_attachment_upload', len(UPLOAD_CHUNK)), {}),
+    ]
+    check_coverage(endpoints)
+    return endpoints
@@ -0,0 +1,220 @@
+"""Benchmark runner: seed a throwaway database, time every endpoint, compare.
+
+    python -m benchmarks --projects 10000 --output baseline.json
+    python -m benchmarks --projects 10000 --output new.json --compare baseline.json
+
+Each endpoint is requested ``--iterations`` times through Django's test
+client after ``--warmup`` untimed requests. The JSON report holds p50/p95
+latency and the query count per endpoint. ``--compare`` exits non-zero when
+an endpoint runs more queries than the baseline, or when its p95 latency grew
+by more than ``--threshold`` (and by more than ``--min-delta-ms``). Any error
+logged by the event workers during the run also fails it, since those
+workers share the database with the timed requests.
+"""
+import argparse
+import gc
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+class ErrorLog(logging.Handler):
+    """Keeps the error records of the loggers it is attached to"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def endpoint_key(endpoint):
+    key = f'{endpoint.method.upper()} {endpoint.name} [{endpoint.role or "anonymous"}]'
+    if endpoint.method != 'get' or not endpoint.data:
+        return key
+    query = '&'.join(f'{key}={value}' for key, value in sorted(endpoint.data.items()))
+    return f'{key} ?{query}'
+
+
+def measure(endpoints, actors, iterations, warmup):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from core import events
+
+    clients = {None: Client()}
+    for role in ('client', 'freelancer'):
+        clients[role] = Client()
+        clients[role].force_login(actors[role])
+
+    results = {}
+    for endpoint in endpoints:
+        client = clients[endpoint.role]
+        method = getattr(client, endpoint.method)
+
+        def request():
+            # Callable paths set up a fresh target for every request
+            path = endpoint.path() if callable(endpoint.path) else endpoint.path
+            # Events published while setting it up would otherwise run alongside the request
+            events.wait_for_background()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = method(path, endpoint.data, headers=endpoint.headers)
+                elapsed = (time.perf_counter() - start) * 1000
+            # Let background event subscribers finish before the next request,
+            # so they neither skew its timing nor contend for the database
+            events.wait_for_background()
+            return response, elapsed, ctx
+
+        for _ in range(warmup):
+            request()
+
+        # Start each endpoint from a clean heap so earlier garbage doesn't land in its timings
+        gc.collect()
+        timings = []
+        for _ in range(iterations):
+            response, elapsed, ctx = request()
+            timings.append(elapsed)
+
+        results[endpoint_key(endpoint)] = {
+            'status': response.status_code,
+            'queries': len(ctx.captured_queries),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+        }
+    return results
+
+
+def compare(report, baseline, threshold, min_delta_ms):
+    """Return human-readable regressions of ``report`` against ``baseline``"""
+    regressions = []
+    for key, new in report['endpoints'].items():
+        old = baseline['endpoints'].get(key)
+        if old is None:
+            continue
+        if new['queries'] > old['queries']:
+            regressions.append(f'{key}: queries {old["queries"]} -> {new["queries"]}')
+        delta = new['p95_ms'] - old['p95_ms']
+        if delta > min_delta_ms and new['p95_ms'] > old['p95_ms'] * (1 + threshold):
+            regressions.append(f'{key}: p95 {old["p95_ms"]:.1f} ms -> {new["p95_ms"]:.1f} ms')
+    return regressions
+
+
+def print_report(report, stream):
+    width = max(len(key) for key in report['endpoints'])
+    stream.write(f'{"endpoint":<{width}}  status  queries    p50 ms    p95 ms\n')
+    for key, row in report['endpoints'].items():
+        stream.write(
+            f'{key:<{width}}  {row["status"]:>6}  {row["queries"]:>7}  {row["p50_ms"]:>8.2f}  {row["p95_ms"]:>8.2f}\n'
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.splitlines()[0])
+    parser.add_argument('--projects', type=int, default=10000, help='Projects to seed; other rows scale with it')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per endpoint')
+    parser.add_argument('--output', help='Write the JSON report to this path')
+    parser.add_argument('--compare', help='Baseline JSON report to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p95 growth')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Ignore p95 growth below this')
+    parser.add_argument('--db', help='Database file to seed, replaced unless --keepdb (default: a throwaway file for SQLite)')
+    parser.add_argument('--keepdb', action='store_true', help='Reuse an already seeded --db')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'freelancehub.settings')
+    import django
+    from django.conf import settings
+
+    # Keep every file the run writes out of the project: the database anything
+    # outside the test database would open (e.g. a late background event
+    # worker), attachments and partial uploads
+    scratch = tempfile.mkdtemp(prefix='benchmarks-')
+    database = settings.DATABASES['default']
+    if database['ENGINE'] == 'django.db.backends.sqlite3':
+        database['NAME'] = os.path.join(scratch, 'db.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(scratch, 'media')
+    settings.CHAT_UPLOAD_TEMP_DIR = os.path.join(scratch, 'uploads')
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from core import events
+    from core.models import Project
+    from core.seeding import seed_bulk
+    from .endpoints import pick_actors, build_endpoints
+
+    event_errors = ErrorLog()
+    logging.getLogger('core.events').addHandler(event_errors)
+    setup_test_environment()
+    # A file rather than shared-cache memory: event workers writing while a request runs
+    # then wait for SQLite's lock instead of failing with "database table is locked"
+    if args.db or connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = args.db or os.path.join(scratch, 'test.sqlite3')
+    # Without --keepdb an existing --db is replaced rather than prompting for confirmation
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=not args.keepdb, keepdb=args.keepdb)
+    try:
+        if not Project.objects.exists():
+            started = time.perf_counter()
+            seed_bulk(args.projects, seed=args.seed)
+            sys.stderr.write(f'Seeded {args.projects} projects in {time.perf_counter() - started:.1f}s\n')
+        # Setup publishes events too; settle them before anything is timed
+        events.wait_for_background()
+        actors = pick_actors()
+        events.wait_for_background()
+        report = {
+            'meta': {
+                'projects': Project.objects.count(),
+                'seed': args.seed,
+                'iterations': args.iterations,
+                'database': connection.vendor,
+                'search_backend': settings.PROJECT_SEARCH_BACKEND,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'created_at': datetime.now(timezone.utc).isoformat(),
+            },
+            'endpoints': measure(build_endpoints(actors), actors, args.iterations, args.warmup),
+        }
+    finally:
+        events.wait_for_background()
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=args.keepdb)
+        teardown_test_environment()
+        logging.getLogger('core.events').removeHandler(event_errors)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print_report(report, sys.stdout)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if event_errors.records:
+        for record in event_errors.records:
+            sys.stdout.write(f'EVENT ERROR {record.getMessage()}\n')
+        return 1
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        for line in regressions:
+            sys.stdout.write(f'REGRESSION {line}\n')
+        if regressions:
+            return 1
+        sys.stdout.write(f'No regressions against {args.compare}\n')
+    return 0
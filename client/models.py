@@ -4,8 +4,16 @@ from users.models import User
 class ClientProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
     profile_pic = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_pic_digest = models.CharField(max_length=64, blank=True, editable=False,
+                                          help_text="SHA-256 of profile_pic once its thumbnails exist")
     company_name = models.CharField(max_length=255, blank=True)
     bio = models.TextField(blank=True)
 
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return self.user.username
+
+    def save(self, *args, **kwargs):
+        # A new picture has no thumbnails until core.thumbnails renders them
+        if not self.profile_pic or not self.profile_pic._committed:
+            self.profile_pic_digest = ''
+        super().save(*args, **kwargs)
\ No newline at end of file
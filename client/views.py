@@ -5,6 +5,8 @@ from .forms import ClientRegistrationForm, ClientProfileForm
 from django.contrib.auth.forms import AuthenticationForm
 from users.models import User
 from core.models import Project, Proposal
+from core.stats import get_user_stats
+from core.finance import total_amount
 
 def client_register(request):
     if request.method == 'POST':
@@ -57,9 +59,8 @@ def client_dashboard(request):
         profile = None
     
     # Get dashboard stats
+    stats = get_user_stats(request.user)
     active_projects = Project.objects.filter(client=request.user, status='in_progress')
-    completed_projects = Project.objects.filter(client=request.user, status='completed')
-    pending_proposals = Proposal.objects.filter(project__client=request.user, status='pending')
     
     # Recent proposals (latest 5)
     recent_proposals = Proposal.objects.filter(project__client=request.user, status='pending').order_by('-created_at')[:5]
@@ -68,23 +69,12 @@ def client_dashboard(request):
     active_projects_display = active_projects.order_by('-created_at')[:3]
     
     # Calculate total spent (from completed projects and in-progress projects with accepted proposals)
-    total_spent = 0
-    for project in Project.objects.filter(client=request.user):
-        if project.status == 'completed':
-            accepted_proposal = project.proposals.filter(status='accepted').first()
-            if accepted_proposal:
-                total_spent += accepted_proposal.bid_amount
-        elif project.status == 'in_progress':
-            accepted_proposal = project.proposals.filter(status='accepted').first()
-            if accepted_proposal:
-                total_spent += accepted_proposal.bid_amount
+    total_spent = total_amount(request.user)
     
     context = {
         'profile': profile,
-        'active_projects_count': active_projects.count(),
-        'completed_projects_count': completed_projects.count(),
-        'pending_proposals_count': pending_proposals.count(),
-        'hired_freelancers_count': Project.objects.filter(client=request.user, status='in_progress').count(),
+        **stats,
+        'hired_freelancers_count': stats['active_projects_count'],
         'total_spent': total_spent,
         'recent_proposals': recent_proposals,
         'active_projects': active_projects_display,
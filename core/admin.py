@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Project, Proposal, Message, Review
+from .models import Project, Proposal, Message, Review, UserStats
 
 
 @admin.register(Project)
@@ -36,3 +36,10 @@ class ReviewAdmin(admin.ModelAdmin):
     list_filter = ['rating', 'created_at']
     search_fields = ['client__username', 'freelancer__username', 'project__title', 'feedback']
     readonly_fields = ['created_at']
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'active_projects', 'completed_projects', 'pending_proposals', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['updated_at']
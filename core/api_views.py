@@ -1,56 +1,83 @@
-from django.http import JsonResponse
+import asyncio
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.core.serializers.json import DjangoJSONEncoder
-from django.views.decorators.http import require_http_methods
-from .models import Project, Message
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_http_methods, conditional_page
+from users.models import User
+from .models import Project, Message, AttachmentUpload
+from .finance import PERIOD_FUNCTIONS, total_amount, period_breakdown
+from .inbox import mark_conversation_read
+from .instrumentation import QueryReportStore
+from .history import get_before_id, get_history_limit, history_window
+from .participants import can_message, acan_message, get_participants
+from .realtime import get_broker, project_channel, long_poll_slots
+from .serializers import (
+    message_values, message_row, serialize_message, get_timestamp_format, encode_response,
+)
+from .thumbnails import avatar_url, user_profile
+from .uploads import UploadError, upload_status, start_upload, append_chunk, complete_upload
 from django.utils import timezone
 
+
+# ETag from the response body (304 when unchanged), then gzip for clients that accept it
+@gzip_page
+@conditional_page
 @login_required
 def get_messages(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
-    
     # Check if user has access to this project's messages
-    if not (project.client == request.user or project.proposals.filter(freelancer=request.user, status='accepted').exists()):
+    if not can_message(project_id, request.user):
         return JsonResponse({'error': 'Permission denied'}, status=403)
     
-    messages = project.messages.all()
-    messages_data = [{
-        'id': msg.id,
-        'content': msg.content,
-        'sender_id': msg.sender.id,
-        'is_sent': msg.sender == request.user,
-        'created_at': msg.created_at.strftime('%I:%M %p'),
-        'attachment': msg.attachment.url if msg.attachment else None
-    } for msg in messages]
+    timestamps = get_timestamp_format(request)
+    if timestamps is None:
+        return JsonResponse({'error': 'timestamps must be display, iso or epoch'}, status=400)
+    try:
+        before_id = get_before_id(request)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid before_id'}, status=400)
+    
+    # Newest messages first; older history is reached with ?before_id=
+    messages = message_values(Message.objects.filter(project_id=project_id))
+    window = history_window(messages, before_id, get_history_limit(request))
+    if window and before_id is None:
+        # Opening the chat at its newest messages marks the conversation as read
+        mark_conversation_read(request.user, project_id, window.items[-1]['id'])
+    messages_data = [serialize_message(row, request.user.id, timestamps) for row in window]
     
     # Get the other user's info (if client, show freelancer and vice versa)
-    if request.user == project.client:
-        other_user = project.proposals.filter(status='accepted').first().freelancer
+    participants = get_participants(project_id)
+    if request.user.id == participants.client_id:
+        other_user_id = participants.freelancer_id
     else:
-        other_user = project.client
-        
+        other_user_id = participants.client_id
+    other_user = User.objects.select_related('freelancerprofile', 'clientprofile').filter(pk=other_user_id).first()
+    
     other_user_data = {
         'name': other_user.get_full_name() or other_user.username,
-        'avatar': other_user.profile_pic.url if hasattr(other_user, 'profile_pic') and other_user.profile_pic else f'https://ui-avatars.com/api/?name={other_user.username}'
-    }
+        'avatar': avatar_url(user_profile(other_user)) or f'https://ui-avatars.com/api/?name={other_user.username}'
+    } if other_user else None
     
-    return JsonResponse({
+    return encode_response(request, {
         'messages': messages_data,
-        'project': {
-            'id': project.id,
-            'title': project.title
-        },
+        'history': window.as_dict(),
+        'project': Project.objects.filter(id=project_id).values('id', 'title').first(),
         'other_user': other_user_data
     })
 
+
 @login_required
 @require_http_methods(['POST'])
 def send_message(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
-    
     # Check if user has access to this project's messages
-    if not (project.client == request.user or project.proposals.filter(freelancer=request.user, status='accepted').exists()):
+    if not can_message(project_id, request.user):
         return JsonResponse({'error': 'Permission denied'}, status=403)
     
     content = request.POST.get('content', '').strip()
@@ -60,38 +87,254 @@ def send_message(request, project_id):
         return JsonResponse({'error': 'Message cannot be empty'}, status=400)
     
     message = Message.objects.create(
-        project=project,
+        project_id=project_id,
         sender=request.user,
         content=content,
         attachment=attachment
     )
     
-    return JsonResponse({
-        'id': message.id,
-        'content': message.content,
-        'sender_id': message.sender.id,
-        'is_sent': True,
-        'created_at': message.created_at.strftime('%I:%M %p'),
-        'attachment': message.attachment.url if message.attachment else None
-    })
+    return JsonResponse(serialize_message(message_row(message), request.user.id))
+
+def _upload_error(error):
+    data = {'error': str(error)}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    return JsonResponse(data, status=error.status)
+
+
+@login_required
+@require_http_methods(['POST'])
+def start_attachment_upload(request, project_id):
+    """Begin a chunked attachment upload (see core/uploads.py)"""
+    if not can_message(project_id, request.user):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    try:
+        upload = start_upload(
+            project_id, request.user,
+            request.POST.get('filename'), request.POST.get('size'), request.POST.get('sha256', ''),
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PUT'])
+def attachment_upload(request, upload_id):
+    """GET reports the offset to resume from; PUT appends the request body at ``Upload-Offset``"""
+    upload = get_object_or_404(AttachmentUpload, pk=upload_id, uploader=request.user)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required'}, status=400)
+        try:
+            # Read from the request stream, never request.body, so the chunk isn't buffered
+            upload = append_chunk(upload, offset, request, length, request.headers.get('X-Chunk-SHA256'))
+        except UploadError as e:
+            return _upload_error(e)
+    return JsonResponse(upload_status(upload))
+
+
+@login_required
+@require_http_methods(['POST'])
+def complete_attachment_upload(request, upload_id):
+    upload = get_object_or_404(AttachmentUpload, pk=upload_id, uploader=request.user)
+    # Access may have been revoked since the upload started
+    if not can_message(upload.project_id, request.user):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    try:
+        message = complete_upload(upload, request.POST.get('content', '').strip())
+    except UploadError as e:
+        return _upload_error(e)
+    return JsonResponse(serialize_message(message_row(message), request.user.id))
+
+
+def _new_messages_data(project_id, user, last_id, timestamps='display'):
+    messages = Message.objects.filter(project_id=project_id, id__gt=last_id) if last_id is not None else Message.objects.none()
+    return [serialize_message(row, user.id, timestamps) for row in message_values(messages.order_by('id'))]
+
+
+def _new_messages_response(project_id, user, last_id, timestamps='display'):
+    """New messages for a poll; delivering them to an open chat marks them read"""
+    messages_data = _new_messages_data(project_id, user, last_id, timestamps)
+    if messages_data:
+        mark_conversation_read(user, project_id, messages_data[-1]['id'])
+    return messages_data
+
+
+async def _wait_for_messages(project_id, user, last_id, wait, timestamps='display'):
+    """
+    Park until a message newer than ``last_id`` is published or ``wait``
+    seconds pass, then return everything that arrived in one batch.
+    """
+    if not long_poll_slots.acquire():
+        # Too many parked requests on this worker: answer like a normal poll
+        return await sync_to_async(_new_messages_response)(project_id, user, last_id, timestamps)
+    
+    subscription = get_broker().subscribe(project_channel(project_id))
+    try:
+        # Subscribe first so a message sent during this check is not missed
+        await subscription.ready()
+        messages_data = await sync_to_async(_new_messages_response)(project_id, user, last_id, timestamps)
+        if messages_data:
+            return messages_data
+        
+        if await subscription.get(timeout=wait) is None:
+            return []
+        
+        # Give messages sent in quick succession a moment to join the batch
+        await asyncio.sleep(getattr(settings, 'LONG_POLL_BATCH_WINDOW', 0.05))
+        return await sync_to_async(_new_messages_response)(project_id, user, last_id, timestamps)
+    finally:
+        subscription.close()
+        long_poll_slots.release()
+
+
+@login_required
+async def get_new_messages(request, project_id):
+    """
+    Messages newer than ``last_id``. With ``?wait=<seconds>`` the request is
+    held open (long-poll) until something arrives or the wait expires.
+    """
+    user = await request.auser()
+    
+    # Check if user has access to this project's messages
+    if not await acan_message(project_id, user):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    try:
+        last_id = int(request.GET['last_id']) if request.GET.get('last_id') else None
+        wait = float(request.GET.get('wait', 0))
+        if not math.isfinite(wait):
+            raise ValueError(wait)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid last_id or wait'}, status=400)
+    wait = min(max(wait, 0), getattr(settings, 'LONG_POLL_MAX_WAIT', 30))
+    timestamps = get_timestamp_format(request)
+    if timestamps is None:
+        return JsonResponse({'error': 'timestamps must be display, iso or epoch'}, status=400)
+    
+    if wait and last_id is not None:
+        messages_data = await _wait_for_messages(project_id, user, last_id, wait, timestamps)
+    else:
+        messages_data = await sync_to_async(_new_messages_response)(project_id, user, last_id, timestamps)
+    
+    return encode_response(request, {'messages': messages_data})
+
+
+def _sse_event(payload, user_id):
+    data = dict(payload, is_sent=payload['sender_id'] == user_id)
+    return f"id: {payload['id']}\ndata: {json.dumps(data)}\n\n"
+
+
+# A named event rather than a comment, so the client can tell the stream is live
+SSE_HEARTBEAT = 'event: heartbeat\ndata: {}\n\n'
+
+
+async def _message_event_stream(project_id, user, last_id):
+    """
+    Yield SSE frames: missed messages first, then live ones from the broker.
+    Like a poll, delivering messages to the open chat marks them read.
+    """
+    heartbeat = getattr(settings, 'MESSAGE_STREAM_HEARTBEAT', 15)
+    lifetime = getattr(settings, 'MESSAGE_STREAM_TIMEOUT', 300)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lifetime
+    # Subscribed on the loop that consumes the stream, and live before the
+    # catch-up query so nothing sent in between is lost
+    subscription = get_broker().subscribe(project_channel(project_id))
+    try:
+        await subscription.ready()
+        yield 'retry: 3000\n\n' + SSE_HEARTBEAT
+        
+        # Catch up on anything sent before the subscription was live
+        if last_id is not None:
+            missed = await sync_to_async(list)(
+                message_values(Message.objects.filter(project_id=project_id, id__gt=last_id).order_by('id'))
+            )
+            for row in missed:
+                payload = serialize_message(row)
+                yield _sse_event(payload, user.id)
+                last_id = payload['id']
+            if missed:
+                await sync_to_async(mark_conversation_read)(user, project_id, last_id)
+        
+        while (remaining := deadline - loop.time()) > 0:
+            payload = await subscription.get(timeout=min(heartbeat, remaining))
+            if payload is None:
+                yield SSE_HEARTBEAT
+            elif last_id is None or payload['id'] > last_id:
+                yield _sse_event(payload, user.id)
+                last_id = payload['id']
+                await sync_to_async(mark_conversation_read)(user, project_id, last_id)
+    finally:
+        subscription.close()
+
 
 @login_required
-def get_new_messages(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
-    last_id = request.GET.get('last_id')
+async def stream_messages(request, project_id):
+    """
+    Server-sent events stream of new messages for a project. The browser's
+    EventSource reconnects on its own and resumes from Last-Event-ID.
+    
+    Only served under ASGI: a WSGI server would buffer the whole stream, so
+    there it answers 501 and the chat falls back to long-polling
+    ``get_new_messages``.
+    """
+    user = await request.auser()
     
     # Check if user has access to this project's messages
-    if not (project.client == request.user or project.proposals.filter(freelancer=request.user, status='accepted').exists()):
+    if not await acan_message(project_id, user):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Streaming requires an ASGI server'}, status=501)
+    
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    
+    response = StreamingHttpResponse(
+        _message_event_stream(project_id, user, last_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def financial_summary(request):
+    """Spend (clients) or earnings (freelancers) with a per-period series for charts"""
+    period = request.GET.get('period', 'month')
+    if period not in PERIOD_FUNCTIONS:
+        return JsonResponse({'error': 'period must be "month" or "year"'}, status=400)
+    
+    return JsonResponse({
+        'kind': 'spent' if request.user.user_type == 'client' else 'earned',
+        'total': total_amount(request.user),
+        'period': period,
+        'series': period_breakdown(request.user, period),
+    })
+
+
+@login_required
+def query_budget_report(request):
+    """Per-view query aggregates recorded by QueryBudgetMiddleware (staff only)"""
+    if not request.user.is_staff:
         return JsonResponse({'error': 'Permission denied'}, status=403)
     
-    messages = project.messages.filter(id__gt=last_id) if last_id else project.messages.none()
-    messages_data = [{
-        'id': msg.id,
-        'content': msg.content,
-        'sender_id': msg.sender.id,
-        'is_sent': msg.sender == request.user,
-        'created_at': msg.created_at.strftime('%I:%M %p'),
-        'attachment': msg.attachment.url if msg.attachment else None
-    } for msg in messages]
-    
-    return JsonResponse({'messages': messages_data})
\ No newline at end of file
+    order_by = request.GET.get('order_by', 'queries')
+    if order_by not in ('queries', 'db_time', 'duplicates', 'n_plus_one'):
+        return JsonResponse({'error': 'order_by must be queries, db_time, duplicates or n_plus_one'}, status=400)
+    
+    return JsonResponse({
+        'enabled': getattr(settings, 'QUERY_INSTRUMENTATION_ENABLED', False),
+        'budget': getattr(settings, 'QUERY_INSTRUMENTATION_BUDGET', 20),
+        'views': QueryReportStore().report(order_by),
+    })
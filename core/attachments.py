@@ -0,0 +1,146 @@
+"""Serving chat attachments.
+
+Downloads go through ``core.views.message_attachment`` so the per-project
+access check runs on every request, and files are never read whole:
+
+* full responses stream the file with ``FileResponse``
+* a single ``Range: bytes=`` request gets a 206 streamed from the offset
+* content-addressed files (see ``core.storage``) get their SHA-256 as a
+  strong ETag, so ``If-None-Match`` / ``If-Range`` work across servers
+* with ``settings.CHAT_ATTACHMENT_SENDFILE`` set to ``'x-accel-redirect'``
+  (nginx) or ``'x-sendfile'`` (Apache, lighttpd) Django only sends headers
+  and the web server streams the file and handles ranges itself
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date
+
+from .storage import digest_from_name
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Served inline; anything else is forced to download so uploaded HTML/SVG
+# can't run in the site's origin
+INLINE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf'}
+
+
+def attachment_etag(storage, name):
+    digest = digest_from_name(name)
+    if digest:
+        return f'"{digest}"'
+    # Legacy files under chat_files/: size and mtime are the best we have
+    return f'W/"{storage.size(name)}-{int(storage.get_modified_time(name).timestamp())}"'
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` for a single satisfiable byte range, None to send the
+    whole file, or ``'unsatisfiable'``. Multi-range requests are answered
+    with the whole file, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return 'unsatisfiable'
+    else:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        start, end = max(size - length, 0), size - 1
+    return start, end
+
+
+def _read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def _sendfile_response(storage, name):
+    backend = getattr(settings, 'CHAT_ATTACHMENT_SENDFILE', None)
+    if backend == 'x-accel-redirect':
+        response = HttpResponse()
+        prefix = getattr(settings, 'CHAT_ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(name)
+    elif backend == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = storage.path(name)
+    else:
+        return None
+    # The web server fills in the body and length
+    del response['Content-Type']
+    return response
+
+
+def serve_attachment(request, storage, name, filename):
+    """Stream ``name`` from ``storage`` honouring conditional and Range headers"""
+    etag = attachment_etag(storage, name)
+    last_modified = storage.get_modified_time(name).timestamp()
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = _sendfile_response(storage, name)
+        if response is None:
+            response = _stream(request, storage, name, etag)
+        response['Content-Type'] = content_type
+        response['Content-Disposition'] = content_disposition_header(
+            as_attachment=content_type not in INLINE_TYPES, filename=filename
+        )
+        response['X-Content-Type-Options'] = 'nosniff'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if digest_from_name(name):
+        # Content-addressed files never change; access control keeps it private
+        patch_cache_control(response, private=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _stream(request, storage, name, etag):
+    size = storage.size(name)
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    # If-Range needs a strong match, otherwise the client's partial copy is stale
+    if range_header and (if_range is None or (if_range == etag and not etag.startswith('W/'))):
+        byte_range = parse_range(range_header, size)
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(storage.open(name, 'rb'))
+        response.block_size = STREAM_CHUNK_SIZE
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(_read_range(storage.open(name, 'rb'), start, length), status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    return response
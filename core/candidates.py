@@ -0,0 +1,184 @@
+"""Freelancer suggestions for a client's project.
+
+``suggested_freelancers(project)`` ranks every freelancer for a project with
+the matching model that ``rebuild_recommendations`` saves (see
+``core.matching``)::
+
+    score = (1 - w) * match + w * reputation
+
+``match`` is the model's skill, term and budget-fit score, so skills, past
+work and bid history all count. ``reputation`` is the freelancer's average
+rating on a 0-1 scale, pulled towards the site-wide average by
+``CANDIDATE_RATING_PRIOR`` imaginary reviews so one 5-star review doesn't
+outrank a long record. ``w`` is ``CANDIDATE_REPUTATION_WEIGHT``. Only
+freelancers who share a skill or term with the project are ranked, and
+those who already bid are left out.
+
+The model is only rebuilt periodically. Profile edits, reviews and bids bump
+``FreelancerProfile.updated_at`` (see ``freelancers_changed``). Before each
+ranking, every process runs one indexed query for profiles changed since it
+last looked. It describes them against the model's vocabulary and scores
+them from a small overlay instead of their saved rows. Freelancers who
+joined after the rebuild are picked up the same way. Once the overlay holds
+more than ``CANDIDATE_OVERLAY_MAX_SIZE`` freelancers it is folded into the
+process's copy of the model, so each sync stays cheap however long ago the
+rebuild was.
+
+Without a saved model (or NumPy) the suggestions fall back to freelancers
+with one of the project's skills, best rated first.
+"""
+import math
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from freelancer.models import FreelancerProfile
+
+from .matching import freelancer_features, get_matching_model, get_weights, np
+
+
+# Rows committed just after a sync can carry an earlier timestamp; look back this far
+SYNC_OVERLAP = timedelta(minutes=1)
+DEFAULT_PRIOR_RATING = 4.0
+
+
+def get_top_k():
+    return getattr(settings, 'CANDIDATE_TOP_K', 6)
+
+
+def get_reputation_weight():
+    return getattr(settings, 'CANDIDATE_REPUTATION_WEIGHT', 0.25)
+
+
+def get_rating_prior():
+    return getattr(settings, 'CANDIDATE_RATING_PRIOR', 5)
+
+
+def get_overlay_max_size():
+    return getattr(settings, 'CANDIDATE_OVERLAY_MAX_SIZE', 1000)
+
+
+def freelancers_changed(freelancer_ids):
+    """Have candidate indexes re-read these freelancers on their next sync"""
+    FreelancerProfile.objects.filter(pk__in=freelancer_ids).update(updated_at=timezone.now())
+
+
+class CandidateIndex:
+    """A saved matching model plus an overlay of freelancers changed since it was built"""
+
+    def __init__(self, model):
+        # The saved model, and the one ranked against once overlays were folded into it
+        self.source = self.model = model
+        self.overlay = None
+        self._seen = {}  # freelancer id -> (updated_at, features) of the overlay rows
+        self._replaced = np.zeros(len(model.freelancer_ids), dtype=bool)
+        self._synced_to = datetime.fromtimestamp(model.built_at, tz=dt_timezone.utc)
+        self._lock = threading.Lock()
+        reviews = float(model.review_count.sum())
+        self.prior_rating = float(model.rating_sum.sum()) / reviews if reviews else DEFAULT_PRIOR_RATING
+
+    def sync(self):
+        """Re-describe freelancers whose profile changed since the last sync; returns how many"""
+        with self._lock:
+            started = timezone.now()
+            recent = FreelancerProfile.objects.filter(updated_at__gte=self._synced_to - SYNC_OVERLAP)
+            changed = {
+                pk: updated_at for pk, updated_at in recent.values_list('pk', 'updated_at')
+                if pk not in self._seen or self._seen[pk][0] != updated_at
+            }
+            self._synced_to = started
+            if not changed:
+                return 0
+
+            ids = list(changed)
+            features = freelancer_features(self.model, ids, subset=True)
+            for i, pk in enumerate(ids):
+                self._seen[pk] = (changed[pk], tuple(column[i] for column in features))
+                if pk in self.model.freelancer_index:
+                    self._replaced[self.model.freelancer_index[pk]] = True
+            columns = tuple(zip(*(row for _, row in self._seen.values())))
+            self.overlay = self.model.with_freelancers(list(self._seen), columns)
+            if len(self._seen) > get_overlay_max_size():
+                self.model = self.model.replace_freelancers(self._replaced, self.overlay)
+                self.overlay = None
+                self._seen = {}
+                self._replaced = np.zeros(len(self.model.freelancer_ids), dtype=bool)
+            return len(changed)
+
+    def score(self, model, terms, skills, log_budget):
+        relevance = model.relevance(terms, skills)
+        fit = model.budget_fit(slice(None), np.array([log_budget], dtype=np.float32))[:, 0]
+        prior = get_rating_prior()
+        reputation = (model.rating_sum + prior * self.prior_rating) / (model.review_count + prior) / 5
+        weight = get_reputation_weight()
+        scores = (1 - weight) * (relevance + get_weights()['budget'] * fit) + weight * reputation
+        scores[relevance <= 0] = -np.inf
+        return scores
+
+    def rank(self, terms, skills, log_budget, limit, exclude=()):
+        """Ids and scores of the best ``limit`` freelancers for a vectorized project, best first"""
+        with self._lock:
+            model, overlay, replaced = self.model, self.overlay, self._replaced.copy()
+        scores = self.score(model, terms, skills, log_budget)
+        scores[replaced] = -np.inf
+        ids = model.freelancer_ids
+        if overlay is not None:
+            ids = np.concatenate([ids, overlay.freelancer_ids])
+            scores = np.concatenate([scores, self.score(overlay, terms, skills, log_budget)])
+        if exclude:
+            scores[np.isin(ids, list(exclude))] = -np.inf
+
+        top = np.flatnonzero(np.isfinite(scores))
+        if len(top) > limit:
+            top = top[np.argpartition(-scores[top], limit - 1)[:limit]]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return ids[top], scores[top]
+
+
+_index = {'index': None}
+_index_lock = threading.Lock()
+
+
+def get_candidate_index():
+    """The index over the current saved model, or None without one"""
+    model = get_matching_model()
+    if model is None:
+        return None
+    with _index_lock:
+        if _index['index'] is None or _index['index'].source is not model:
+            _index['index'] = CandidateIndex(model)
+        return _index['index']
+
+
+def _skilled_freelancers(skill_ids, bidders, limit):
+    """Freelancers listing one of the project's skills, best rated first"""
+    links = FreelancerProfile.skill_tags.through.objects.filter(skill_id__in=skill_ids)
+    return list(
+        FreelancerProfile.objects.filter(pk__in=links.values('freelancerprofile_id'))
+        .exclude(pk__in=bidders).select_related('user')
+        .order_by('-avg_rating', '-review_count', 'pk')[:limit]
+    )
+
+
+def suggested_freelancers(project, limit=None):
+    """Profiles of the freelancers best suited to ``project``, best first, with a ``match_score``"""
+    limit = limit or get_top_k()
+    skill_ids = list(project.skills.values_list('pk', flat=True))
+    bidders = set(project.proposals.values_list('freelancer_id', flat=True))
+    index = get_candidate_index()
+    if index is None:
+        return _skilled_freelancers(skill_ids, bidders, limit)
+
+    index.sync()
+    terms, skills = index.model.vectorize([(f'{project.title} {project.description}', skill_ids)])
+    ids, scores = index.rank(terms, skills, math.log(max(float(project.budget), 1)), limit, exclude=bidders)
+    profiles = FreelancerProfile.objects.select_related('user').in_bulk(ids.tolist())
+    ranked = []
+    for pk, score in zip(ids.tolist(), scores.tolist()):
+        # Deleted since the model was built
+        if pk in profiles:
+            profiles[pk].match_score = score
+            ranked.append(profiles[pk])
+    return ranked
@@ -1,35 +1,64 @@
-from core.models import Project, Proposal, Review
+from django.utils.functional import cached_property
+from core.stats import get_user_stats
+
+
+class FreelancerSidebar:
+    """
+    Sidebar values resolved on first use. Templates call callables when they
+    look a variable up, so pages that never render the sidebar never touch
+    the user, the profile or the counters.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def is_freelancer(self):
+        user = self.request.user
+        return user.is_authenticated and user.user_type == 'freelancer'
+
+    @cached_property
+    def freelancer_profile(self):
+        if not self.is_freelancer:
+            return None
+        try:
+            return self.request.user.freelancerprofile
+        except:
+            return None
+
+    @cached_property
+    def stats(self):
+        if not self.is_freelancer:
+            return {}
+        return get_user_stats(self.request.user)
+
+    def profile(self):
+        return self.freelancer_profile
+
+    def avg_rating(self):
+        return self.freelancer_profile.avg_rating if self.freelancer_profile else 0
+
+    def review_count(self):
+        return self.freelancer_profile.review_count if self.freelancer_profile else 0
+
+    def active_projects_count(self):
+        return self.stats.get('active_projects_count', 0)
+
+    def pending_proposals_count(self):
+        return self.stats.get('pending_proposals_count', 0)
+
+    def completed_projects_count(self):
+        return self.stats.get('completed_projects_count', 0)
+
 
 def freelancer_sidebar(request):
     """Context processor to add freelancer sidebar data to all templates"""
-    context = {
-        'active_projects_count': 0,
-        'pending_proposals_count': 0,
-        'completed_projects_count': 0,
-        'avg_rating': 0,
-        'review_count': 0,
+    sidebar = FreelancerSidebar(request)
+    return {
+        'profile': sidebar.profile,
+        'active_projects_count': sidebar.active_projects_count,
+        'pending_proposals_count': sidebar.pending_proposals_count,
+        'completed_projects_count': sidebar.completed_projects_count,
+        'avg_rating': sidebar.avg_rating,
+        'review_count': sidebar.review_count,
     }
-    
-    if request.user.is_authenticated and request.user.user_type == 'freelancer':
-        try:
-            profile = request.user.freelancerprofile
-            context.update({
-                'profile': profile,
-                'avg_rating': profile.avg_rating,
-                'review_count': profile.review_count,
-            })
-        except:
-            profile = None
-        
-        # Get dashboard stats
-        active_jobs = Proposal.objects.filter(freelancer=request.user, status='accepted')
-        pending_proposals = Proposal.objects.filter(freelancer=request.user, status='pending')
-        completed_jobs = Proposal.objects.filter(freelancer=request.user, project__status='completed', status='accepted')
-        
-        context.update({
-            'active_projects_count': active_jobs.count(),
-            'pending_proposals_count': pending_proposals.count(),
-            'completed_projects_count': completed_jobs.count(),
-        })
-    
-    return context
\ No newline at end of file
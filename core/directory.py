@@ -0,0 +1,63 @@
+"""Freelancer directory used by ``browse_freelancers``.
+
+Ratings come from the denormalized ``FreelancerProfile.avg_rating`` /
+``review_count`` columns, so a whole page of freelancers is loaded with a
+single joined query instead of aggregating ``Review`` rows per freelancer.
+Skills are matched and listed through the normalized ``Skill`` table (see
+``core.skills``).
+"""
+from django.db.models import Q, F
+
+from users.models import User
+
+from .skills import freelancers_with_skill
+
+
+# Keyset orderings for each sort option; ``id`` breaks ties so cursors are unique
+DIRECTORY_SORT_ORDERINGS = {
+    'rating': ('-rating', '-reviews', '-id'),
+    'reviews': ('-reviews', '-rating', '-id'),
+    'newest': ('-date_joined', '-id'),
+}
+
+DEFAULT_DIRECTORY_SORT = 'rating'
+
+
+def search_freelancers(query=None, skill=None):
+    """
+    Return freelancers that have a profile, with the profile joined in and
+    ``rating`` / ``reviews`` annotated for sorting.
+    """
+    freelancers = User.objects.filter(
+        user_type='freelancer',
+        freelancerprofile__isnull=False,
+    ).select_related('freelancerprofile').prefetch_related('freelancerprofile__skill_tags').annotate(
+        rating=F('freelancerprofile__avg_rating'),
+        reviews=F('freelancerprofile__review_count'),
+    )
+
+    # Search by name, or skills starting with the query
+    if query:
+        freelancers = freelancers.filter(
+            Q(username__icontains=query) |
+            Q(first_name__icontains=query) |
+            Q(last_name__icontains=query) |
+            freelancers_with_skill(query, prefix=True)
+        )
+
+    # Whole skills only: "Java" does not match "JavaScript"
+    if skill:
+        freelancers = freelancers.filter(freelancers_with_skill(skill))
+
+    return freelancers
+
+
+def directory_entries(freelancers):
+    """Shape a page of freelancers the way the directory template expects"""
+    return [{
+        'freelancer': freelancer,
+        'profile': freelancer.freelancerprofile,
+        'skills': list(freelancer.freelancerprofile.skill_tags.all()),
+        'avg_rating': round(freelancer.rating, 1),
+        'review_count': freelancer.reviews,
+    } for freelancer in freelancers]
@@ -0,0 +1,327 @@
+"""Domain events.
+
+Every state change other parts of the app react to is published as a named
+event with a JSON-serializable payload of ids:
+
+=====================  ================================================
+``project.created``    project_id, client_id
+``proposal.submitted`` proposal_id, project_id, freelancer_id, client_id
+``proposal.accepted``  proposal_id, project_id, freelancer_id, client_id
+``proposal.rejected``  proposal_id, project_id, freelancer_id, client_id
+``message.sent``       message_id, project_id, sender_id, message
+``review.posted``      review_id, project_id, freelancer_id, client_id, rating
+=====================  ================================================
+
+Most are published from ``core.signals``; bulk updates that skip ``save()``
+publish their own (see ``core.hiring``). Subscribers register with the
+``subscriber`` decorator::
+
+    @subscriber('proposal.accepted')
+    def prime_cache(event): ...
+
+    @subscriber('proposal.submitted', 'proposal.accepted', batch=True)
+    def refresh(events): ...
+
+An event published inside a transaction is dispatched when that transaction
+commits and is dropped if it rolls back. One published outside a transaction
+is dispatched right away. Plain subscribers run inline, right after the
+commit. ``background=True`` subscribers run on a thread pool
+(``EVENT_WORKERS``). ``batch=True`` subscribers also run in the background,
+and receive every queued event they subscribe to in one call, up to
+``EVENT_BATCH_SIZE``. So a burst of changes costs one cache flush or one
+``UPDATE`` rather than one per event. Set ``EVENT_BACKGROUND = False`` to
+run everything inline. A failing subscriber is logged and does not stop the
+others.
+
+Durable delivery goes through an outbox, chosen with
+``EVENT_OUTBOX_BACKEND`` (``None`` turns it off). ``DatabaseOutbox`` writes
+each event to ``OutboxEvent`` in the publishing transaction, so it is saved
+exactly when the change is. Once every subscriber has handled the event, the
+row is marked delivered. The ``deliver_events`` command re-dispatches rows a
+crash or failing subscriber left undelivered, and prunes old delivered rows.
+Delivery is therefore at least once, so subscribers should be idempotent.
+Those that can't be, such as live pushes to connected clients, register with
+``redeliver=False`` and only ever see an event once. Rows that failed
+``EVENT_OUTBOX_MAX_ATTEMPTS`` times are no longer retried; they stay
+undelivered in the table for inspection.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxEvent
+
+
+logger = logging.getLogger(__name__)
+
+Subscriber = namedtuple('Subscriber', 'handler background batch redeliver')
+
+_subscribers = defaultdict(list)
+_queue = deque()
+_queue_lock = threading.Lock()
+_draining = False
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class Event:
+    def __init__(self, name, payload, occurred_at=None, id=None):
+        self.name = name
+        self.payload = payload
+        self.occurred_at = occurred_at or timezone.now()
+        # Set by the outbox once the event is recorded
+        self.id = id
+        self.failed = False
+
+    def __getitem__(self, key):
+        return self.payload[key]
+
+    def __repr__(self):
+        return f'<Event {self.name} {self.payload}>'
+
+
+def get_batch_size():
+    return getattr(settings, 'EVENT_BATCH_SIZE', 500)
+
+
+def get_max_attempts():
+    return getattr(settings, 'EVENT_OUTBOX_MAX_ATTEMPTS', 10)
+
+
+def subscriber(*names, background=False, batch=False, redeliver=True):
+    """Register the decorated function for events ``names``"""
+    def register(handler):
+        for name in names:
+            if not any(sub.handler is handler for sub in _subscribers[name]):
+                _subscribers[name].append(Subscriber(handler, background or batch, batch, redeliver))
+        return handler
+    return register
+
+
+def unsubscribe(handler):
+    for subscribers in _subscribers.values():
+        subscribers[:] = [sub for sub in subscribers if sub.handler is not handler]
+
+
+class BaseOutbox:
+    """Interface every outbox implements"""
+
+    def record(self, event):
+        """Persist ``event`` in the current transaction and set its ``id``"""
+        raise NotImplementedError
+
+    def delivered(self, event_ids):
+        raise NotImplementedError
+
+    def failed(self, event_ids):
+        raise NotImplementedError
+
+    def pending(self, before, after_id, limit, max_attempts):
+        """
+        Undelivered events published before ``before`` with ids above
+        ``after_id`` that failed fewer than ``max_attempts`` times, oldest first
+        """
+        raise NotImplementedError
+
+    def prune(self, before):
+        """Delete events delivered before ``before``; returns how many"""
+        raise NotImplementedError
+
+
+class DatabaseOutbox(BaseOutbox):
+    def record(self, event):
+        row = OutboxEvent.objects.create(name=event.name, payload=event.payload, created_at=event.occurred_at)
+        event.id = row.pk
+
+    def delivered(self, event_ids):
+        OutboxEvent.objects.filter(pk__in=event_ids).update(delivered_at=timezone.now())
+
+    def failed(self, event_ids):
+        OutboxEvent.objects.filter(pk__in=event_ids).update(attempts=F('attempts') + 1)
+
+    def pending(self, before, after_id, limit, max_attempts):
+        rows = OutboxEvent.objects.filter(
+            delivered_at__isnull=True, created_at__lt=before, pk__gt=after_id, attempts__lt=max_attempts,
+        ).order_by('pk')[:limit]
+        return [Event(row.name, row.payload, row.created_at, row.pk) for row in rows]
+
+    def prune(self, before):
+        deleted, _ = OutboxEvent.objects.filter(delivered_at__lt=before).delete()
+        return deleted
+
+
+@lru_cache(maxsize=None)
+def _load_outbox(path):
+    return import_string(path)()
+
+
+def get_outbox():
+    """The configured outbox, or None if events are not persisted"""
+    path = getattr(settings, 'EVENT_OUTBOX_BACKEND', None)
+    return _load_outbox(path) if path else None
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'EVENT_WORKERS', 2), thread_name_prefix='events',
+            )
+    return _executor
+
+
+def publish(name, **payload):
+    """Publish an event once the current transaction (if any) commits"""
+    event = Event(name, payload)
+    outbox = get_outbox()
+    if outbox is not None:
+        outbox.record(event)
+    transaction.on_commit(lambda: dispatch(event))
+    return event
+
+
+def _call(handler, argument, events):
+    try:
+        handler(argument)
+    except Exception:
+        logger.exception('Event subscriber %s failed for %s', getattr(handler, '__qualname__', handler), events)
+        for event in events:
+            event.failed = True
+
+
+def dispatch(event):
+    """Run the inline subscribers for a committed event and queue it for the rest"""
+    for sub in _subscribers[event.name]:
+        if not sub.background:
+            _call(sub.handler, event, [event])
+    needs_worker = any(sub.background for sub in _subscribers[event.name])
+    if not needs_worker and event.id is None:
+        return
+    # Still inside a transaction (e.g. a TestCase's): a worker thread couldn't see its rows
+    if not getattr(settings, 'EVENT_BACKGROUND', True) or connection.in_atomic_block:
+        _deliver_background([event])
+    else:
+        _enqueue(event)
+
+
+def _enqueue(event):
+    global _draining
+    with _queue_lock:
+        _queue.append(event)
+        if _draining:
+            return
+        _draining = True
+    get_executor().submit(_drain)
+
+
+def wait_for_background(timeout=None):
+    """Block until queued events have been handed to their subscribers; returns False on timeout"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        with _queue_lock:
+            if not _draining:
+                return True
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(0.001)
+
+
+def _drain():
+    global _draining
+    try:
+        while True:
+            with _queue_lock:
+                if not _queue:
+                    _draining = False
+                    return
+                batch = [_queue.popleft() for _ in range(min(len(_queue), get_batch_size()))]
+            _deliver_background(batch)
+    except BaseException:
+        with _queue_lock:
+            _draining = False
+        raise
+    finally:
+        # Worker threads open their own connections; don't leave them dangling
+        connections.close_all()
+
+
+def _deliver_background(events, redelivery=False):
+    """Run background subscribers over ``events`` and settle them in the outbox"""
+    by_subscriber = defaultdict(list)
+    for event in events:
+        for sub in _subscribers[event.name]:
+            if sub.background and (sub.redeliver or not redelivery):
+                by_subscriber[sub].append(event)
+    for sub, subscribed in by_subscriber.items():
+        if sub.batch:
+            _call(sub.handler, subscribed, subscribed)
+        else:
+            for event in subscribed:
+                _call(sub.handler, event, [event])
+    _settle(events)
+
+
+def _settle(events):
+    outbox = get_outbox()
+    if outbox is None:
+        return
+    delivered = [event.id for event in events if event.id is not None and not event.failed]
+    failed = [event.id for event in events if event.id is not None and event.failed]
+    try:
+        if delivered:
+            outbox.delivered(delivered)
+        if failed:
+            outbox.failed(failed)
+    except Exception:
+        # Left undelivered; deliver_events picks them up again
+        logger.exception('Could not update the event outbox')
+
+
+def redeliver(events):
+    """Run every subscriber that accepts redelivery over events read back from the outbox, inline"""
+    for event in events:
+        for sub in _subscribers[event.name]:
+            if not sub.background and sub.redeliver:
+                _call(sub.handler, event, [event])
+    _deliver_background(events, redelivery=True)
+
+
+def deliver_pending(min_age=timedelta(minutes=5), batch_size=None):
+    """Redeliver outbox events left undelivered for ``min_age``; returns how many were delivered"""
+    outbox = get_outbox()
+    if outbox is None:
+        return 0
+    batch_size = batch_size or get_batch_size()
+    max_attempts = get_max_attempts()
+    # Younger events may still be on their way through the normal path
+    before = timezone.now() - min_age
+    delivered = last_id = 0
+    while True:
+        # Keyset pagination, so events that fail again are not read twice
+        batch = outbox.pending(before, last_id, batch_size, max_attempts)
+        if not batch:
+            return delivered
+        last_id = batch[-1].id
+        redeliver(batch)
+        delivered += sum(not event.failed for event in batch)
+
+
+def prune_delivered(max_age=None):
+    """Delete delivered outbox events older than ``max_age``; returns how many"""
+    outbox = get_outbox()
+    if outbox is None:
+        return 0
+    if max_age is None:
+        max_age = timedelta(days=getattr(settings, 'EVENT_OUTBOX_RETENTION_DAYS', 7))
+    return outbox.prune(timezone.now() - max_age)
@@ -0,0 +1,53 @@
+"""Spend and earnings figures for dashboards and charts.
+
+Every figure is a single ``SUM`` over accepted proposals:
+
+* a client's spend is the accepted bid of each in-progress or completed
+  project, dated by when the proposal was accepted (``accepted_at``)
+* a freelancer's earnings are their accepted bids on completed projects,
+  dated by when the project was completed (``completed_at``)
+
+Both dates are set once, on the status change, so later edits to a project or
+proposal don't move money between periods.
+"""
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncYear
+
+from .models import Proposal
+
+
+PERIOD_FUNCTIONS = {
+    'month': (TruncMonth, '%Y-%m'),
+    'year': (TruncYear, '%Y'),
+}
+
+
+def _ledger(user):
+    """Accepted proposals that count towards the user's totals, with their date field"""
+    if user.user_type == 'client':
+        proposals = Proposal.objects.filter(
+            project__client=user, status='accepted', project__status__in=['in_progress', 'completed']
+        )
+        return proposals, 'accepted_at'
+    proposals = Proposal.objects.filter(
+        freelancer=user, status='accepted', project__status='completed'
+    )
+    return proposals, 'project__completed_at'
+
+
+def total_amount(user):
+    """Total spent (clients) or earned (freelancers)"""
+    proposals, _ = _ledger(user)
+    return proposals.aggregate(total=Sum('bid_amount'))['total'] or Decimal('0')
+
+
+def period_breakdown(user, period='month'):
+    """Totals grouped by calendar month or year, oldest first"""
+    trunc, label_format = PERIOD_FUNCTIONS[period]
+    proposals, date_field = _ledger(user)
+    rows = proposals.annotate(period=trunc(date_field)).order_by('period').values('period').annotate(
+        total=Sum('bid_amount')
+    )
+    return [{'period': row['period'].strftime(label_format), 'total': row['total']} for row in rows]
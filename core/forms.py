@@ -3,6 +3,13 @@ from .models import Project, Proposal, Message
 
 
 class ProjectForm(forms.ModelForm):
+    skills = forms.CharField(
+        required=False,
+        max_length=500,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'e.g., Python, Django, React'}),
+        help_text='Comma-separated list of required skills',
+    )
+    
     class Meta:
         model = Project
         fields = ['title', 'description', 'budget']
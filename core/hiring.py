@@ -0,0 +1,81 @@
+"""Accepting a proposal.
+
+``accept_proposal`` hires the freelancer behind a pending proposal in one
+transaction:
+
+1. lock the project row (``SELECT ... FOR UPDATE``) so acceptances for the
+   same project queue up instead of racing, and check it is still open
+2. ``UPDATE`` the proposal to accepted only ``WHERE status = 'pending'``; no
+   row updated means someone else already processed it
+3. reject the project's other pending proposals with one bulk ``UPDATE``
+4. move the project to in progress
+
+The bulk updates bypass ``Proposal.save()`` and its signals, so the
+dashboard counters are moved here, inside the same transaction, and the
+``proposal.accepted`` and ``proposal.rejected`` events are published here
+too (see ``core.events``). Subscribers such as the participant cache see
+them once the transaction commits.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import events
+from .models import Project, Proposal
+from .stats import proposal_changed, proposals_rejected
+
+
+class AcceptanceError(Exception):
+    pass
+
+
+class ProposalNotPending(AcceptanceError):
+    def __init__(self, message='This proposal has already been processed.'):
+        super().__init__(message)
+
+
+class ProjectNotOpen(AcceptanceError):
+    def __init__(self, message='This project has already been assigned to a freelancer.'):
+        super().__init__(message)
+
+
+def proposal_event(proposal_id, project, freelancer_id):
+    """Payload of the ``proposal.*`` events"""
+    return {
+        'proposal_id': proposal_id, 'project_id': project.pk,
+        'freelancer_id': freelancer_id, 'client_id': project.client_id,
+    }
+
+
+def accept_proposal(proposal):
+    """Accept ``proposal``, reject its competitors and start the project; returns the proposal"""
+    with transaction.atomic():
+        project = Project.objects.select_for_update().get(pk=proposal.project_id)
+        if project.status != 'open':
+            raise ProjectNotOpen()
+
+        now = timezone.now()
+        accepted = Proposal.objects.filter(pk=proposal.pk, status='pending').update(
+            status='accepted', updated_at=now, accepted_at=now,
+        )
+        if not accepted:
+            raise ProposalNotPending()
+        proposal.project = project
+        proposal.status = proposal._saved_status = 'accepted'
+        proposal.updated_at = proposal.accepted_at = now
+        proposal_changed(proposal, 'pending', 'accepted')
+
+        others = list(
+            Proposal.objects.filter(project=project, status='pending').exclude(pk=proposal.pk)
+            .values_list('pk', 'freelancer_id')
+        )
+        if others:
+            Proposal.objects.filter(pk__in=[pk for pk, _ in others]).update(status='rejected', updated_at=now)
+            proposals_rejected(project.client_id, [freelancer_id for _, freelancer_id in others])
+
+        project.status = 'in_progress'
+        project.save(update_fields=['status', 'updated_at'])
+
+        events.publish('proposal.accepted', **proposal_event(proposal.pk, project, proposal.freelancer_id))
+        for pk, freelancer_id in others:
+            events.publish('proposal.rejected', **proposal_event(pk, project, freelancer_id))
+    return proposal
@@ -0,0 +1,69 @@
+"""Windowed chat history.
+
+A conversation opens at its newest ``MESSAGE_HISTORY_LIMIT`` messages and
+older ones are fetched on demand with ``?before_id=<oldest id shown>``, so
+opening a chat costs the same however long the project has been running.
+Windows are read newest-first on the ``(project, id)`` index and returned in
+chronological order.
+"""
+from django.conf import settings
+
+
+def get_history_limit(request):
+    """Read ``limit`` from the query string, clamped to the configured max"""
+    default = getattr(settings, 'MESSAGE_HISTORY_LIMIT', 50)
+    max_limit = getattr(settings, 'MESSAGE_HISTORY_MAX_LIMIT', 200)
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, max_limit))
+
+
+def get_before_id(request):
+    """``before_id`` from the query string or None; raises ValueError if malformed"""
+    before_id = request.GET.get('before_id')
+    return int(before_id) if before_id else None
+
+
+class HistoryWindow:
+    """Up to ``limit`` messages older than ``before_id``, oldest first"""
+
+    def __init__(self, items, has_more, limit):
+        self.items = items
+        self.has_more = has_more
+        self.limit = limit
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def oldest_id(self):
+        if not self.items:
+            return None
+        first = self.items[0]
+        return first['id'] if isinstance(first, dict) else first.id
+
+    def as_dict(self):
+        return {
+            'has_more': self.has_more,
+            'before_id': self.oldest_id if self.has_more else None,
+            'limit': self.limit,
+        }
+
+
+def history_window(messages, before_id=None, limit=50):
+    """Take one window from a project's messages (instances or ``values()`` rows)"""
+    if before_id is not None:
+        messages = messages.filter(id__lt=before_id)
+    rows = list(messages.order_by('-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return HistoryWindow(rows, has_more, limit)
@@ -0,0 +1,70 @@
+"""Conversation inbox for ``all_messages``.
+
+The whole inbox is one query over accepted proposals: the last message of
+each conversation and the viewer's unread count are correlated subqueries,
+and the list is sorted by last activity in the database.
+"""
+from django.db.models import OuterRef, Subquery, Count, F, IntegerField
+from django.db.models.functions import Coalesce, Substr
+
+from .models import Proposal, Message, ConversationReadState
+
+
+SNIPPET_LENGTH = 100
+
+
+def conversation_inbox(user):
+    """
+    Return one dict per active conversation of ``user``, newest activity first,
+    with ``project``, ``accepted_proposal``, ``last_message`` and ``unread_count``.
+    """
+    if user.user_type == 'client':
+        proposals = Proposal.objects.filter(project__client=user)
+    else:
+        proposals = Proposal.objects.filter(freelancer=user)
+    
+    last_messages = Message.objects.filter(project=OuterRef('project_id')).order_by('-id')
+    last_read = ConversationReadState.objects.filter(
+        user=user, project=OuterRef('project_id')
+    ).values('last_read_message_id')[:1]
+    unread = Message.objects.filter(
+        project=OuterRef('project_id'), id__gt=OuterRef('last_read_id')
+    ).exclude(sender=user).order_by().values('project').annotate(total=Count('id')).values('total')
+    
+    proposals = proposals.filter(
+        status='accepted', project__status='in_progress'
+    ).select_related('project', 'project__client', 'freelancer').annotate(
+        last_message_id=Subquery(last_messages.values('id')[:1]),
+        last_message_at=Subquery(last_messages.values('created_at')[:1]),
+        last_message_snippet=Subquery(last_messages.annotate(
+            snippet=Substr('content', 1, SNIPPET_LENGTH)
+        ).values('snippet')[:1]),
+        last_read_id=Coalesce(Subquery(last_read), 0),
+    ).annotate(
+        unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+        last_activity=Coalesce('last_message_at', 'project__created_at'),
+    ).order_by(F('last_activity').desc(), '-id')
+    
+    return [{
+        'project': proposal.project,
+        'accepted_proposal': proposal,
+        'last_message': {
+            'id': proposal.last_message_id,
+            'content': proposal.last_message_snippet,
+            'created_at': proposal.last_message_at,
+        } if proposal.last_message_id else None,
+        'unread_count': proposal.unread_count,
+    } for proposal in proposals]
+
+
+def mark_conversation_read(user, project_id, message_id):
+    """Move the user's read marker forward to ``message_id`` (never backwards)"""
+    if not message_id:
+        return
+    updated = ConversationReadState.objects.filter(
+        user=user, project_id=project_id, last_read_message_id__lt=message_id
+    ).update(last_read_message_id=message_id)
+    if not updated:
+        ConversationReadState.objects.get_or_create(
+            user=user, project_id=project_id, defaults={'last_read_message_id': message_id}
+        )
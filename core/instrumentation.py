@@ -0,0 +1,162 @@
+"""Per-view SQL query budgets.
+
+``QueryRecorder`` wraps every database connection for one request and notes
+each query's SQL, parameters and duration. ``QueryReportStore`` folds those
+samples into per-URL-name aggregates kept in a cache
+(``settings.QUERY_INSTRUMENTATION_CACHE``) so the staff JSON endpoint and the
+``query_budget_report`` command can read them. Use a shared cache backend
+(Redis, memcached, database) to aggregate across worker processes. Each
+update is a read-modify-write of the view's entry, so it is done under a
+lock taken with ``cache.add``; concurrent workers don't lose each other's
+samples.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+
+STORE_PREFIX = 'query-budget:'
+VIEW_NAMES_KEY = STORE_PREFIX + 'views'
+
+# Fingerprints listed per view in the aggregates
+MAX_FINGERPRINTS = 10
+
+# A lock left by a crashed worker expires after LOCK_TIMEOUT seconds
+LOCK_TIMEOUT = 5
+LOCK_POLL_INTERVAL = 0.002
+
+
+def fingerprint(sql):
+    """Normalize parameterized SQL so queries differing only in IN-list size match"""
+    return WHITESPACE_RE.sub(' ', IN_LIST_RE.sub('IN (...)', sql)).strip()
+
+
+class QueryRecorder:
+    """Context manager recording every query run on any connection"""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, repr(params), time.perf_counter() - start))
+
+    def summary(self):
+        """Count, DB time, exact duplicates and N+1 suspects for the request"""
+        exact = Counter((sql, params) for sql, params, _ in self.queries)
+        shapes = Counter()
+        for sql, params in exact:
+            shapes[fingerprint(sql)] += 1
+        threshold = getattr(settings, 'QUERY_INSTRUMENTATION_N_PLUS_ONE_THRESHOLD', 3)
+        return {
+            'queries': len(self.queries),
+            'db_time': sum(duration for _, _, duration in self.queries),
+            'duplicates': sum(count - 1 for count in exact.values() if count > 1),
+            # Same statement shape run with many different parameters
+            'n_plus_one': {shape: count for shape, count in shapes.items() if count >= threshold},
+        }
+
+
+class QueryReportStore:
+    """Per-view aggregates of request summaries, kept in a Django cache"""
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or getattr(settings, 'QUERY_INSTRUMENTATION_CACHE', 'default')]
+
+    @contextmanager
+    def locked(self, key):
+        """Hold ``key``'s lock; waits at most LOCK_TIMEOUT, by when a stale lock has expired"""
+        lock_key = key + ':lock'
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        acquired = self.cache.add(lock_key, 1, LOCK_TIMEOUT)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            acquired = self.cache.add(lock_key, 1, LOCK_TIMEOUT)
+        try:
+            yield
+        finally:
+            # Never release a lock some other worker holds
+            if acquired:
+                self.cache.delete(lock_key)
+
+    def record(self, view_name, summary):
+        key = STORE_PREFIX + view_name
+        with self.locked(key):
+            self._update(key, view_name, summary)
+
+        names = self.cache.get(VIEW_NAMES_KEY) or set()
+        if view_name not in names:
+            with self.locked(VIEW_NAMES_KEY):
+                names = self.cache.get(VIEW_NAMES_KEY) or set()
+                names.add(view_name)
+                self.cache.set(VIEW_NAMES_KEY, names, None)
+
+    def _update(self, key, view_name, summary):
+        stats = self.cache.get(key) or {
+            'view': view_name,
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'db_time': 0.0,
+            'max_db_time': 0.0,
+            'duplicates': 0,
+            'over_budget': 0,
+            'n_plus_one': {},
+        }
+        stats['requests'] += 1
+        stats['queries'] += summary['queries']
+        stats['max_queries'] = max(stats['max_queries'], summary['queries'])
+        stats['db_time'] += summary['db_time']
+        stats['max_db_time'] = max(stats['max_db_time'], summary['db_time'])
+        stats['duplicates'] += summary['duplicates']
+        if summary['queries'] > getattr(settings, 'QUERY_INSTRUMENTATION_BUDGET', 20):
+            stats['over_budget'] += 1
+        patterns = Counter(stats['n_plus_one'])
+        patterns.update(summary['n_plus_one'])
+        stats['n_plus_one'] = dict(patterns.most_common(MAX_FINGERPRINTS))
+        self.cache.set(key, stats, None)
+
+    def report(self, order_by='queries'):
+        """Aggregates for every view with per-request averages, worst first"""
+        names = self.cache.get(VIEW_NAMES_KEY) or set()
+        rows = []
+        for stats in self.cache.get_many([STORE_PREFIX + name for name in names]).values():
+            requests = stats['requests'] or 1
+            rows.append(dict(
+                stats,
+                avg_queries=stats['queries'] / requests,
+                avg_db_time_ms=stats['db_time'] * 1000 / requests,
+                max_db_time_ms=stats['max_db_time'] * 1000,
+            ))
+        sort_keys = {
+            'queries': lambda row: row['avg_queries'],
+            'db_time': lambda row: row['avg_db_time_ms'],
+            'duplicates': lambda row: row['duplicates'] / (row['requests'] or 1),
+            'n_plus_one': lambda row: sum(row['n_plus_one'].values()),
+        }
+        rows.sort(key=sort_keys[order_by], reverse=True)
+        return rows
+
+    def reset(self):
+        names = self.cache.get(VIEW_NAMES_KEY) or set()
+        self.cache.delete_many([STORE_PREFIX + name for name in names] + [VIEW_NAMES_KEY])
@@ -1,6 +1,10 @@
+import time
+
 from django.core.management.base import BaseCommand
 from users.models import User
 from core.models import Project
+from core.seeding import seed_bulk
+from core.skills import set_project_skills
 from client.models import ClientProfile
 from freelancer.models import FreelancerProfile
 import random
@@ -10,7 +14,53 @@ from datetime import timedelta
 class Command(BaseCommand):
     help = 'Creates sample projects, clients, and freelancers for testing'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', action='store_true',
+                            help='Generate a large dataset with bulk inserts instead of the small demo set')
+        parser.add_argument('--projects', type=int, default=100000,
+                            help='Projects to create in bulk mode; users and activity scale with it')
+        parser.add_argument('--clients', type=int,
+                            help='Clients to create in bulk mode (default: one per 20 projects)')
+        parser.add_argument('--freelancers', type=int,
+                            help='Freelancers to create in bulk mode (default: one per 10 projects)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed; the same seed produces the same data')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows inserted per bulk_create batch')
+        parser.add_argument('--prefix', default='bulk',
+                            help='Username prefix for bulk-created users')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Leave the search index, user stats and ratings for a later rebuild')
+
+    def handle_bulk(self, options):
+        started = time.perf_counter()
+        reported = {}
+
+        def progress(label, done, total):
+            # One line per ~10% step keeps the output short for millions of rows
+            step = done * 10 // total
+            if reported.get(label) != step:
+                reported[label] = step
+                self.stdout.write(f'{label}: {done}/{total} ({time.perf_counter() - started:.1f}s)')
+
+        totals = seed_bulk(
+            options['projects'], seed=options['seed'], batch_size=options['batch_size'],
+            prefix=options['prefix'], clients=options['clients'], freelancers=options['freelancers'],
+            progress=progress, rebuild=not options['skip_rebuild'],
+        )
+        summary = ', '.join(f'{count} {name}' for name, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {summary} in {time.perf_counter() - started:.1f}s'
+        ))
+        if options['skip_rebuild']:
+            self.stdout.write(self.style.WARNING(
+                'Run rebuild_search_index, rebuild_user_stats and reconcile_ratings before using the data.'
+            ))
+
     def handle(self, *args, **kwargs):
+        if kwargs['bulk']:
+            return self.handle_bulk(kwargs)
+
         # Sample data
         technologies = [
             'Python', 'JavaScript', 'React', 'Django', 'Node.js', 'Angular',
@@ -99,6 +149,7 @@ class Command(BaseCommand):
                     budget=budget,
                     created_at=created_date
                 )
+                set_project_skills(project, required_skills)
                 self.stdout.write(self.style.SUCCESS(f'Created project: {project.title}'))
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f'Error creating project {i+1}: {str(e)}'))
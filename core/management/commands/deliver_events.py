@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from core.events import deliver_pending, prune_delivered
+
+
+class Command(BaseCommand):
+    help = 'Redelivers domain events left undelivered in the outbox and prunes delivered ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=5,
+                            help='Minutes an event must have been pending before it is redelivered')
+        parser.add_argument('--retention-days', type=float, default=None,
+                            help='Days delivered events are kept (defaults to EVENT_OUTBOX_RETENTION_DAYS)')
+
+    def handle(self, *args, **options):
+        delivered = deliver_pending(timedelta(minutes=options['min_age']))
+        max_age = timedelta(days=options['retention_days']) if options['retention_days'] is not None else None
+        pruned = prune_delivered(max_age)
+        self.stdout.write(self.style.SUCCESS(f'Redelivered {delivered} events, pruned {pruned}.'))
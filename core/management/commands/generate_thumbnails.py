@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from client.models import ClientProfile
+from core.thumbnails import process_profile_picture
+from freelancer.models import FreelancerProfile
+
+
+class Command(BaseCommand):
+    help = 'Renders avatar thumbnails for profile pictures that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-render every profile picture, e.g. after changing THUMBNAIL_SIZES')
+
+    def handle(self, *args, **options):
+        rendered = failed = 0
+        for model in (FreelancerProfile, ClientProfile):
+            profiles = model.objects.exclude(profile_pic='').exclude(profile_pic__isnull=True)
+            if not options['all']:
+                profiles = profiles.filter(profile_pic_digest='')
+            for pk, name in profiles.values_list('pk', 'profile_pic').iterator():
+                if process_profile_picture(model, pk, name):
+                    rendered += 1
+                else:
+                    failed += 1
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(f'Rendered thumbnails for {rendered} pictures. {failed} could not be processed.'))
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from core.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes chunked chat uploads that were abandoned before completion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None,
+                            help='Age since the last chunk after which an upload is abandoned '
+                                 '(defaults to CHAT_UPLOAD_EXPIRY_HOURS)')
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options['hours']) if options['hours'] is not None else None
+        deleted = purge_stale_uploads(max_age)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} abandoned uploads.'))
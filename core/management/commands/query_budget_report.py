@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from core.instrumentation import QueryReportStore
+
+
+class Command(BaseCommand):
+    help = 'Lists the views that run the most SQL, as recorded by QueryBudgetMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of views to list')
+        parser.add_argument('--order-by', default='queries',
+                            choices=['queries', 'db_time', 'duplicates', 'n_plus_one'],
+                            help='Metric the views are ranked by')
+        parser.add_argument('--reset', action='store_true',
+                            help='Clear the recorded aggregates after printing them')
+
+    def handle(self, *args, **options):
+        store = QueryReportStore()
+        rows = store.report(options['order_by'])[:options['top']]
+        if not rows:
+            self.stdout.write(self.style.WARNING(
+                'No requests recorded. Is QUERY_INSTRUMENTATION_ENABLED set and the cache shared?'
+            ))
+
+        for row in rows:
+            style = self.style.ERROR if row['over_budget'] else self.style.SUCCESS
+            self.stdout.write(style(row['view']))
+            self.stdout.write(
+                f"  {row['requests']} requests, {row['avg_queries']:.1f} queries avg ({row['max_queries']} max), "
+                f"{row['avg_db_time_ms']:.1f} ms DB avg ({row['max_db_time_ms']:.1f} ms max), "
+                f"{row['duplicates']} duplicate queries, {row['over_budget']} over budget"
+            )
+            for shape, count in row['n_plus_one'].items():
+                self.stdout.write(f'  N+1 x{count}: {shape}')
+
+        if options['reset']:
+            store.reset()
+            self.stdout.write(self.style.SUCCESS('Cleared recorded query budgets.'))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.recommendations import rebuild_project_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the matching model and every freelancer\'s best-match projects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1024,
+                            help='Freelancers scored per block')
+        parser.add_argument('--project-batch-size', type=int, default=4096,
+                            help='Open projects scored per block')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = rebuild_project_recommendations(
+            batch_size=options['batch_size'], project_batch_size=options['project_batch_size'],
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} recommendations in {elapsed:.1f}s.'))
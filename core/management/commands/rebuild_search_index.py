@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the project full-text search index from the Project table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Number of projects written per batch')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        count = backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} projects with {backend.__class__.__name__}'
+        ))
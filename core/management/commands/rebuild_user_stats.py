@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core.stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Backfills the per-user dashboard counters and repairs any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of users recomputed per batch')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report users whose counters are missing or wrong')
+
+    def handle(self, *args, **options):
+        checked, drifted = rebuild_user_stats(
+            batch_size=options['batch_size'], check_only=options['check']
+        )
+        if options['check']:
+            style = self.style.WARNING if drifted else self.style.SUCCESS
+            self.stdout.write(style(f'Checked {checked} users. {drifted} have missing or inconsistent stats.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Checked {checked} users. Rebuilt stats for {drifted}.'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from core.ratings import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recomputes freelancer rating totals from reviews and fixes any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of profiles checked per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted profiles without writing')
+
+    def handle(self, *args, **options):
+        checked, fixed = reconcile_ratings(
+            batch_size=options['batch_size'], dry_run=options['dry_run']
+        )
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} profiles. {verb} {fixed} with drifted ratings.'
+        ))
@@ -0,0 +1,408 @@
+"""Vectorized matching between freelancers and projects.
+
+``build_matching_model()`` turns the marketplace into NumPy arrays:
+
+* terms: TF-IDF over project titles and descriptions, limited to the
+  ``MATCHING_MAX_TERMS`` most frequent terms that appear in at least two
+  projects and in at most half of them
+* skills: the normalized ``Skill`` links (see ``core.skills``)
+* budgets: the log of each freelancer's bids
+
+A freelancer is described by their skills, the terms of their skill names
+and of the projects they were hired for, and the mean and spread of their
+bids (accepted bids when there are any). Their rating totals are kept
+alongside for ranking. Vectors are L2-normalized so dot products are
+cosine similarities, and::
+
+    score = w_skills * skill overlap + w_terms * term similarity + w_budget * budget fit
+
+with the weights from ``MATCHING_WEIGHTS``. Budget fit is a Gaussian on the
+log scale around the freelancer's typical bid; freelancers without bids get
+0.5.
+
+Freelancer vectors have only a handful of non-zero features, so they are
+kept as sparse rows and saved with ``numpy.savez`` to
+``MATCHING_MODEL_PATH``. Web processes load that file to score one project
+against every freelancer in milliseconds without rebuilding anything.
+``freelancer_features`` describes a few freelancers against a saved model's
+vocabulary, for callers that patch in changes made since it was built. NumPy
+is optional: without it no model is built and callers fall back to their
+unranked behaviour.
+"""
+import copy
+import math
+import os
+import re
+import tempfile
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count
+from django.utils import timezone
+
+from freelancer.models import FreelancerProfile
+
+from .models import Project, Proposal, Skill
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+TOKEN_RE = re.compile(r'[^\W\d_][\w+#.]*', re.UNICODE)
+STOPWORDS = frozenset(
+    'the and for with that this from are will have has you your our can who all any into '
+    'using need needs looking project projects work build create development developer'.split()
+)
+
+DEFAULT_WEIGHTS = {'skills': 0.55, 'terms': 0.3, 'budget': 0.15}
+NEUTRAL_BUDGET_FIT = 0.5
+MIN_BUDGET_SPREAD = 0.35  # log scale, roughly +/-40% around the typical bid
+SMALL_CORPUS = 20  # below this many projects every term is kept
+
+
+def tokenize(text):
+    return [
+        token for token in (match.rstrip('.') for match in TOKEN_RE.findall(text.lower()))
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def get_weights():
+    return getattr(settings, 'MATCHING_WEIGHTS', DEFAULT_WEIGHTS)
+
+
+def get_model_path():
+    return str(getattr(settings, 'MATCHING_MODEL_PATH', os.path.join(settings.BASE_DIR, 'var', 'matching.npz')))
+
+
+def _require_numpy():
+    if np is None:
+        raise ImproperlyConfigured('Matching requires the "numpy" package.')
+
+
+class SparseRows:
+    """Minimal CSR matrix: row ``i`` has ``data[indptr[i]:indptr[i + 1]]`` at ``indices[...]``"""
+
+    def __init__(self, indptr, indices, data, n_cols):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.n_cols = n_cols
+        self._columns = None
+
+    @classmethod
+    def from_rows(cls, rows, n_cols):
+        """Build from a list of ``{column: value}`` dicts, normalizing each row to unit length"""
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in rows])
+        indices = np.fromiter((col for row in rows for col in row), dtype=np.int32, count=int(indptr[-1]))
+        data = np.fromiter((value for row in rows for value in row.values()), dtype=np.float32, count=int(indptr[-1]))
+        matrix = cls(indptr, indices, data, n_cols)
+        matrix.normalize()
+        return matrix
+
+    @classmethod
+    def stack(cls, top, bottom):
+        """``top``'s rows followed by ``bottom``'s"""
+        indptr = np.concatenate([top.indptr, bottom.indptr[1:] + top.indptr[-1]])
+        return cls(indptr, np.concatenate([top.indices, bottom.indices]),
+                   np.concatenate([top.data, bottom.data]), top.n_cols)
+
+    def take(self, mask):
+        """The rows where the boolean ``mask`` is set"""
+        lengths = np.diff(self.indptr)
+        indptr = np.zeros(int(mask.sum()) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(lengths[mask])
+        kept = np.repeat(mask, lengths)
+        return SparseRows(indptr, self.indices[kept], self.data[kept], self.n_cols)
+
+    @property
+    def n_rows(self):
+        return len(self.indptr) - 1
+
+    def row_ids(self):
+        return np.repeat(np.arange(self.n_rows), np.diff(self.indptr))
+
+    def normalize(self):
+        norms = np.sqrt(np.bincount(self.row_ids(), weights=self.data ** 2, minlength=self.n_rows))
+        norms[norms == 0] = 1
+        self.data = (self.data / norms[self.row_ids()]).astype(np.float32)
+
+    def row(self, i):
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.indices[lo:hi], self.data[lo:hi]
+
+    def dense(self, start, stop):
+        """Rows ``start:stop`` as a dense float32 block"""
+        block = np.zeros((stop - start, self.n_cols), dtype=np.float32)
+        lo, hi = self.indptr[start], self.indptr[stop]
+        rows = np.repeat(np.arange(stop - start), np.diff(self.indptr[start:stop + 1]))
+        block[rows, self.indices[lo:hi]] = self.data[lo:hi]
+        return block
+
+    def columns(self):
+        """The transpose, built once, for scoring one query against every row"""
+        if self._columns is None:
+            order = np.argsort(self.indices, kind='stable')
+            indptr = np.zeros(self.n_cols + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum(np.bincount(self.indices, minlength=self.n_cols))
+            self._columns = SparseRows(indptr, self.row_ids()[order].astype(np.int32), self.data[order], self.n_rows)
+        return self._columns
+
+    def dot(self, indices, values):
+        """Dot product of every row with the sparse vector ``(indices, values)``"""
+        columns = self.columns()
+        scores = np.zeros(self.n_rows, dtype=np.float32)
+        for col, value in zip(indices, values):
+            rows, data = columns.row(col)
+            scores[rows] += value * data
+        return scores
+
+
+class MatchingModel:
+    """Vocabulary, IDF weights and per-freelancer vectors, bid statistics and rating totals"""
+
+    def __init__(self, terms, idf, skill_ids, built_at=None, extras=None):
+        self.terms = terms
+        self.idf = idf
+        self.skill_ids = skill_ids
+        # When the data was read, as a Unix timestamp; later changes are not in the model
+        self.built_at = built_at
+        # Arrays other modules keep alongside the model, e.g. recommendation thresholds
+        self.extras = extras or {}
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        self.skill_index = {int(skill_id): i for i, skill_id in enumerate(skill_ids)}
+
+    def set_freelancers(self, freelancer_ids, freelancer_terms, freelancer_skills, budget_mean, budget_spread,
+                        rating_sum, review_count):
+        self.freelancer_ids = freelancer_ids
+        self.freelancer_terms = freelancer_terms
+        self.freelancer_skills = freelancer_skills
+        self.budget_mean = budget_mean
+        self.budget_spread = budget_spread
+        self.rating_sum = rating_sum
+        self.review_count = review_count
+        self.freelancer_index = {int(user_id): i for i, user_id in enumerate(freelancer_ids)}
+
+    def with_freelancers(self, freelancer_ids, features):
+        """A model over the same vocabulary describing ``freelancer_ids`` (see ``freelancer_features``)"""
+        term_rows, skill_rows, budget_mean, budget_spread, rating_sum, review_count = features
+        model = copy.copy(self)
+        model.extras = {}
+        model.set_freelancers(
+            np.array(freelancer_ids, dtype=np.int64),
+            SparseRows.from_rows(term_rows, len(self.terms)), SparseRows.from_rows(skill_rows, len(self.skill_ids)),
+            np.asarray(budget_mean, dtype=np.float32), np.asarray(budget_spread, dtype=np.float32),
+            np.asarray(rating_sum, dtype=np.float32), np.asarray(review_count, dtype=np.float32),
+        )
+        return model
+
+    def replace_freelancers(self, replaced, other):
+        """A model without the rows where ``replaced`` is set and with ``other``'s freelancers appended"""
+        keep = ~replaced
+        model = copy.copy(self)
+        model.extras = {}
+        model.set_freelancers(
+            np.concatenate([self.freelancer_ids[keep], other.freelancer_ids]),
+            SparseRows.stack(self.freelancer_terms.take(keep), other.freelancer_terms),
+            SparseRows.stack(self.freelancer_skills.take(keep), other.freelancer_skills),
+            *(np.concatenate([getattr(self, name)[keep], getattr(other, name)])
+              for name in ('budget_mean', 'budget_spread', 'rating_sum', 'review_count')),
+        )
+        return model
+
+    def term_counts(self, text):
+        return Counter(token for token in tokenize(text) if token in self.term_index)
+
+    def term_row(self, counts):
+        return {self.term_index[term]: (1 + math.log(count)) * self.idf[self.term_index[term]]
+                for term, count in counts.items()}
+
+    def skill_row(self, skill_ids):
+        return {self.skill_index[skill_id]: 1.0 for skill_id in skill_ids if skill_id in self.skill_index}
+
+    def vectorize(self, projects):
+        """``(terms, skills)`` sparse rows for ``(text, skill_ids)`` pairs"""
+        terms = SparseRows.from_rows([self.term_row(self.term_counts(text)) for text, _ in projects], len(self.terms))
+        skills = SparseRows.from_rows([self.skill_row(skill_ids) for _, skill_ids in projects], len(self.skill_ids))
+        return terms, skills
+
+    def budget_fit(self, rows, log_budgets):
+        """Gaussian fit of each budget to the bids of freelancers ``rows``; shape (rows, budgets)"""
+        mean = self.budget_mean[rows][:, None]
+        spread = self.budget_spread[rows][:, None]
+        fit = np.exp(-((log_budgets[None, :] - mean) ** 2) / (2 * spread ** 2))
+        return np.where(np.isnan(mean), NEUTRAL_BUDGET_FIT, fit).astype(np.float32)
+
+    def score_block(self, start, stop, project_terms, project_skills, log_budgets):
+        """Scores of freelancers ``start:stop`` against dense project blocks; shape (freelancers, projects)"""
+        weights = get_weights()
+        scores = weights['skills'] * (self.freelancer_skills.dense(start, stop) @ project_skills.T)
+        scores += weights['terms'] * (self.freelancer_terms.dense(start, stop) @ project_terms.T)
+        scores += weights['budget'] * self.budget_fit(slice(start, stop), log_budgets)
+        return scores
+
+    def relevance(self, terms, skills):
+        """Weighted skill and term similarity of one vectorized project to every freelancer"""
+        weights = get_weights()
+        scores = weights['skills'] * self.freelancer_skills.dot(*skills.row(0))
+        scores += weights['terms'] * self.freelancer_terms.dot(*terms.row(0))
+        return scores
+
+    def score_project(self, terms, skills, log_budget):
+        """Score one vectorized project against every freelancer"""
+        scores = self.relevance(terms, skills)
+        scores += get_weights()['budget'] * self.budget_fit(slice(None), np.array([log_budget], dtype=np.float32))[:, 0]
+        return scores
+
+    def save(self, path=None):
+        path = path or get_model_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {
+            'terms': np.array(self.terms, dtype=str), 'idf': self.idf, 'skill_ids': self.skill_ids,
+            'built_at': np.array(self.built_at, dtype=np.float64), 'freelancer_ids': self.freelancer_ids,
+            'budget_mean': self.budget_mean, 'budget_spread': self.budget_spread,
+            'rating_sum': self.rating_sum, 'review_count': self.review_count,
+        }
+        for name, matrix in (('freelancer_terms', self.freelancer_terms), ('freelancer_skills', self.freelancer_skills)):
+            arrays.update({f'{name}_indptr': matrix.indptr, f'{name}_indices': matrix.indices,
+                           f'{name}_data': matrix.data})
+        arrays.update({f'extra_{name}': value for name, value in self.extras.items()})
+        # Write then rename so readers never load a half-written file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+        with os.fdopen(fd, 'wb') as fh:
+            np.savez(fh, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=None):
+        with np.load(path or get_model_path()) as arrays:
+            terms, skill_ids = [str(term) for term in arrays['terms']], arrays['skill_ids']
+            matrices = {
+                name: SparseRows(arrays[f'{name}_indptr'], arrays[f'{name}_indices'], arrays[f'{name}_data'], n_cols)
+                for name, n_cols in (('freelancer_terms', len(terms)), ('freelancer_skills', len(skill_ids)))
+            }
+            extras = {name[len('extra_'):]: arrays[name] for name in arrays.files if name.startswith('extra_')}
+            model = cls(terms, arrays['idf'], skill_ids, float(arrays['built_at']), extras)
+            model.set_freelancers(
+                arrays['freelancer_ids'], matrices['freelancer_terms'], matrices['freelancer_skills'],
+                arrays['budget_mean'], arrays['budget_spread'], arrays['rating_sum'], arrays['review_count'],
+            )
+            return model
+
+
+def _vocabulary(max_terms):
+    """Terms to keep and their IDF, from the document frequencies over every project"""
+    df = Counter()
+    n_docs = 0
+    for title, description in Project.objects.values_list('title', 'description').iterator(chunk_size=2000):
+        df.update(set(tokenize(f'{title} {description}')))
+        n_docs += 1
+    if n_docs >= SMALL_CORPUS:
+        df = Counter({term: count for term, count in df.items() if 2 <= count <= n_docs / 2})
+    terms = [term for term, _ in sorted(df.items(), key=lambda item: (-item[1], item[0]))[:max_terms]]
+    idf = np.array([math.log((1 + n_docs) / (1 + df[term])) + 1 for term in terms], dtype=np.float32)
+    return terms, idf
+
+
+def _budget_stats(freelancer_index, proposals):
+    """Mean and spread of log bid amounts per freelancer, NaN for freelancers without bids"""
+    bids = defaultdict(list)
+    accepted = defaultdict(list)
+    for freelancer_id, amount, status in proposals.values_list('freelancer_id', 'bid_amount', 'status').iterator():
+        if freelancer_id in freelancer_index:
+            bids[freelancer_id].append(math.log(float(amount)))
+            if status == 'accepted':
+                accepted[freelancer_id].append(math.log(float(amount)))
+    mean = np.full(len(freelancer_index), np.nan, dtype=np.float32)
+    spread = np.full(len(freelancer_index), MIN_BUDGET_SPREAD, dtype=np.float32)
+    for freelancer_id, logs in bids.items():
+        logs = np.array(accepted.get(freelancer_id) or logs)
+        i = freelancer_index[freelancer_id]
+        mean[i] = logs.mean()
+        spread[i] = max(logs.std(), MIN_BUDGET_SPREAD)
+    return mean, spread
+
+
+def freelancer_features(model, freelancer_ids, subset=False):
+    """
+    ``(term rows, skill rows, budget mean, budget spread, rating sum, review
+    count)`` for ``freelancer_ids``, in order. Queries are restricted to those
+    freelancers when ``subset`` is true; otherwise ``freelancer_ids`` is every
+    freelancer and whole tables are read.
+    """
+    freelancer_index = {int(user_id): i for i, user_id in enumerate(freelancer_ids)}
+
+    def scoped(queryset, field):
+        return queryset.filter(**{f'{field}__in': list(freelancer_index)}) if subset else queryset
+
+    links = [
+        (freelancer_id, skill_id) for freelancer_id, skill_id in
+        scoped(FreelancerProfile.skill_tags.through.objects, 'freelancerprofile_id')
+        .values_list('freelancerprofile_id', 'skill_id').iterator()
+        if freelancer_id in freelancer_index
+    ]
+    known = {skill_id for _, skill_id in links if skill_id in model.skill_index}
+    skill_names = dict(Skill.objects.filter(pk__in=known).values_list('pk', 'name'))
+
+    # Each freelancer's text: their skill names plus the projects they were hired for
+    counts = [Counter() for _ in freelancer_index]
+    skills = [[] for _ in freelancer_index]
+    for freelancer_id, skill_id in links:
+        skills[freelancer_index[freelancer_id]].append(skill_id)
+        if skill_id in skill_names:
+            counts[freelancer_index[freelancer_id]].update(model.term_counts(skill_names[skill_id]))
+    hired = scoped(Proposal.objects.filter(status='accepted'), 'freelancer_id')
+    for freelancer_id, title, description in hired.values_list(
+            'freelancer_id', 'project__title', 'project__description').iterator():
+        if freelancer_id in freelancer_index:
+            counts[freelancer_index[freelancer_id]].update(model.term_counts(f'{title} {description}'))
+
+    rating_sum = np.zeros(len(freelancer_index), dtype=np.float32)
+    review_count = np.zeros(len(freelancer_index), dtype=np.float32)
+    ratings = scoped(FreelancerProfile.objects, 'pk').values_list('pk', 'rating_sum', 'review_count')
+    for freelancer_id, total, count in ratings.iterator():
+        if freelancer_id in freelancer_index:
+            rating_sum[freelancer_index[freelancer_id]] = total
+            review_count[freelancer_index[freelancer_id]] = count
+
+    budget_mean, budget_spread = _budget_stats(freelancer_index, scoped(Proposal.objects, 'freelancer_id'))
+    return ([model.term_row(c) for c in counts], [model.skill_row(s) for s in skills],
+            budget_mean, budget_spread, rating_sum, review_count)
+
+
+def build_matching_model(max_terms=None, max_skills=None):
+    """Vectorize every freelancer against the current vocabulary; does not save the model"""
+    _require_numpy()
+    built_at = timezone.now().timestamp()
+    max_terms = max_terms or getattr(settings, 'MATCHING_MAX_TERMS', 2048)
+    max_skills = max_skills or getattr(settings, 'MATCHING_MAX_SKILLS', 4096)
+    terms, idf = _vocabulary(max_terms)
+
+    held = (FreelancerProfile.skill_tags.through.objects.values('skill_id')
+            .annotate(holders=Count('pk')).order_by('-holders', 'skill_id')[:max_skills])
+    skill_ids = np.array(sorted(row['skill_id'] for row in held), dtype=np.int64)
+
+    freelancer_ids = list(FreelancerProfile.objects.order_by('pk').values_list('pk', flat=True))
+    vocabulary = MatchingModel(terms, idf, skill_ids, built_at)
+    return vocabulary.with_freelancers(freelancer_ids, freelancer_features(vocabulary, freelancer_ids))
+
+
+_cached = {'path': None, 'mtime': None, 'model': None}
+
+
+def get_matching_model():
+    """The saved model, reloaded when the file changes; None if there is none or NumPy is missing"""
+    if np is None:
+        return None
+    path = get_model_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _cached['path'] != path or _cached['mtime'] != mtime:
+        _cached.update(path=path, mtime=mtime, model=MatchingModel.load(path))
+    return _cached['model']
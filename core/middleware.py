@@ -0,0 +1,48 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .instrumentation import QueryRecorder, QueryReportStore
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the SQL each request runs and fold it into per-view aggregates
+    (see core/instrumentation.py). Only installed when
+    ``settings.QUERY_INSTRUMENTATION_ENABLED`` is true. Async views stay
+    async, so long polls and streams don't each hold a thread while they wait.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.store = QueryReportStore()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.process_response(request, response, recorder)
+
+    async def __acall__(self, request):
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        # Recording talks to the cache, which may block
+        return await sync_to_async(self.process_response)(request, response, recorder)
+
+    def process_response(self, request, response, recorder):
+        match = request.resolver_match
+        if match is not None:
+            summary = recorder.summary()
+            self.store.record(match.view_name, summary)
+            # Streaming bodies run their queries after this point and are not counted
+            response['X-Query-Count'] = str(summary['queries'])
+            response['X-Query-Time-Ms'] = f"{summary['db_time'] * 1000:.1f}"
+        return response
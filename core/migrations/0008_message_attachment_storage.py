@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:23
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='attachment_name',
+            field=models.CharField(blank=True, help_text='Original file name of the attachment', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=core.storage.attachment_storage, upload_to='chat_files/'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectSearchEntry',
+            fields=[
+                ('project', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='core.project')),
+                ('document', models.TextField(db_column='core_project_fts')),
+                ('title', models.TextField()),
+                ('description', models.TextField()),
+                ('status', models.CharField(max_length=20)),
+                ('budget', models.FloatField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'core_project_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:01
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_timestamps(apps, schema_editor):
+    # The last update is the best record there is of when existing rows changed status
+    Project = apps.get_model('core', 'Project')
+    Proposal = apps.get_model('core', 'Proposal')
+    Project.objects.filter(status='completed').update(completed_at=F('updated_at'))
+    Proposal.objects.filter(status='accepted').update(accepted_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_projectsearchentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, help_text='When the project was last marked completed', null=True),
+        ),
+        migrations.AddField(
+            model_name='proposal',
+            name='accepted_at',
+            field=models.DateTimeField(blank=True, help_text='When the proposal was accepted', null=True),
+        ),
+        migrations.RunPython(backfill_timestamps, migrations.RunPython.noop),
+    ]
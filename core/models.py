@@ -1,7 +1,42 @@
-from django.db import models
+import os
+import uuid
+
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
+from django.db.models import Q
+from django.utils import timezone
 from decimal import Decimal
 from users.models import User
+from .storage import attachment_storage
+
+
+def _stored_status(instance):
+    """The status currently in the database for an already-saved instance"""
+    status = getattr(instance, '_saved_status', None)
+    if status is None:
+        status = type(instance).objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+    return status
+
+
+def _stamp_status_change(instance, previous, status, field, save_kwargs):
+    """Set ``field`` to now when ``instance`` enters ``status``, and clear it when it leaves"""
+    if instance.status == previous or status not in (instance.status, previous):
+        return
+    setattr(instance, field, timezone.now() if instance.status == status else None)
+    if save_kwargs.get('update_fields') is not None:
+        save_kwargs['update_fields'] = {*save_kwargs['update_fields'], field}
+
+
+class Skill(models.Model):
+    """A normalized skill shared by freelancer profiles and projects (see core/skills.py)"""
+    name = models.CharField(max_length=100, help_text="Display form, as first entered")
+    key = models.CharField(max_length=100, unique=True, help_text="Case-folded name used for exact and prefix lookups")
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
 
 
 class Project(models.Model):
@@ -16,14 +51,50 @@ class Project(models.Model):
     description = models.TextField()
     budget = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    skills = models.ManyToManyField(Skill, related_name='projects', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True, help_text="When the project was last marked completed")
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Open-project listings: newest first, budget filters/sorts
+            models.Index(fields=['status', 'created_at'], name='project_status_created_idx'),
+            models.Index(fields=['status', 'budget'], name='project_status_budget_idx'),
+            # Client dashboards and counters
+            models.Index(fields=['client', 'status', 'created_at'], name='project_client_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.client.username}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so save() can tell what changed
+        instance._saved_status = instance.__dict__.get('status')
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        if fields is None or 'status' in fields:
+            self._saved_status = self.__dict__.get('status')
+    
+    def save(self, *args, **kwargs):
+        from .stats import project_changed
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' not in update_fields:
+            # The status isn't written, so an unsaved change to it must not move the counters
+            super().save(*args, **kwargs)
+            return
+        previous = None if self._state.adding else _stored_status(self)
+        _stamp_status_change(self, previous, 'completed', 'completed_at', kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            project_changed(self, previous, self.status)
+        self._saved_status = self.status
 
 
 class Proposal(models.Model):
@@ -40,13 +111,46 @@ class Proposal(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    accepted_at = models.DateTimeField(null=True, blank=True, help_text="When the proposal was accepted")
     
     class Meta:
         ordering = ['-created_at']
         unique_together = ['project', 'freelancer']  # One proposal per freelancer per project
+        indexes = [
+            # Freelancer dashboards/counters and per-project accepted/pending lookups
+            models.Index(fields=['freelancer', 'status'], name='proposal_freelancer_status_idx'),
+            models.Index(fields=['project', 'status'], name='proposal_project_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.freelancer.username} - {self.project.title}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so save() can tell what changed
+        instance._saved_status = instance.__dict__.get('status')
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        if fields is None or 'status' in fields:
+            self._saved_status = self.__dict__.get('status')
+    
+    def save(self, *args, **kwargs):
+        from .stats import proposal_changed
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' not in update_fields:
+            # The status isn't written, so an unsaved change to it must not move the counters
+            super().save(*args, **kwargs)
+            return
+        previous = None if self._state.adding else _stored_status(self)
+        _stamp_status_change(self, previous, 'accepted', 'accepted_at', kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            proposal_changed(self, previous, self.status)
+        self._saved_status = self.status
 
 
 class Message(models.Model):
@@ -54,15 +158,141 @@ class Message(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField(blank=True)
-    attachment = models.FileField(upload_to='chat_files/', blank=True, null=True)
+    attachment = models.FileField(upload_to='chat_files/', storage=attachment_storage, blank=True, null=True)
+    attachment_name = models.CharField(max_length=255, blank=True, help_text="Original file name of the attachment")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # New-message polling (id > last_id) and last-message lookups
+            models.Index(fields=['project', 'id'], name='message_project_id_idx'),
+            models.Index(fields=['project', 'created_at'], name='message_project_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username} on {self.project.title} - {self.created_at}"
 
+    @property
+    def attachment_filename(self):
+        """Name to show and download the attachment as"""
+        return self.attachment_name or os.path.basename(self.attachment.name or '')
+
+    def save(self, *args, **kwargs):
+        # Stored names are content hashes; remember what the uploader called the file
+        if self.attachment and not self.attachment._committed and not self.attachment_name:
+            self.attachment_name = os.path.basename(self.attachment.name)[:255]
+        super().save(*args, **kwargs)
+
+
+class AttachmentUpload(models.Model):
+    """A chat attachment being uploaded in chunks; becomes a Message when complete (see core/uploads.py)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='attachment_uploads')
+    uploader = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attachment_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(help_text="Declared size of the whole file in bytes")
+    received = models.PositiveBigIntegerField(default=0, help_text="Bytes written so far; the next chunk's offset")
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Expected SHA-256, checked on completion")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='attachment_upload_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size}) by {self.uploader_id}"
+
+
+class ProjectRecommendation(models.Model):
+    """A precomputed best-match project for a freelancer's dashboard (see core/recommendations.py)"""
+    freelancer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='project_recommendations')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='recommendations')
+    score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['freelancer', 'project']
+        indexes = [
+            models.Index(fields=['freelancer', '-score'], name='recommendation_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.project.title} for {self.freelancer.username} ({self.score:.2f})"
+
+
+class ProjectSearchEntry(models.Model):
+    """
+    A row of the SQLite FTS5 project index (see core/search.py). The table is
+    created by migration 0004 and maintained by the search backend, so the
+    model only exists to join it onto ``Project`` queries.
+    """
+    project = models.OneToOneField(
+        Project, on_delete=models.DO_NOTHING, db_column='rowid', db_constraint=False,
+        primary_key=True, related_name='search_entry',
+    )
+    # FTS5's hidden column named after the table, the left operand of MATCH
+    document = models.TextField(db_column='core_project_fts')
+    title = models.TextField()
+    description = models.TextField()
+    status = models.CharField(max_length=20)
+    budget = models.FloatField()
+    rank = models.FloatField()
+    
+    class Meta:
+        managed = False
+        db_table = 'core_project_fts'
+
+
+class ConversationReadState(models.Model):
+    """How far a participant has read a project's conversation, for unread counts"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_read_states')
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'project']
+    
+    def __str__(self):
+        return f"{self.user.username} read {self.project.title} up to #{self.last_read_message_id}"
+
+
+class UserStats(models.Model):
+    """Denormalized dashboard counters, maintained by core.stats"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    active_projects = models.IntegerField(default=0)
+    completed_projects = models.IntegerField(default=0)
+    pending_proposals = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'user stats'
+    
+    def __str__(self):
+        return f"Stats for {self.user.username}"
+
+
+class OutboxEvent(models.Model):
+    """A published domain event, kept until every subscriber has handled it (see core/events.py)"""
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0, help_text="Deliveries a subscriber failed")
+    
+    class Meta:
+        indexes = [
+            # deliver_events scans the undelivered rows and prunes the delivered ones
+            models.Index(fields=['created_at'], condition=Q(delivered_at__isnull=True), name='outbox_pending_idx'),
+            models.Index(fields=['delivered_at'], name='outbox_delivered_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
+
 
 class Review(models.Model):
     """Review system for rating freelancers by clients"""
@@ -81,19 +311,22 @@ class Review(models.Model):
         return f"{self.rating}★ - {self.client.username} → {self.freelancer.username}"
     
     def save(self, *args, **kwargs):
-        # Save the review first
-        super().save(*args, **kwargs)
-        
-        # Update freelancer's rating and review count
-        from freelancer.models import FreelancerProfile
-        profile = FreelancerProfile.objects.get(user=self.freelancer)
-        
-        # Recalculate average rating
-        avg_rating = Review.objects.filter(freelancer=self.freelancer).aggregate(
-            avg=models.Avg('rating'))['avg'] or 0
-        review_count = Review.objects.filter(freelancer=self.freelancer).count()
+        from .ratings import review_added, review_changed
         
-        # Update profile
-        profile.avg_rating = avg_rating
-        profile.review_count = review_count
-        profile.save()
\ No newline at end of file
+        with transaction.atomic():
+            # Look up (and lock) the previous values so an edit only applies the
+            # difference, and a concurrent edit can't apply it a second time
+            previous = None
+            if self.pk:
+                previous = (
+                    Review.objects.select_for_update().filter(pk=self.pk)
+                    .values('freelancer_id', 'rating').first()
+                )
+            
+            super().save(*args, **kwargs)
+            
+            # Update freelancer's rating and review count incrementally
+            if previous is None:
+                review_added(self)
+            elif (previous['freelancer_id'], previous['rating']) != (self.freelancer_id, self.rating):
+                review_changed(self, previous['freelancer_id'], previous['rating'])
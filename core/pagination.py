@@ -0,0 +1,191 @@
+"""Keyset (cursor) pagination.
+
+Pages are fetched with ``WHERE (created_at, id) < (cursor values) ... LIMIT n``
+instead of ``OFFSET``, so page 1000 costs the same as page 1. Cursors are
+opaque url-safe strings that carry the sort key of the first or last row of
+the current page. A cursor that doesn't decode, or doesn't fit the ordering,
+raises ``InvalidCursor``, which Django answers with a 400.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import Q
+
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+
+class InvalidCursor(BadRequest):
+    def __init__(self, message='Invalid pagination cursor.'):
+        super().__init__(message)
+
+
+class CursorPage:
+    """One page of results plus the cursors to reach its neighbours"""
+
+    def __init__(self, items, next_cursor, previous_cursor, params):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._params = params
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def _querystring(self, cursor):
+        params = self._params.copy()
+        params['cursor'] = cursor
+        return params.urlencode()
+
+    @property
+    def next_querystring(self):
+        return self._querystring(self.next_cursor) if self.has_next else ''
+
+    @property
+    def previous_querystring(self):
+        return self._querystring(self.previous_cursor) if self.has_previous else ''
+
+    def as_dict(self):
+        """Cursor metadata for JSON responses"""
+        return {
+            'next_cursor': self.next_cursor,
+            'previous_cursor': self.previous_cursor,
+            'has_next': self.has_next,
+            'has_previous': self.has_previous,
+        }
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, values), or None for a missing cursor; raises ``InvalidCursor`` for a garbled one"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor()
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor()
+    return direction, values
+
+
+def get_page_size(request, default=None):
+    """Read ``page_size`` from the query string, clamped to the configured max"""
+    default = default or getattr(settings, 'PAGINATION_PAGE_SIZE', 20)
+    max_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 100)
+    try:
+        size = int(request.GET.get('page_size', default))
+    except ValueError:
+        size = default
+    return max(1, min(size, max_size))
+
+
+def _output_field(queryset, name):
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _sort_value(obj, name):
+    # Rows from .values() querysets are dicts
+    value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def _keyset_filter(queryset, ordering, values, reverse):
+    """
+    Build the row-value comparison ``(a, b, id) > (x, y, z)`` as an OR chain
+    that works for mixed ASC/DESC orderings:
+        a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+    """
+    condition = Q()
+    equal = Q()
+    for field, raw in zip(ordering, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        value = _output_field(queryset, name).to_python(raw)
+        forward = descending == reverse
+        lookup = 'gt' if forward else 'lt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return queryset.filter(condition)
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def paginate(request, queryset, ordering=DEFAULT_ORDERING, page_size=None):
+    """
+    Return a ``CursorPage`` for ``queryset`` ordered by ``ordering``. The last
+    ordering field must be unique (normally ``id``) so every row has a
+    distinct cursor position.
+    """
+    ordering = tuple(ordering)
+    page_size = page_size or get_page_size(request)
+    names = [field.lstrip('-') for field in ordering]
+
+    decoded = decode_cursor(request.GET.get('cursor'))
+    if decoded and len(decoded[1]) != len(ordering):
+        # A cursor from a different ordering
+        raise InvalidCursor()
+    direction, values = decoded if decoded else ('next', None)
+    backwards = direction == 'prev'
+
+    if values is not None:
+        try:
+            queryset = _keyset_filter(queryset, ordering, values, reverse=backwards)
+        except (ValidationError, ValueError, TypeError):
+            # A tampered value
+            raise InvalidCursor()
+
+    if backwards:
+        queryset = queryset.order_by(*[_flip(field) for field in ordering])
+    else:
+        queryset = queryset.order_by(*ordering)
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        first = [_sort_value(rows[0], name) for name in names]
+        last = [_sort_value(rows[-1], name) for name in names]
+        if backwards:
+            next_cursor = encode_cursor('next', last)
+            previous_cursor = encode_cursor('prev', first) if has_more else None
+        else:
+            next_cursor = encode_cursor('next', last) if has_more else None
+            previous_cursor = encode_cursor('prev', first) if values is not None else None
+
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return CursorPage(rows, next_cursor, previous_cursor, params)
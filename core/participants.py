@@ -0,0 +1,85 @@
+"""Who may use a project's chat.
+
+Only the project's client and its hired freelancer can read or send
+messages. The pair is cached per project so the messaging endpoints, which
+are hit on every poll, authorize with one cache lookup instead of loading
+the project and querying its proposals.
+
+Entries are written when a proposal is accepted (the ``proposal.accepted``
+event) and dropped when an accepted proposal changes status or is deleted
+(see ``core.signals``). Deleted projects drop their entry too. A miss is recomputed with one query.
+
+Only hired pairs are cached. A project without a freelancer is looked up
+every time, so a hire made by another process is seen right away instead of
+after a cached "nobody hired" expires. Invalidation still has to reach every
+process, so run several workers against a shared cache (see ``CACHES``).
+"""
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.http import Http404
+
+
+CACHE_KEY = 'project-participants:{}'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+Participants = namedtuple('Participants', 'client_id freelancer_id')
+
+
+def _load_participants(project_id):
+    from .models import Project, Proposal
+
+    hired = Proposal.objects.filter(project=OuterRef('pk'), status='accepted').values('freelancer_id')[:1]
+    row = Project.objects.filter(pk=project_id).values_list('client_id', Subquery(hired)).first()
+    return Participants(*row) if row is not None else None
+
+
+def _is_hired(participants):
+    return participants is not None and participants.freelancer_id is not None
+
+
+def get_participants(project_id):
+    """The project's client and hired freelancer ids, or None if there is no such project"""
+    key = CACHE_KEY.format(project_id)
+    participants = cache.get(key)
+    if not _is_hired(participants):
+        participants = _load_participants(project_id)
+        # Missing and unassigned projects are not cached so a new project or hire is seen right away
+        if _is_hired(participants):
+            cache.set(key, participants, CACHE_TIMEOUT)
+    return participants
+
+
+async def aget_participants(project_id):
+    participants = await cache.aget(CACHE_KEY.format(project_id))
+    if not _is_hired(participants):
+        participants = await sync_to_async(get_participants)(project_id)
+    return participants
+
+
+def _check(participants, user):
+    if participants is None:
+        raise Http404('No Project matches the given query.')
+    return user.id in participants
+
+
+def can_message(project_id, user):
+    """Whether ``user`` may use the project's chat; raises Http404 for unknown projects"""
+    return _check(get_participants(project_id), user)
+
+
+async def acan_message(project_id, user):
+    return _check(await aget_participants(project_id), user)
+
+
+def cache_participants(project_id, client_id, freelancer_id):
+    """Prime the cache with a newly hired freelancer; call once the hire has committed"""
+    cache.set(CACHE_KEY.format(project_id), Participants(client_id, freelancer_id), CACHE_TIMEOUT)
+
+
+def invalidate_participants(project_id):
+    key = CACHE_KEY.format(project_id)
+    transaction.on_commit(lambda: cache.delete(key))
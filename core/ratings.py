@@ -0,0 +1,103 @@
+"""Incremental rating maintenance for freelancer profiles.
+
+``FreelancerProfile`` keeps a running ``rating_sum`` next to ``review_count``
+so each review write is an O(1) ``UPDATE`` with ``F()`` expressions instead of
+re-aggregating every review. ``reconcile_ratings`` recomputes the columns from
+``Review`` in bulk to repair any drift.
+"""
+from django.db import transaction
+from django.db.models import Case, When, Value, F, Sum, Count, FloatField, DecimalField
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from freelancer.models import FreelancerProfile
+
+
+def _average_expression():
+    return Case(
+        When(review_count=0, then=Value(0)),
+        default=Round(Cast(F('rating_sum'), FloatField()) / F('review_count'), 2),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def apply_rating_delta(freelancer_id, sum_delta, count_delta):
+    """Shift a freelancer's running rating totals and refresh the average"""
+    if not sum_delta and not count_delta:
+        return
+    profiles = FreelancerProfile.objects.filter(user_id=freelancer_id)
+    with transaction.atomic():
+        # The first UPDATE locks the row, so the average below sees our totals
+        profiles.update(
+            rating_sum=F('rating_sum') + sum_delta,
+            review_count=F('review_count') + count_delta,
+            # Lets core.candidates pick up the new rating
+            updated_at=timezone.now(),
+        )
+        profiles.update(avg_rating=_average_expression())
+
+
+def review_added(review):
+    apply_rating_delta(review.freelancer_id, review.rating, 1)
+
+
+def review_removed(review):
+    apply_rating_delta(review.freelancer_id, -review.rating, -1)
+
+
+def review_changed(review, old_freelancer_id, old_rating):
+    """Move a review's contribution when its rating or freelancer is edited"""
+    if old_freelancer_id == review.freelancer_id:
+        apply_rating_delta(review.freelancer_id, review.rating - old_rating, 0)
+    else:
+        apply_rating_delta(old_freelancer_id, -old_rating, -1)
+        apply_rating_delta(review.freelancer_id, review.rating, 1)
+
+
+def reconcile_ratings(batch_size=1000, dry_run=False):
+    """
+    Recompute rating totals for every profile from the Review table, one
+    batch of profiles at a time. Returns (checked, fixed) counts.
+    """
+    from .models import Review
+
+    checked = fixed = 0
+    last_id = 0
+    while True:
+        profiles = list(
+            FreelancerProfile.objects.filter(user_id__gt=last_id)
+            .order_by('user_id')
+            .only('user_id', 'rating_sum', 'review_count', 'avg_rating')[:batch_size]
+        )
+        if not profiles:
+            break
+        last_id = profiles[-1].user_id
+
+        totals = {
+            row['freelancer']: row
+            for row in Review.objects.filter(freelancer__in=[p.user_id for p in profiles])
+            .order_by()
+            .values('freelancer')
+            .annotate(total=Sum('rating'), count=Count('id'))
+        }
+
+        stale = []
+        for profile in profiles:
+            row = totals.get(profile.user_id, {'total': 0, 'count': 0})
+            avg = round(row['total'] / row['count'], 2) if row['count'] else 0
+            if (profile.rating_sum, profile.review_count) != (row['total'], row['count']) \
+                    or round(float(profile.avg_rating), 2) != avg:
+                profile.rating_sum = row['total']
+                profile.review_count = row['count']
+                profile.avg_rating = avg
+                stale.append(profile)
+
+        checked += len(profiles)
+        fixed += len(stale)
+        if stale and not dry_run:
+            now = timezone.now()
+            for profile in stale:
+                profile.updated_at = now
+            FreelancerProfile.objects.bulk_update(stale, ['rating_sum', 'review_count', 'avg_rating', 'updated_at'])
+
+    return checked, fixed
@@ -0,0 +1,189 @@
+"""Real-time delivery of chat messages.
+
+New ``Message`` rows are published to a broker channel per project and pushed
+to connected clients by the streaming endpoints in ``core.api_views``. The
+broker is chosen with ``settings.MESSAGE_BROKER_BACKEND``:
+
+* ``InMemoryBroker`` delivers within one process (dev server, tests or a
+  single ASGI worker).
+* ``RedisBroker`` fans out across workers through Redis pub/sub and needs the
+  optional ``redis`` package.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .serializers import message_row, serialize_message
+
+
+def project_channel(project_id):
+    return f'project-messages-{project_id}'
+
+
+def message_event(message):
+    """Payload pushed to subscribers for a newly created message"""
+    return serialize_message(message_row(message))
+
+
+class BaseSubscription:
+    """A live subscription to one channel, owned by a single async consumer"""
+
+    async def ready(self):
+        """Wait until publishes are guaranteed to reach this subscription"""
+
+    async def get(self, timeout=None):
+        """Wait for the next payload, returns None if ``timeout`` expires first"""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class BaseBroker:
+    """Interface every message broker implements"""
+
+    def publish(self, channel, payload):
+        """Send a JSON-serializable payload to every subscriber (sync, thread-safe)"""
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Return a subscription; must be called from the consumer's event loop"""
+        raise NotImplementedError
+
+
+class InMemorySubscription(BaseSubscription):
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def deliver(self, payload):
+        # Called from any thread; hand the payload over to the consumer's loop
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, payload)
+        except RuntimeError:
+            # The consumer's event loop has already shut down
+            self.close()
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class InMemoryBroker(BaseBroker):
+    """Process-local broker, also used as the test stand-in for Redis"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(payload)
+
+    def subscribe(self, channel):
+        subscription = InMemorySubscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class RedisSubscription(BaseSubscription):
+    def __init__(self, client, channel):
+        self.client = client
+        self.channel = channel
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.subscribed = False
+
+    async def ready(self):
+        if not self.subscribed:
+            await self.pubsub.subscribe(self.channel)
+            self.subscribed = True
+
+    async def get(self, timeout=None):
+        await self.ready()
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - loop.time(), 0)
+            message = await self.pubsub.get_message(timeout=remaining)
+            if message is not None:
+                return json.loads(message['data'])
+            if deadline is not None and loop.time() >= deadline:
+                return None
+
+    def close(self):
+        # aclose() needs the loop; schedule it rather than block the caller
+        asyncio.ensure_future(self.pubsub.aclose())
+
+
+class RedisBroker(BaseBroker):
+    """Cross-process broker on Redis pub/sub (``settings.MESSAGE_BROKER_URL``)"""
+
+    def __init__(self):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requires the "redis" package.')
+        url = getattr(settings, 'MESSAGE_BROKER_URL', 'redis://localhost:6379/0')
+        self.publisher = redis.Redis.from_url(url)
+        self.async_client = redis.asyncio.Redis.from_url(url)
+
+    def publish(self, channel, payload):
+        self.publisher.publish(channel, json.dumps(payload))
+
+    def subscribe(self, channel):
+        return RedisSubscription(self.async_client, channel)
+
+
+class WaiterSlots:
+    """Thread-safe cap on how many long-poll requests one worker parks at once"""
+
+    def __init__(self):
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        limit = getattr(settings, 'LONG_POLL_MAX_WAITERS', 500)
+        with self._lock:
+            if self._count >= limit:
+                return False
+            self._count += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._count -= 1
+
+
+long_poll_slots = WaiterSlots()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """Return the configured message broker instance"""
+    path = getattr(settings, 'MESSAGE_BROKER_BACKEND', 'core.realtime.InMemoryBroker')
+    return import_string(path)()
@@ -0,0 +1,174 @@
+"""Best-match projects for the freelancer dashboard.
+
+``rebuild_project_recommendations()`` (the ``rebuild_recommendations``
+command, meant to run periodically) builds the matching model from
+``core.matching``, scores every freelancer against every open project in
+dense NumPy blocks, and replaces ``ProjectRecommendation`` with each
+freelancer's top ``RECOMMENDATION_TOP_K`` projects. It skips projects they
+have already bid on and scores below ``RECOMMENDATION_MIN_SCORE``.
+
+Newly posted projects are scored against every freelancer with the saved
+model and added to the lists of freelancers they beat the K-th entry for,
+capped at ``RECOMMENDATION_FANOUT``, so they show up before the next
+rebuild. Submitting a proposal removes that project from the freelancer's
+list.
+
+The dashboard reads its matches from the table with one indexed query. It
+falls back to the newest open projects when a freelancer has fewer matches
+than it shows, e.g. because they joined after the last rebuild.
+"""
+import math
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .matching import build_matching_model, get_matching_model, np
+from .models import Project, Proposal, ProjectRecommendation
+
+
+def get_top_k():
+    return getattr(settings, 'RECOMMENDATION_TOP_K', 20)
+
+
+def get_min_score():
+    return getattr(settings, 'RECOMMENDATION_MIN_SCORE', 0.1)
+
+
+def _log_budgets(budgets):
+    return np.log(np.maximum(np.array(budgets, dtype=np.float32), 1))
+
+
+def _open_projects():
+    rows = list(Project.objects.filter(status='open').order_by('pk').values_list('pk', 'title', 'description', 'budget'))
+    skills = {}
+    links = Project.skills.through.objects.filter(project__status='open').values_list('project_id', 'skill_id')
+    for project_id, skill_id in links.iterator():
+        skills.setdefault(project_id, []).append(skill_id)
+    return rows, skills
+
+
+def _top_k(model, project_terms, project_skills, log_budgets, bids, top_k, batch_size, project_batch_size):
+    """Column indices and scores of each freelancer's best ``top_k`` projects, best first"""
+    n_freelancers, n_projects = len(model.freelancer_ids), project_terms.n_rows
+    bid_rows, bid_cols = bids
+    best_cols = np.full((n_freelancers, top_k), -1, dtype=np.int64)
+    best_scores = np.full((n_freelancers, top_k), -np.inf, dtype=np.float32)
+    for start in range(0, n_freelancers, batch_size):
+        stop = min(start + batch_size, n_freelancers)
+        scores, cols = best_scores[start:stop], best_cols[start:stop]
+        in_rows = (bid_rows >= start) & (bid_rows < stop)
+        for p_start in range(0, n_projects, project_batch_size):
+            p_stop = min(p_start + project_batch_size, n_projects)
+            block = model.score_block(
+                start, stop, project_terms.dense(p_start, p_stop), project_skills.dense(p_start, p_stop),
+                log_budgets[p_start:p_stop],
+            )
+            # Never recommend a project the freelancer has already bid on
+            hit = in_rows & (bid_cols >= p_start) & (bid_cols < p_stop)
+            block[bid_rows[hit] - start, bid_cols[hit] - p_start] = -np.inf
+
+            scores = np.concatenate([scores, block], axis=1)
+            cols = np.concatenate([cols, np.broadcast_to(np.arange(p_start, p_stop), block.shape)], axis=1)
+            keep = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            scores = np.take_along_axis(scores, keep, axis=1)
+            cols = np.take_along_axis(cols, keep, axis=1)
+        order = np.argsort(-scores, axis=1)
+        best_scores[start:stop] = np.take_along_axis(scores, order, axis=1)
+        best_cols[start:stop] = np.take_along_axis(cols, order, axis=1)
+    return best_cols, best_scores
+
+
+def _insert_recommendations(rows, batch_size=10000):
+    """``(freelancer_id, project_id, score)`` rows via executemany; model instances would dominate the rebuild"""
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(column) for column in ('freelancer_id', 'project_id', 'score', 'created_at'))
+    sql = f'INSERT INTO {qn(ProjectRecommendation._meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s)'
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, [row + (now,) for row in rows[start:start + batch_size]])
+
+
+def rebuild_project_recommendations(batch_size=1024, project_batch_size=4096):
+    """Recompute every freelancer's matches and save the model; returns the number of rows written"""
+    model = build_matching_model()
+    top_k, min_score = get_top_k(), get_min_score()
+    projects, project_skills = _open_projects()
+    project_ids = np.array([row[0] for row in projects], dtype=np.int64)
+    terms, skills = model.vectorize([(f'{title} {description}', project_skills.get(pk, ()))
+                                     for pk, title, description, _ in projects])
+
+    project_index = {int(pk): i for i, pk in enumerate(project_ids)}
+    pairs = [
+        (model.freelancer_index[freelancer_id], project_index[project_id])
+        for freelancer_id, project_id in Proposal.objects.filter(project__status='open')
+        .values_list('freelancer_id', 'project_id').iterator()
+        if freelancer_id in model.freelancer_index
+    ]
+    bids = (np.array([p[0] for p in pairs], dtype=np.int64), np.array([p[1] for p in pairs], dtype=np.int64))
+
+    if len(projects):
+        cols, scores = _top_k(model, terms, skills, _log_budgets([row[3] for row in projects]), bids,
+                              min(top_k, len(projects)), batch_size, project_batch_size)
+    else:
+        cols = np.empty((len(model.freelancer_ids), 0), dtype=np.int64)
+        scores = np.empty((len(model.freelancer_ids), 0), dtype=np.float32)
+
+    keep = scores > min_score
+    rows, ranks = np.nonzero(keep)
+    recommendations = list(zip(
+        model.freelancer_ids[rows].tolist(), project_ids[cols[rows, ranks]].tolist(), scores[rows, ranks].tolist(),
+    ))
+    with transaction.atomic():
+        ProjectRecommendation.objects.all().delete()
+        _insert_recommendations(recommendations)
+
+    # A new project only joins a full list if it beats the K-th match
+    full = keep.sum(axis=1) >= top_k
+    thresholds = np.full(len(model.freelancer_ids), min_score, dtype=np.float32)
+    if scores.shape[1]:
+        thresholds[full] = scores[full, -1]
+    model.extras['recommendation_thresholds'] = thresholds
+    model.save()
+    return len(recommendations)
+
+
+def project_posted(project):
+    """Add a newly posted project to the lists of the freelancers it suits best"""
+    model = get_matching_model()
+    if model is None or project.status != 'open':
+        return 0
+    skill_ids = list(Project.skills.through.objects.filter(project_id=project.pk).values_list('skill_id', flat=True))
+    terms, skills = model.vectorize([(f'{project.title} {project.description}', skill_ids)])
+    scores = model.score_project(terms, skills, math.log(max(float(project.budget), 1)))
+
+    thresholds = model.extras.get('recommendation_thresholds')
+    if thresholds is None or len(thresholds) != len(scores):
+        thresholds = get_min_score()
+    candidates = np.flatnonzero(scores > np.maximum(thresholds, get_min_score()))
+    fanout = getattr(settings, 'RECOMMENDATION_FANOUT', 1000)
+    if len(candidates) > fanout:
+        candidates = candidates[np.argpartition(-scores[candidates], fanout - 1)[:fanout]]
+    ProjectRecommendation.objects.bulk_create([
+        ProjectRecommendation(freelancer_id=int(model.freelancer_ids[i]), project_id=project.pk, score=float(scores[i]))
+        for i in candidates
+    ], ignore_conflicts=True)
+    return len(candidates)
+
+
+def proposal_submitted(freelancer_id, project_id):
+    ProjectRecommendation.objects.filter(freelancer_id=freelancer_id, project_id=project_id).delete()
+
+
+def recommended_projects(user, limit=3):
+    """The freelancer's best open matches, topped up with the newest open projects they haven't bid on"""
+    matches = ProjectRecommendation.objects.filter(
+        freelancer=user, project__status='open',
+    ).select_related('project').order_by('-score')[:limit]
+    projects = [match.project for match in matches]
+    if len(projects) < limit:
+        projects += Project.objects.filter(status='open').exclude(
+            proposals__freelancer=user
+        ).exclude(pk__in=[project.pk for project in projects]).order_by('-created_at')[:limit - len(projects)]
+    return projects
@@ -0,0 +1,166 @@
+"""Full-text search for projects.
+
+Views never talk to the index directly: they call ``get_search_backend()`` and
+use whichever backend ``settings.PROJECT_SEARCH_BACKEND`` points at. The
+SQLite backend keeps an FTS5 inverted index in sync with ``Project`` rows,
+while ``DatabaseSearchBackend`` is a plain ``icontains`` fallback for
+databases without FTS5.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Lookup, Q, Value, FloatField
+from django.utils.module_loading import import_string
+
+from .models import Project, ProjectSearchEntry
+
+
+FTS_TABLE = 'core_project_fts'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class Match(Lookup):
+    """``document__match=expression``: an FTS5 full-text query"""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+ProjectSearchEntry._meta.get_field('document').register_lookup(Match)
+
+
+class BaseSearchBackend:
+    """Interface every project search backend implements"""
+
+    def index_project(self, project):
+        """Add or refresh a single project in the index"""
+        raise NotImplementedError
+
+    def remove_project(self, project_id):
+        """Drop a project from the index"""
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=2000):
+        """Re-index every project, returns the number of indexed rows"""
+        raise NotImplementedError
+
+    def search(self, query, status=None, min_budget=None, max_budget=None):
+        """
+        Return a Project queryset matching ``query`` and the filters, annotated
+        with ``search_rank`` (lower is better) for relevance ordering.
+        """
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Unindexed fallback that filters with icontains"""
+
+    def index_project(self, project):
+        pass
+
+    def remove_project(self, project_id):
+        pass
+
+    def rebuild(self, batch_size=2000):
+        return 0
+
+    def search(self, query, status=None, min_budget=None, max_budget=None):
+        projects = Project.objects.all()
+        if status:
+            projects = projects.filter(status=status)
+        if min_budget is not None:
+            projects = projects.filter(budget__gte=min_budget)
+        if max_budget is not None:
+            projects = projects.filter(budget__lte=max_budget)
+        if query:
+            projects = projects.filter(
+                Q(title__icontains=query) | Q(description__icontains=query)
+            )
+        return projects.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    FTS5 index keyed by project id (rowid). Status and budget are stored as
+    UNINDEXED columns so the filters are evaluated inside the index query.
+    """
+
+    def index_project(self, project):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [project.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, status, budget) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [project.pk, project.title, project.description, project.status, float(project.budget)]
+            )
+
+    def remove_project(self, project_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [project_id])
+
+    def rebuild(self, batch_size=2000):
+        count = 0
+        # One transaction: in autocommit mode SQLite would commit every row
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            rows = Project.objects.order_by().values_list(
+                'id', 'title', 'description', 'status', 'budget'
+            ).iterator(chunk_size=batch_size)
+            batch = []
+            for row in rows:
+                batch.append((row[0], row[1], row[2], row[3], float(row[4])))
+                if len(batch) >= batch_size:
+                    count += self._insert_batch(cursor, batch)
+                    batch = []
+            if batch:
+                count += self._insert_batch(cursor, batch)
+            # Merge the b-tree segments written above into one for faster reads
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        return count
+
+    def _insert_batch(self, cursor, batch):
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, status, budget) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            batch
+        )
+        return len(batch)
+
+    def search(self, query, status=None, min_budget=None, max_budget=None):
+        match = build_match_expression(query)
+        if not match:
+            return DatabaseSearchBackend().search(None, status, min_budget, max_budget)
+
+        # Join the index once: MATCH runs a single time and each hit carries its rank
+        projects = Project.objects.filter(search_entry__document__match=match)
+        if status:
+            projects = projects.filter(search_entry__status=status)
+        if min_budget is not None:
+            projects = projects.filter(search_entry__budget__gte=float(min_budget))
+        if max_budget is not None:
+            projects = projects.filter(search_entry__budget__lte=float(max_budget))
+        return projects.annotate(search_rank=F('search_entry__rank'))
+
+
+def build_match_expression(query):
+    """
+    Turn free text into an FTS5 MATCH expression. Every word becomes a quoted
+    prefix term, so "djan rest" matches "Django REST framework".
+    """
+    if not query:
+        return ''
+    tokens = TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """Return the configured search backend instance"""
+    path = getattr(settings, 'PROJECT_SEARCH_BACKEND', 'core.search.DatabaseSearchBackend')
+    return import_string(path)()
@@ -0,0 +1,275 @@
+"""Bulk synthetic data for load tests and benchmarks.
+
+``seed_bulk`` writes users, profiles, projects, proposals, messages and
+reviews with ``bulk_create``, one transaction per batch of projects, so it
+never calls ``save()`` or fires signals. The derived tables (search index,
+``UserStats`` and freelancer ratings) are rebuilt in bulk at the end.
+
+Rows carry made-up history, but ``bulk_create`` still stamps ``auto_now``
+fields with now(). ``bulk_create_with_timestamps`` writes the intended values
+back right after the insert, without touching the model fields, so
+concurrent saves elsewhere in the process are unaffected.
+
+Activity follows long-tailed distributions: a few clients post many projects,
+a few freelancers bid on a lot of them, budgets are log-normal and ratings
+lean towards 4-5 stars. The same ``seed`` always produces the same rows.
+"""
+import math
+import random
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from client.models import ClientProfile
+from freelancer.models import FreelancerProfile
+from users.models import User
+
+from .models import Project, Proposal, Message, Review
+from .skills import get_or_create_skills
+
+
+SKILLS = [
+    'Python', 'JavaScript', 'React', 'Django', 'Node.js', 'Angular',
+    'Vue.js', 'PHP', 'Laravel', 'WordPress', 'HTML/CSS', 'Bootstrap',
+    'Java', 'Spring Boot', 'Android', 'iOS', 'Swift', 'Flutter',
+]
+
+TITLES = [
+    'E-commerce Website Development', 'Mobile App Development', 'Website Redesign',
+    'Custom CRM System', 'Portfolio Website', 'Blog Platform Development',
+    'API Integration Project', 'Social Media Dashboard', 'Inventory Management System',
+    'Online Learning Platform', 'Real Estate Listing Website', 'Restaurant Ordering System',
+]
+
+PROJECTS_PER_CLIENT = 20
+PROJECTS_PER_FREELANCER = 10
+PROJECT_STATUS_WEIGHTS = {'open': 60, 'in_progress': 25, 'completed': 15}
+RATING_WEIGHTS = {1: 2, 2: 3, 3: 8, 4: 25, 5: 62}
+MEAN_PROPOSALS_PER_PROJECT = 3
+MAX_PROPOSALS_PER_PROJECT = 15
+MEAN_MESSAGES_PER_CONVERSATION = 8
+HISTORY_DAYS = 365
+
+DEFAULT_PASSWORD = 'testpass123'
+
+
+def bulk_create_with_timestamps(model, objs):
+    """
+    ``bulk_create`` that keeps the ``auto_now`` / ``auto_now_add`` values set
+    on ``objs``: the insert stamps them with now(), so one ``executemany``
+    writes the intended values back by primary key.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    stamps = [[getattr(obj, field.attname) for field in fields] for obj in objs]
+    objs = model.objects.bulk_create(objs)
+    if not fields or not objs:
+        return objs
+
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f'{quote(field.column)} = %s' for field in fields)
+    params = []
+    for obj, values in zip(objs, stamps):
+        for field, value in zip(fields, values):
+            setattr(obj, field.attname, value)
+        params.append([field.get_db_prep_save(value, connection) for field, value in zip(fields, values)] + [obj.pk])
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {quote(model._meta.db_table)} SET {assignments} WHERE {quote(model._meta.pk.column)} = %s',
+            params,
+        )
+    return objs
+
+
+class BulkSeeder:
+    def __init__(self, seed=0, batch_size=5000, prefix='bulk', password=DEFAULT_PASSWORD, progress=None):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.prefix = prefix
+        # Hash once; PBKDF2 per user would dominate the run time
+        self.password_hash = make_password(password)
+        self.progress = progress or (lambda label, done, total: None)
+        self.now = timezone.now()
+        self._skill_ids = None
+
+    @property
+    def skill_ids(self):
+        if self._skill_ids is None:
+            self._skill_ids = {skill.name: skill.pk for skill in get_or_create_skills(SKILLS)}
+        return self._skill_ids
+
+    def _sample_skills(self, low, high):
+        return self.rng.sample(SKILLS, self.rng.randint(low, high))
+
+    def _poisson(self, mean, low, high):
+        # Knuth's method is fine for the small means used here
+        limit, k, p = math.exp(-mean), 0, self.rng.random()
+        while p > limit:
+            k += 1
+            p *= self.rng.random()
+        return min(max(k, low), high)
+
+    def _popularity(self, count, alpha):
+        """Cumulative Pareto weights so a few users account for most activity"""
+        return list(accumulate(self.rng.paretovariate(alpha) for _ in range(count)))
+
+    def _after(self, moment, max_days):
+        return min(moment + timedelta(seconds=self.rng.uniform(0, max_days * 86400)), self.now)
+
+    def create_users(self, role, count):
+        start = User.objects.filter(username__startswith=f'{self.prefix}{role}').count()
+        created = []
+        for offset in range(0, count, self.batch_size):
+            batch = []
+            for i in range(start + offset, start + min(offset + self.batch_size, count)):
+                joined = self.now - timedelta(days=self.rng.uniform(HISTORY_DAYS, 2 * HISTORY_DAYS))
+                batch.append(User(
+                    username=f'{self.prefix}{role}{i + 1}', user_type=role, password=self.password_hash,
+                    first_name=role.title(), last_name=str(i + 1), email=f'{self.prefix}{role}{i + 1}@example.com',
+                    date_joined=joined,
+                ))
+            with transaction.atomic():
+                users = User.objects.bulk_create(batch)
+                if role == 'client':
+                    ClientProfile.objects.bulk_create(
+                        [ClientProfile(user=user, company_name=f'Company {user.username}') for user in users]
+                    )
+                else:
+                    skills = [self._sample_skills(1, 5) for _ in users]
+                    FreelancerProfile.objects.bulk_create([
+                        FreelancerProfile(
+                            user=user, skills=', '.join(names),
+                            bio='Experienced freelancer with skills in various technologies',
+                        )
+                        for user, names in zip(users, skills)
+                    ])
+                    # bulk_create skips the post_save signal that normally links skill_tags
+                    Link = FreelancerProfile.skill_tags.through
+                    Link.objects.bulk_create([
+                        Link(freelancerprofile_id=user.pk, skill_id=self.skill_ids[name])
+                        for user, names in zip(users, skills) for name in names
+                    ])
+            created.extend(users)
+            self.progress(f'{role}s', len(created), count)
+        return created
+
+    def create_projects(self, count, clients, freelancers):
+        client_weights = self._popularity(len(clients), 1.5)
+        freelancer_weights = self._popularity(len(freelancers), 1.2)
+        statuses = list(PROJECT_STATUS_WEIGHTS)
+        status_weights = list(accumulate(PROJECT_STATUS_WEIGHTS.values()))
+        ratings = list(RATING_WEIGHTS)
+        rating_weights = list(accumulate(RATING_WEIGHTS.values()))
+        totals = {'projects': 0, 'proposals': 0, 'messages': 0, 'reviews': 0}
+
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            projects, skills = [], []
+            for i, client in enumerate(self.rng.choices(clients, cum_weights=client_weights, k=size)):
+                created = self.now - timedelta(seconds=self.rng.uniform(0, HISTORY_DAYS * 86400))
+                budget = min(max(round(self.rng.lognormvariate(7.5, 0.8)), 50), 100000)
+                skills.append(self._sample_skills(2, 5))
+                projects.append(Project(
+                    client=client,
+                    title=f'{self.rng.choice(TITLES)} #{start + i + 1}',
+                    description=f'This project requires expertise in {", ".join(skills[-1])}.',
+                    budget=Decimal(budget),
+                    status=self.rng.choices(statuses, cum_weights=status_weights)[0],
+                    created_at=created,
+                    updated_at=self._after(created, 30),
+                ))
+                if projects[-1].status == 'completed':
+                    projects[-1].completed_at = projects[-1].updated_at
+
+            with transaction.atomic():
+                projects = bulk_create_with_timestamps(Project, projects)
+                Link = Project.skills.through
+                Link.objects.bulk_create([
+                    Link(project_id=project.pk, skill_id=self.skill_ids[name])
+                    for project, names in zip(projects, skills) for name in names
+                ])
+                proposals, messages, reviews = [], [], []
+                for project in projects:
+                    size = self._poisson(MEAN_PROPOSALS_PER_PROJECT, 1, MAX_PROPOSALS_PER_PROJECT)
+                    bidders = list(dict.fromkeys(
+                        self.rng.choices(freelancers, cum_weights=freelancer_weights, k=size)
+                    ))
+                    hired = bidders[0] if project.status != 'open' else None
+                    for freelancer in bidders:
+                        if hired is None:
+                            status = 'pending'
+                        else:
+                            status = 'accepted' if freelancer is hired else 'rejected'
+                        submitted = self._after(project.created_at, 7)
+                        decided = self._after(submitted, 7)
+                        proposals.append(Proposal(
+                            project=project, freelancer=freelancer, status=status,
+                            cover_letter='I have delivered similar projects and can start right away.',
+                            bid_amount=(project.budget * Decimal(str(round(self.rng.uniform(0.7, 1.1), 2))))
+                            .quantize(Decimal('0.01')),
+                            created_at=submitted, updated_at=decided,
+                            accepted_at=decided if status == 'accepted' else None,
+                        ))
+                    if hired is None:
+                        continue
+                    sent = project.updated_at
+                    for n in range(self._poisson(MEAN_MESSAGES_PER_CONVERSATION, 0, 100)):
+                        sent = self._after(sent, 1)
+                        messages.append(Message(
+                            project=project, sender=project.client if n % 2 == 0 else hired,
+                            content=f'Progress update {n + 1}', created_at=sent,
+                        ))
+                    if project.status == 'completed':
+                        reviews.append(Review(
+                            project=project, client=project.client, freelancer=hired,
+                            rating=self.rng.choices(ratings, cum_weights=rating_weights)[0],
+                            feedback='Great work!', created_at=self._after(project.updated_at, 7),
+                        ))
+                bulk_create_with_timestamps(Proposal, proposals)
+                bulk_create_with_timestamps(Message, messages)
+                bulk_create_with_timestamps(Review, reviews)
+
+            totals['projects'] += len(projects)
+            totals['proposals'] += len(proposals)
+            totals['messages'] += len(messages)
+            totals['reviews'] += len(reviews)
+            self.progress('projects', totals['projects'], count)
+        return totals
+
+    def rebuild_derived(self):
+        """Bring the search index, counters and ratings in line with the new rows"""
+        from .ratings import reconcile_ratings
+        from .search import get_search_backend
+        from .stats import rebuild_user_stats
+
+        get_search_backend().rebuild(batch_size=self.batch_size)
+        self.progress('search index', 1, 1)
+        rebuild_user_stats(batch_size=self.batch_size)
+        self.progress('user stats', 1, 1)
+        reconcile_ratings(batch_size=self.batch_size)
+        self.progress('ratings', 1, 1)
+
+
+def seed_bulk(projects, seed=0, batch_size=5000, prefix='bulk', clients=None, freelancers=None,
+              password=DEFAULT_PASSWORD, progress=None, rebuild=True):
+    """
+    Create ``projects`` projects plus users and activity in proportion.
+    ``progress(label, done, total)`` is called after every batch. Returns
+    the row counts that were created.
+    """
+    seeder = BulkSeeder(seed=seed, batch_size=batch_size, prefix=prefix, password=password, progress=progress)
+    clients = clients or max(projects // PROJECTS_PER_CLIENT, 1)
+    freelancers = freelancers or max(projects // PROJECTS_PER_FREELANCER, MAX_PROPOSALS_PER_PROJECT)
+    client_users = seeder.create_users('client', clients)
+    freelancer_users = seeder.create_users('freelancer', freelancers)
+    totals = seeder.create_projects(projects, client_users, freelancer_users)
+    if rebuild:
+        seeder.rebuild_derived()
+    return dict(totals, clients=clients, freelancers=freelancers)
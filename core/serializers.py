@@ -0,0 +1,90 @@
+"""Wire format for chat messages.
+
+The messaging endpoints read message rows with ``values()`` so no model
+instances or sender rows are loaded, then shape them with
+``serialize_message``. ``?timestamps=`` picks how ``created_at`` is written:
+
+* ``display`` (default): ``'03:04 PM'``, what the chat UI shows
+* ``iso``: ISO 8601
+* ``epoch``: integer milliseconds since the Unix epoch
+
+Responses are JSON, or MessagePack when the client sends
+``Accept: application/msgpack`` and the optional ``msgpack`` package is
+installed.
+"""
+import os
+
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+MESSAGE_FIELDS = ('id', 'content', 'sender_id', 'created_at', 'attachment', 'attachment_name')
+
+TIMESTAMP_FORMATS = {
+    'display': lambda value: value.strftime('%I:%M %p'),
+    'iso': lambda value: value.isoformat(),
+    'epoch': lambda value: int(value.timestamp() * 1000),
+}
+
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+
+
+def message_values(queryset):
+    """Only the columns a serialized message needs, as dicts"""
+    return queryset.values(*MESSAGE_FIELDS)
+
+
+def message_row(message):
+    """The ``message_values`` row for an instance already in memory"""
+    return {
+        'id': message.id,
+        'content': message.content,
+        'sender_id': message.sender_id,
+        'created_at': message.created_at,
+        'attachment': message.attachment.name,
+        'attachment_name': message.attachment_name,
+    }
+
+
+def attachment_url(row):
+    """Access-checked download URL, ending in the original file name"""
+    if not row['attachment']:
+        return None
+    filename = row['attachment_name'] or os.path.basename(row['attachment'])
+    return reverse('core:message_attachment', args=[row['id'], filename])
+
+
+def serialize_message(row, user_id=None, timestamps='display'):
+    """Shape a message row; ``is_sent`` is only included when ``user_id`` is given"""
+    data = {
+        'id': row['id'],
+        'content': row['content'],
+        'sender_id': row['sender_id'],
+        'created_at': TIMESTAMP_FORMATS[timestamps](row['created_at']),
+        'attachment': attachment_url(row),
+    }
+    if user_id is not None:
+        data['is_sent'] = row['sender_id'] == user_id
+    return data
+
+
+def get_timestamp_format(request):
+    """The requested timestamp format, or None if it is not one we support"""
+    timestamps = request.GET.get('timestamps', 'display')
+    return timestamps if timestamps in TIMESTAMP_FORMATS else None
+
+
+def encode_response(request, data):
+    """JSON response, or MessagePack if the client asked for it and it is available"""
+    if msgpack is not None and MSGPACK_CONTENT_TYPE in request.headers.get('Accept', ''):
+        response = HttpResponse(msgpack.packb(data), content_type=MSGPACK_CONTENT_TYPE)
+    else:
+        response = JsonResponse(data)
+    patch_vary_headers(response, ['Accept'])
+    return response
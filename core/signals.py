@@ -0,0 +1,167 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from client.models import ClientProfile
+from freelancer.models import FreelancerProfile
+from . import events
+from .models import Project, Proposal, Review, Message, AttachmentUpload
+from .candidates import freelancers_changed
+from .hiring import proposal_event
+from .participants import cache_participants, invalidate_participants
+from .ratings import review_removed
+from .stats import project_changed, proposal_changed
+from .recommendations import project_posted, proposal_submitted
+from .realtime import get_broker, project_channel, message_event
+from .search import get_search_backend
+from .skills import sync_freelancer_skills
+from .thumbnails import schedule_thumbnails
+from .uploads import discard_partial_file
+
+
+@receiver(post_save, sender=Project)
+def index_project(sender, instance, **kwargs):
+    """Keep the search index in sync when a project is created or updated"""
+    get_search_backend().index_project(instance)
+
+
+@receiver(post_delete, sender=Project)
+def unindex_project(sender, instance, **kwargs):
+    """Remove deleted projects from the search index"""
+    get_search_backend().remove_project(instance.pk)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    """Take deleted reviews (including cascades) out of the freelancer's rating"""
+    review_removed(instance)
+
+
+@receiver(post_delete, sender=Proposal)
+def remove_proposal_stats(sender, instance, **kwargs):
+    """Take deleted proposals (including cascades) out of the dashboard counters"""
+    proposal_changed(instance, instance.status, None)
+
+
+@receiver(post_delete, sender=Project)
+def remove_project_stats(sender, instance, **kwargs):
+    """Take deleted projects out of the client's dashboard counters"""
+    project_changed(instance, instance.status, None)
+
+
+@receiver(post_save, sender=Proposal)
+def update_participants(sender, instance, created, update_fields=None, **kwargs):
+    """Drop the cached chat participants when a hire is undone (hires prime it, see below)"""
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    # Proposal.save() records the new status only after post_save has run
+    previous = getattr(instance, '_saved_status', None)
+    if instance.status != 'accepted' and not created and previous in ('accepted', None):
+        invalidate_participants(instance.project_id)
+
+
+@receiver(post_delete, sender=Proposal)
+def remove_participant(sender, instance, **kwargs):
+    if instance.status == 'accepted':
+        invalidate_participants(instance.project_id)
+
+
+@receiver(post_delete, sender=Project)
+def remove_participants(sender, instance, **kwargs):
+    invalidate_participants(instance.pk)
+
+
+@receiver(post_delete, sender=AttachmentUpload)
+def remove_partial_upload(sender, instance, **kwargs):
+    """Completed, abandoned and cascaded uploads all leave a partial file behind"""
+    discard_partial_file(instance)
+
+
+@receiver(post_save, sender=FreelancerProfile)
+@receiver(post_save, sender=ClientProfile)
+def render_profile_thumbnails(sender, instance, update_fields=None, **kwargs):
+    """Queue thumbnails for a new profile picture (save() clears the digest when it changes)"""
+    if update_fields is not None and 'profile_pic' not in update_fields:
+        return
+    if instance.profile_pic and not instance.profile_pic_digest:
+        schedule_thumbnails(instance)
+
+
+@receiver(post_save, sender=FreelancerProfile)
+def update_skill_tags(sender, instance, update_fields=None, **kwargs):
+    """Keep the normalized skill links in step with the profile's skills text"""
+    if update_fields is None or 'skills' in update_fields:
+        sync_freelancer_skills(instance)
+
+
+@receiver(post_save, sender=Proposal)
+def drop_recommendation(sender, instance, created, **kwargs):
+    """Stop recommending a project once the freelancer has bid on it"""
+    if created:
+        proposal_submitted(instance.freelancer_id, instance.project_id)
+
+
+# Domain events (see core.events)
+
+@receiver(post_save, sender=Project)
+def publish_project_created(sender, instance, created, **kwargs):
+    if created:
+        events.publish('project.created', project_id=instance.pk, client_id=instance.client_id)
+
+
+@receiver(post_save, sender=Proposal)
+def publish_proposal_event(sender, instance, created, update_fields=None, **kwargs):
+    """Submissions, and status changes saved one at a time (accept_proposal publishes its own)"""
+    previous = getattr(instance, '_saved_status', None)
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    if created:
+        name = 'proposal.submitted'
+    elif instance.status != previous and instance.status in ('accepted', 'rejected'):
+        name = f'proposal.{instance.status}'
+    else:
+        return
+    events.publish(name, **proposal_event(instance.pk, instance.project, instance.freelancer_id))
+
+
+@receiver(post_save, sender=Message)
+def publish_message_sent(sender, instance, created, **kwargs):
+    if created:
+        events.publish(
+            'message.sent', message_id=instance.pk, project_id=instance.project_id, sender_id=instance.sender_id,
+            message=message_event(instance),
+        )
+
+
+@receiver(post_save, sender=Review)
+def publish_review_posted(sender, instance, created, **kwargs):
+    if created:
+        events.publish(
+            'review.posted', review_id=instance.pk, project_id=instance.project_id,
+            freelancer_id=instance.freelancer_id, client_id=instance.client_id, rating=instance.rating,
+        )
+
+
+# Not redelivered: clients would see the message twice, and reconnecting ones catch up from last_id
+@events.subscriber('message.sent', redeliver=False)
+def push_message(event):
+    """Push new messages to the project's live subscribers"""
+    get_broker().publish(project_channel(event['project_id']), event['message'])
+
+
+@events.subscriber('proposal.accepted')
+def cache_hired_participants(event):
+    """Prime the chat participant cache with the newly hired freelancer"""
+    cache_participants(event['project_id'], event['client_id'], event['freelancer_id'])
+
+
+@events.subscriber('project.created', background=True)
+def recommend_new_project(event):
+    """Offer new projects to the best-matching freelancers before the next full rebuild"""
+    project = Project.objects.filter(pk=event['project_id']).first()
+    if project is not None:
+        project_posted(project)
+
+
+@events.subscriber('proposal.submitted', 'proposal.accepted', batch=True)
+def refresh_candidates(batch):
+    """Bids and hires change how freelancers rank for new projects"""
+    freelancers_changed({event['freelancer_id'] for event in batch})
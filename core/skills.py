@@ -0,0 +1,87 @@
+"""Normalized skills.
+
+Freelancers still type their skills as one comma-separated string
+(``FreelancerProfile.skills``). Saving a profile parses it into ``Skill`` rows
+linked through ``FreelancerProfile.skill_tags``, and projects link to skills
+through ``Project.skills``. Skills are matched on ``Skill.key``, the
+whitespace-collapsed, case-folded name, which has a unique index:
+
+* exact matches (``?skill=`` in the freelancer directory and project search)
+  are a single index lookup, so "Java" no longer matches "JavaScript"
+* prefix matches (free-text directory search) are a range scan on the same
+  index rather than a ``LIKE`` over every profile
+
+Filters are ``pk__in`` subqueries on the link tables, so a freelancer or
+project matching several skills is still returned once.
+"""
+from django.db.models import Q
+
+from freelancer.models import FreelancerProfile
+
+from .models import Project, Skill
+
+
+MAX_SKILL_LENGTH = 100
+
+
+def normalize_skill(name):
+    return ' '.join(name.split()).casefold()[:MAX_SKILL_LENGTH]
+
+
+def parse_skills(text):
+    """``{key: display name}`` for each distinct entry of a comma-separated list, in order"""
+    if not isinstance(text, str):
+        text = ','.join(text)
+    skills = {}
+    for part in text.split(','):
+        name = ' '.join(part.split())[:MAX_SKILL_LENGTH]
+        if name:
+            skills.setdefault(normalize_skill(name), name)
+    return skills
+
+
+def get_or_create_skills(text):
+    """``Skill`` rows for a comma-separated list (or list of names), creating new ones in bulk"""
+    parsed = parse_skills(text)
+    if not parsed:
+        return []
+    skills = {skill.key: skill for skill in Skill.objects.filter(key__in=parsed)}
+    missing = [Skill(key=key, name=name) for key, name in parsed.items() if key not in skills]
+    if missing:
+        # A concurrent save may create the same skill; re-read instead of failing
+        Skill.objects.bulk_create(missing, ignore_conflicts=True)
+        skills.update((skill.key, skill) for skill in Skill.objects.filter(key__in=[s.key for s in missing]))
+    return [skills[key] for key in parsed]
+
+
+def sync_freelancer_skills(profile):
+    """Re-link ``profile.skill_tags`` to what its ``skills`` text says"""
+    profile.skill_tags.set(get_or_create_skills(profile.skills))
+
+
+def set_project_skills(project, text):
+    project.skills.set(get_or_create_skills(text))
+
+
+def matching_skills(term, prefix=False):
+    """Skills named ``term``, or starting with it, as an index lookup on ``key``"""
+    key = normalize_skill(term)
+    if not key:
+        return Skill.objects.none()
+    if not prefix:
+        return Skill.objects.filter(key=key)
+    # key >= 'py' AND key < 'pz' is an index range scan on any database
+    upper = key[:-1] + chr(ord(key[-1]) + 1)
+    return Skill.objects.filter(key__gte=key, key__lt=upper)
+
+
+def freelancers_with_skill(term, prefix=False):
+    """Q for ``User`` rows whose profile lists a matching skill"""
+    links = FreelancerProfile.skill_tags.through.objects.filter(skill__in=matching_skills(term, prefix))
+    return Q(pk__in=links.values('freelancerprofile_id'))
+
+
+def projects_with_skill(term, prefix=False):
+    """Q for ``Project`` rows that require a matching skill"""
+    links = Project.skills.through.objects.filter(skill__in=matching_skills(term, prefix))
+    return Q(pk__in=links.values('project_id'))
@@ -0,0 +1,237 @@
+"""Per-user dashboard counters.
+
+``UserStats`` materializes the counts shown on dashboards and sidebars so
+they are read from one row instead of several ``COUNT(*)`` queries. The
+counters mean different things per role:
+
+* freelancers: accepted proposals (active), pending proposals, and accepted
+  proposals on completed projects (completed)
+* clients: in-progress projects (active), completed projects, and pending
+  proposals received on their projects
+
+Counters move by deltas inside the same transaction as the status change
+(see ``Project.save`` / ``Proposal.save``). ``rebuild_user_stats`` recomputes
+them in bulk for backfills and consistency checks.
+
+Reads are cached under a per-user version that is bumped once a change
+commits. The version lives in the default cache, so every worker must share
+it; a per-process cache would miss bumps made by other processes.
+"""
+import time
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, F
+
+from users.models import User
+
+
+STAT_FIELDS = ('active_projects', 'completed_projects', 'pending_proposals')
+
+CACHE_KEY = 'user-stats:{}:v{}'
+VERSION_KEY = 'user-stats-version:{}'
+CACHE_TIMEOUT = 60 * 60
+
+
+def stats_version(user_id):
+    """
+    Current cache version for a user's counters. Bumping it orphans every
+    entry keyed on the old version, so derived caches can share it.
+    """
+    return cache.get_or_set(VERSION_KEY.format(user_id), time.time_ns, None)
+
+
+def invalidate_user_stats(user_ids):
+    for user_id in user_ids:
+        key = VERSION_KEY.format(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Version was evicted; any fresh value orphans the old entries
+            cache.set(key, time.time_ns(), None)
+
+
+def _proposal_contribution(status, project_status):
+    """What one proposal adds to its freelancer's and its client's counters"""
+    freelancer = Counter()
+    client = Counter()
+    if status == 'pending':
+        freelancer['pending_proposals'] += 1
+        client['pending_proposals'] += 1
+    elif status == 'accepted':
+        freelancer['active_projects'] += 1
+        if project_status == 'completed':
+            freelancer['completed_projects'] += 1
+    return freelancer, client
+
+
+def _project_contribution(status):
+    """What one project adds to its client's counters"""
+    client = Counter()
+    if status == 'in_progress':
+        client['active_projects'] += 1
+    elif status == 'completed':
+        client['completed_projects'] += 1
+    return client
+
+
+def apply_deltas(deltas):
+    """
+    Apply ``{user_id: Counter(field=delta)}`` with F() updates. Users without
+    a stats row are skipped; ``get_user_stats`` computes their row from the
+    source tables the first time it is read.
+    """
+    from .models import UserStats
+
+    changed = []
+    for user_id, counter in deltas.items():
+        updates = {field: F(field) + delta for field, delta in counter.items() if delta}
+        if updates:
+            UserStats.objects.filter(user_id=user_id).update(**updates)
+            changed.append(user_id)
+    if changed:
+        transaction.on_commit(lambda: invalidate_user_stats(changed))
+
+
+def proposal_changed(proposal, old_status, new_status):
+    """Record a proposal being created (old None), re-statused or deleted (new None)"""
+    if old_status == new_status:
+        return
+    client_id, project_status = proposal.project.client_id, proposal.project.status
+    new_freelancer, new_client = _proposal_contribution(new_status, project_status)
+    old_freelancer, old_client = _proposal_contribution(old_status, project_status)
+    new_freelancer.subtract(old_freelancer)
+    new_client.subtract(old_client)
+    apply_deltas({proposal.freelancer_id: new_freelancer, client_id: new_client})
+
+
+def proposals_rejected(client_id, freelancer_ids):
+    """Record a bulk pending -> rejected ``update()`` that bypassed ``save()``"""
+    deltas = defaultdict(Counter)
+    for freelancer_id in freelancer_ids:
+        deltas[freelancer_id]['pending_proposals'] -= 1
+        deltas[client_id]['pending_proposals'] -= 1
+    apply_deltas(deltas)
+
+
+def project_changed(project, old_status, new_status):
+    """Record a project being created (old None), re-statused or deleted (new None)"""
+    if old_status == new_status:
+        return
+    from .models import Proposal
+
+    client = _project_contribution(new_status)
+    client.subtract(_project_contribution(old_status))
+    deltas = {project.client_id: client}
+
+    # Hired freelancers count the project as completed too
+    if 'completed' in (old_status, new_status) and new_status is not None:
+        step = 1 if new_status == 'completed' else -1
+        hired = Proposal.objects.filter(project=project, status='accepted').values_list('freelancer_id', flat=True)
+        for freelancer_id in hired:
+            deltas[freelancer_id] = Counter(completed_projects=step)
+    apply_deltas(deltas)
+
+
+def count_user_stats(user):
+    """Compute a user's counters from the source tables in one aggregate query"""
+    from .models import Project, Proposal
+
+    if user.user_type == 'client':
+        return Project.objects.filter(client=user).aggregate(
+            active_projects=Count('id', filter=Q(status='in_progress'), distinct=True),
+            completed_projects=Count('id', filter=Q(status='completed'), distinct=True),
+            pending_proposals=Count('proposals', filter=Q(proposals__status='pending')),
+        )
+    return Proposal.objects.filter(freelancer=user).aggregate(
+        active_projects=Count('id', filter=Q(status='accepted')),
+        pending_proposals=Count('id', filter=Q(status='pending')),
+        completed_projects=Count('id', filter=Q(status='accepted', project__status='completed')),
+    )
+
+
+def get_user_stats(user):
+    """
+    The user's counters as template-ready ``*_count`` keys, served from the
+    versioned cache and falling back to the ``UserStats`` row.
+    """
+    from .models import UserStats
+
+    key = CACHE_KEY.format(user.pk, stats_version(user.pk))
+    stats = cache.get(key)
+    if stats is None:
+        row = UserStats.objects.filter(user=user).values(*STAT_FIELDS).first()
+        if row is None:
+            row = count_user_stats(user)
+            UserStats.objects.get_or_create(user=user, defaults=row)
+        stats = {f'{field}_count': row[field] for field in STAT_FIELDS}
+        cache.set(key, stats, CACHE_TIMEOUT)
+    return stats
+
+
+def _bulk_counts(user_ids):
+    """Counters for a batch of users, computed with grouped aggregates"""
+    from .models import Project, Proposal
+
+    counts = defaultdict(lambda: dict.fromkeys(STAT_FIELDS, 0))
+    freelancer_rows = Proposal.objects.filter(freelancer__in=user_ids).order_by().values('freelancer').annotate(
+        active_projects=Count('id', filter=Q(status='accepted')),
+        pending_proposals=Count('id', filter=Q(status='pending')),
+        completed_projects=Count('id', filter=Q(status='accepted', project__status='completed')),
+    )
+    for row in freelancer_rows:
+        counts[row.pop('freelancer')].update(row)
+
+    client_rows = Project.objects.filter(client__in=user_ids).order_by().values('client').annotate(
+        active_projects=Count('id', filter=Q(status='in_progress')),
+        completed_projects=Count('id', filter=Q(status='completed')),
+    )
+    for row in client_rows:
+        counts[row.pop('client')].update(row)
+
+    received = Proposal.objects.filter(project__client__in=user_ids, status='pending').order_by().values(
+        'project__client'
+    ).annotate(pending_proposals=Count('id'))
+    for row in received:
+        counts[row['project__client']]['pending_proposals'] = row['pending_proposals']
+    return counts
+
+
+def rebuild_user_stats(batch_size=1000, check_only=False):
+    """
+    Recompute every user's counters in batches and write the ones that drifted.
+    Returns (checked, drifted) counts; with ``check_only`` nothing is written.
+    """
+    from .models import UserStats
+
+    checked = drifted = 0
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not user_ids:
+            break
+        last_id = user_ids[-1]
+
+        expected = _bulk_counts(user_ids)
+        existing = {stats.user_id: stats for stats in UserStats.objects.filter(user_id__in=user_ids)}
+        to_create, to_update = [], []
+        for user_id in user_ids:
+            values = expected.get(user_id, dict.fromkeys(STAT_FIELDS, 0))
+            stats = existing.get(user_id)
+            if stats is None:
+                to_create.append(UserStats(user_id=user_id, **values))
+            elif any(getattr(stats, field) != values[field] for field in STAT_FIELDS):
+                for field in STAT_FIELDS:
+                    setattr(stats, field, values[field])
+                to_update.append(stats)
+
+        checked += len(user_ids)
+        drifted += len(to_create) + len(to_update)
+        if not check_only:
+            with transaction.atomic():
+                UserStats.objects.bulk_create(to_create, batch_size=batch_size)
+                UserStats.objects.bulk_update(to_update, STAT_FIELDS, batch_size=batch_size)
+            invalidate_user_stats([stats.user_id for stats in to_create + to_update])
+
+    return checked, drifted
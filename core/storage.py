@@ -0,0 +1,56 @@
+"""Content-addressed storage for chat attachments.
+
+Files are stored under ``chat_files/sha256/<aa>/<digest><ext>``, where the
+digest is the SHA-256 of the content. An upload whose content is already
+stored reuses the existing file instead of writing a copy. The digest also
+serves as a strong ETag when the file is downloaded (see
+``core.attachments``).
+
+Stored files are shared between messages, so they must never be deleted
+when one message goes away.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+
+CAS_PREFIX = 'chat_files/sha256/'
+CAS_NAME_RE = re.compile(r'^' + re.escape(CAS_PREFIX) + r'[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(\.[a-z0-9]{1,10})?$')
+EXTENSION_RE = re.compile(r'^\.[a-z0-9]{1,10}$')
+
+
+def content_digest(content):
+    """SHA-256 of a Django File, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def digest_from_name(name):
+    """The SHA-256 a stored name was derived from, or None for legacy names"""
+    match = CAS_NAME_RE.match(name or '')
+    return match.group('digest') if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        # Chunked uploads (core.uploads) have already hashed the file
+        digest = getattr(content, 'sha256', None) or content_digest(content)
+        # Keep the extension so clients can still tell an image from a PDF
+        extension = os.path.splitext(name)[1].lower()
+        if not EXTENSION_RE.match(extension):
+            extension = ''
+        name = f'{CAS_PREFIX}{digest[:2]}/{digest}{extension}'
+        if self.exists(name):
+            return name
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return super()._save(name, content)
+
+
+def attachment_storage():
+    """Storage for ``Message.attachment``; a callable so migrations don't freeze it"""
+    return ContentAddressedStorage()
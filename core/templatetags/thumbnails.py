@@ -0,0 +1,30 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from core.thumbnails import avatar_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(profile, size='small', fmt='jpeg'):
+    """``{% thumbnail_url profile 'small' %}``: the avatar URL, or '' without a picture"""
+    return avatar_url(profile, size, fmt) or ''
+
+
+@register.simple_tag
+def avatar(profile, size='small', **attrs):
+    """
+    ``{% avatar profile 'medium' class="freelancer-avatar" alt="..." %}`` renders
+    the WebP thumbnail with a JPEG fallback, the original picture while the
+    thumbnails are being generated, or nothing if the profile has no picture.
+    """
+    src = avatar_url(profile, size)
+    if src is None:
+        return ''
+    img = format_html('<img src="{}"{}>', src, format_html_join('', ' {}="{}"', attrs.items()))
+    if not profile.profile_pic_digest:
+        return img
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp">{}</picture>', avatar_url(profile, size, 'webp'), img,
+    )
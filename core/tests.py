@@ -1,3 +1,1403 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.core.files import locks
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from users.models import User
+from core.models import (
+    Project, Proposal, Message, Review, AttachmentUpload, Skill, ProjectRecommendation, OutboxEvent,
+    ProjectSearchEntry,
+)
+from core.candidates import get_candidate_index, suggested_freelancers
+from core import events
+from core.context_processors import freelancer_sidebar
+from core.hiring import ProjectNotOpen, ProposalNotPending, accept_proposal
+from core.inbox import conversation_inbox
+from core.instrumentation import QueryRecorder, QueryReportStore
+from core.matching import np
+from core.middleware import QueryBudgetMiddleware
+from core.pagination import encode_cursor
+from core.ratings import reconcile_ratings
+from core.participants import cache_participants, can_message
+from core.realtime import get_broker, message_event, project_channel
+from core.recommendations import rebuild_project_recommendations
+from core.search import get_search_backend
+from core.seeding import seed_bulk
+from core.skills import matching_skills, set_project_skills
+from core.stats import count_user_stats, get_user_stats, rebuild_user_stats
+from core.thumbnails import thumbnail_name
+from core.uploads import partial_path, upload_dir
+from freelancer.models import FreelancerProfile
+from PIL import Image
+
+
+class BrowseFreelancersTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.client.force_login(self.client_user)
+
+    def create_freelancers(self, count, start=0):
+        for i in range(start, start + count):
+            user = User.objects.create_user(username=f'freelancer{i}', user_type='freelancer')
+            FreelancerProfile.objects.create(
+                user=user, skills='Python, Django' if i % 2 else 'JavaScript, React',
+                avg_rating=i % 5, review_count=i,
+            )
+
+    def render_page(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('core:browse_freelancers'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_freelancer_count(self):
+        self.create_freelancers(3)
+        _, small = self.render_page()
+        self.create_freelancers(17, start=3)
+        response, large = self.render_page()
+        self.assertEqual(len(response.context['freelancer_list']), 20)
+        self.assertEqual(small, large)
+        # session + user + one page query + one skill_tags prefetch
+        self.assertEqual(large, 4)
+
+    def test_sorts_by_rating_then_review_count(self):
+        self.create_freelancers(6)
+        response, _ = self.render_page(sort='rating')
+        ratings = [(item['avg_rating'], item['review_count']) for item in response.context['freelancer_list']]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+
+    def test_skill_filter_matches_whole_skill(self):
+        self.create_freelancers(4)
+        user = User.objects.create_user(username='java', user_type='freelancer')
+        FreelancerProfile.objects.create(user=user, skills='Java')
+        response, _ = self.render_page(skill='java')
+        usernames = [item['freelancer'].username for item in response.context['freelancer_list']]
+        self.assertEqual(usernames, ['java'])
+
+    def test_skills_are_normalized_and_prefix_searchable(self):
+        user = User.objects.create_user(username='pythonista', user_type='freelancer')
+        profile = FreelancerProfile.objects.create(user=user, skills=' python ,Django,  Python')
+        FreelancerProfile.objects.create(
+            user=User.objects.create_user(username='jsdev', user_type='freelancer'), skills='JavaScript',
+        )
+        self.assertEqual(sorted(profile.skill_tags.values_list('key', flat=True)), ['django', 'python'])
+
+        response, _ = self.render_page(q='PYT')
+        self.assertEqual([item['freelancer'].username for item in response.context['freelancer_list']], ['pythonista'])
+
+        profile.skills = 'Go'
+        profile.save()
+        self.assertEqual(list(profile.skill_tags.values_list('name', flat=True)), ['Go'])
+
+
+class ProjectSkillSearchTests(TestCase):
+    def test_find_work_filters_by_whole_skill(self):
+        client_user = User.objects.create_user(username='client', user_type='client')
+        for title, skills in [('API', 'Java, Spring Boot'), ('SPA', 'JavaScript'), ('ETL', '')]:
+            project = Project.objects.create(client=client_user, title=title, description='Work', budget=100)
+            set_project_skills(project, skills)
+
+        self.client.force_login(User.objects.create_user(username='freelancer', user_type='freelancer'))
+        response = self.client.get(reverse('core:freelancer_find_work'), {'skill': 'java'})
+        self.assertEqual([project.title for project in response.context['projects']], ['API'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The FTS5 index is SQLite only')
+class ProjectSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user(username='client', user_type='client')
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='freelancer', user_type='freelancer'))
+
+    def create_project(self, title, description='Work', budget=100, **kwargs):
+        return Project.objects.create(
+            client=self.client_user, title=title, description=description, budget=budget, **kwargs
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse('core:freelancer_find_work'), params)
+        self.assertEqual(response.status_code, 200)
+        return [project.title for project in response.context['projects']]
+
+    def test_index_follows_project_changes(self):
+        project = self.create_project('Django shop')
+        self.assertEqual(self.search(q='djan'), ['Django shop'])
+
+        project.title = 'Flask shop'
+        project.save()
+        self.assertEqual(self.search(q='djan'), [])
+        self.assertEqual(self.search(q='flask'), ['Flask shop'])
+
+        project.status = 'in_progress'
+        project.save()
+        self.assertEqual(self.search(q='flask'), [])
+
+        project.delete()
+        self.assertFalse(ProjectSearchEntry.objects.exists())
+
+    def test_rebuild_command_reindexes_every_project(self):
+        self.create_project('Django shop')
+        self.create_project('React app', budget=500)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM core_project_fts')
+        self.assertEqual(self.search(q='django'), [])
+
+        out = io.StringIO()
+        call_command('rebuild_search_index', batch_size=1, stdout=out)
+        self.assertIn('Indexed 2 projects', out.getvalue())
+        self.assertEqual(self.search(q='django'), ['Django shop'])
+        self.assertEqual(self.search(q='app', min_budget=200), ['React app'])
+        self.assertEqual(self.search(q='app', max_budget=200), [])
+
+    def test_best_matches_first_with_one_index_lookup(self):
+        self.create_project('Logo design', 'Django mentioned once in passing')
+        self.create_project('Django API', 'Django REST API for a Django shop')
+        self.create_project('Unrelated', 'Nothing to see')
+        with CaptureQueriesContext(connection) as ctx:
+            titles = self.search(q='django')
+        self.assertEqual(titles, ['Django API', 'Logo design'])
+        sql = next(query['sql'] for query in ctx.captured_queries if 'MATCH' in query['sql'])
+        self.assertEqual(sql.count('MATCH'), 1)
+
+    def test_relevance_pages_follow_on(self):
+        for i in range(5):
+            self.create_project(f'Django {i}', 'Django ' * (i + 1))
+        response = self.client.get(reverse('core:freelancer_find_work'), {'q': 'django', 'page_size': 2})
+        titles = [project.title for project in response.context['projects']]
+        page = response.context['projects']
+        while page.has_next:
+            response = self.client.get(
+                reverse('core:freelancer_find_work'), {'q': 'django', 'page_size': 2, 'cursor': page.next_cursor}
+            )
+            page = response.context['projects']
+            titles += [project.title for project in page]
+        self.assertEqual(titles, [f'Django {i}' for i in range(4, -1, -1)])
+
+    @override_settings(PROJECT_SEARCH_BACKEND='core.search.DatabaseSearchBackend')
+    def test_fallback_backend_filters_with_icontains(self):
+        get_search_backend.cache_clear()
+        self.addCleanup(get_search_backend.cache_clear)
+        self.create_project('Django shop')
+        self.create_project('React app', 'Needs some django too')
+        self.create_project('Vue app')
+        self.assertEqual(sorted(self.search(q='DJANGO')), ['Django shop', 'React app'])
+        self.assertEqual(get_search_backend().rebuild(), 0)
+
+
+class ReviewRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user(username='client', user_type='client')
+        cls.alice = User.objects.create_user(username='alice', user_type='freelancer')
+        cls.bob = User.objects.create_user(username='bob', user_type='freelancer')
+        FreelancerProfile.objects.create(user=cls.alice)
+        FreelancerProfile.objects.create(user=cls.bob)
+
+    def review(self, freelancer, rating, title='Site'):
+        project = Project.objects.create(client=self.client_user, title=title, description='Work', budget=100)
+        return Review.objects.create(project=project, client=self.client_user, freelancer=freelancer, rating=rating)
+
+    def assertRating(self, user, rating_sum, review_count, avg_rating):
+        profile = FreelancerProfile.objects.get(user=user)
+        self.assertEqual(
+            (profile.rating_sum, profile.review_count, float(profile.avg_rating)),
+            (rating_sum, review_count, avg_rating),
+        )
+
+    def test_totals_follow_adds_edits_and_deletes(self):
+        first = self.review(self.alice, 5)
+        self.review(self.alice, 2, title='App')
+        self.assertRating(self.alice, 7, 2, 3.5)
+
+        first.rating = 4
+        first.save()
+        self.assertRating(self.alice, 6, 2, 3.0)
+
+        # Saving without a change leaves the totals alone
+        first.save()
+        self.assertRating(self.alice, 6, 2, 3.0)
+
+        first.freelancer = self.bob
+        first.save()
+        self.assertRating(self.alice, 2, 1, 2.0)
+        self.assertRating(self.bob, 4, 1, 4.0)
+
+        first.delete()
+        self.assertRating(self.bob, 0, 0, 0.0)
+        # Nothing for a full recount to repair
+        self.assertEqual(reconcile_ratings(dry_run=True), (2, 0))
+
+    def test_cascaded_deletes_are_taken_out(self):
+        review = self.review(self.alice, 5)
+        self.review(self.alice, 3, title='App')
+        review.project.delete()
+        self.assertRating(self.alice, 3, 1, 3.0)
+
+        self.client_user.delete()
+        self.assertRating(self.alice, 0, 0, 0.0)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        client_user = User.objects.create_user(username='client', user_type='client')
+        cls.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        for i in range(7):
+            project = Project.objects.create(client=client_user, title=f'P{i}', description='Work', budget=100)
+            Proposal.objects.create(project=project, freelancer=cls.freelancer, cover_letter='Hi', bid_amount=90)
+        # Every row shares one timestamp, so only the id tells them apart
+        Proposal.objects.update(created_at=timezone.now())
+        cls.expected = list(Proposal.objects.order_by('-id').values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.freelancer)
+
+    def get_page(self, cursor=None):
+        params = {'page_size': 3}
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get(reverse('core:proposal_list'), params)
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page']
+        return [proposal.pk for proposal in page], page
+
+    def test_pages_forward_and_back_over_equal_timestamps(self):
+        pages = []
+        ids, page = self.get_page()
+        pages.append(ids)
+        while page.has_next:
+            ids, page = self.get_page(page.next_cursor)
+            pages.append(ids)
+        self.assertEqual([pk for ids in pages for pk in ids], self.expected)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 1])
+
+        for expected in reversed(pages[:-1]):
+            ids, page = self.get_page(page.previous_cursor)
+            self.assertEqual(ids, expected)
+        self.assertFalse(page.has_previous)
+
+    def test_invalid_cursors_are_rejected(self):
+        _, page = self.get_page()
+        tampered = [
+            'not a cursor!',
+            encode_cursor('sideways', ['2024-01-01T00:00:00+00:00', 1]),
+            encode_cursor('next', ['2024-01-01T00:00:00+00:00']),
+            encode_cursor('next', ['yesterday', 1]),
+            encode_cursor('next', [None, 1]),
+            encode_cursor('next', [{'id': 1}, 1]),
+            page.next_cursor[:-4],
+        ]
+        for cursor in tampered:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('core:proposal_list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+
+
+class BulkSeedingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.totals = seed_bulk(200, seed=1, batch_size=50)
+
+    def test_rows_come_in_proportion(self):
+        totals = self.totals
+        self.assertEqual((totals['projects'], totals['clients'], totals['freelancers']), (200, 10, 20))
+        self.assertEqual(User.objects.filter(user_type='client').count(), 10)
+        self.assertEqual(FreelancerProfile.objects.count(), 20)
+        for model, key in [(Project, 'projects'), (Proposal, 'proposals'), (Message, 'messages'), (Review, 'reviews')]:
+            self.assertEqual(model.objects.count(), totals[key])
+
+        statuses = dict(Project.objects.order_by().values_list('status').annotate(total=Count('id')))
+        self.assertEqual(sum(statuses.values()), 200)
+        self.assertGreater(statuses['open'], statuses['in_progress'])
+        self.assertGreater(statuses['in_progress'], 0)
+        self.assertGreater(statuses['completed'], 0)
+        # Exactly one hire per assigned project, pending bids only on open ones
+        hired = Proposal.objects.filter(status='accepted').count()
+        self.assertEqual(hired, statuses['in_progress'] + statuses['completed'])
+        self.assertFalse(Proposal.objects.filter(status='pending').exclude(project__status='open').exists())
+        self.assertEqual(totals['reviews'], statuses['completed'])
+        self.assertFalse(Message.objects.filter(project__status='open').exists())
+
+    def test_history_is_kept_without_touching_auto_now(self):
+        month_ago = timezone.now() - timedelta(days=30)
+        self.assertGreater(Project.objects.filter(created_at__lt=month_ago).count(), 100)
+        self.assertFalse(Proposal.objects.filter(created_at__lt=F('project__created_at')).exists())
+        self.assertFalse(Project.objects.filter(updated_at__lt=F('created_at')).exists())
+        self.assertEqual(
+            Project.objects.filter(status='completed', completed_at__isnull=False).count(),
+            Project.objects.filter(status='completed').count(),
+        )
+        # The model fields still stamp ordinary saves
+        project = Project.objects.create(
+            client=User.objects.filter(user_type='client').first(), title='New', description='Work', budget=100,
+        )
+        self.assertGreater(project.created_at, month_ago)
+
+    def test_derived_tables_are_rebuilt(self):
+        self.assertEqual(ProjectSearchEntry.objects.count(), 200)
+        self.assertEqual(rebuild_user_stats(check_only=True)[1], 0)
+        self.assertEqual(reconcile_ratings(dry_run=True)[1], 0)
+        rated = FreelancerProfile.objects.filter(review_count__gt=0)
+        self.assertEqual(sum(rated.values_list('review_count', flat=True)), self.totals['reviews'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against SQLite')
+class HotQueryIndexTests(TestCase):
+    """EXPLAIN the hot queries from the views/APIs and require an index for each"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user(username='client', user_type='client')
+        cls.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        cls.project = Project.objects.create(client=cls.client_user, title='Site', description='Build it', budget=100)
+
+    def assertUsesIndex(self, queryset, table, index=None):
+        plan = queryset.explain()
+        # A bare "SCAN <table>" without "USING" is a full table scan
+        full_scan = re.search(rf'SCAN {table}(?! USING)', plan)
+        self.assertIsNone(full_scan, f'Full scan of {table}:\n{plan}')
+        self.assertRegex(plan, rf'(SEARCH|SCAN) {table} USING', plan)
+        if index:
+            self.assertIn(index, plan)
+
+    def test_open_projects_newest_first(self):
+        queryset = Project.objects.filter(status='open').order_by('-created_at', '-id')
+        self.assertUsesIndex(queryset, 'core_project', 'project_status_created_idx')
+
+    def test_open_projects_by_budget(self):
+        queryset = Project.objects.filter(status='open', budget__gte=50).order_by('budget', 'id')
+        self.assertUsesIndex(queryset, 'core_project', 'project_status_budget_idx')
+
+    def test_client_projects_by_status(self):
+        queryset = Project.objects.filter(client=self.client_user, status='in_progress')
+        self.assertUsesIndex(queryset, 'core_project', 'project_client_status_idx')
+
+    def test_freelancer_proposals_by_status(self):
+        queryset = Proposal.objects.filter(freelancer=self.freelancer, status='pending')
+        self.assertUsesIndex(queryset, 'core_proposal', 'proposal_freelancer_status_idx')
+
+    def test_accepted_proposal_for_project(self):
+        queryset = Proposal.objects.filter(project=self.project, status='accepted')
+        self.assertUsesIndex(queryset, 'core_proposal')
+
+    def test_new_messages_since_last_id(self):
+        queryset = Message.objects.filter(project=self.project, id__gt=10).order_by('id')
+        self.assertUsesIndex(queryset, 'core_message')
+
+    def test_last_message_of_project(self):
+        queryset = Message.objects.filter(project=self.project).order_by('-created_at')[:1]
+        self.assertUsesIndex(queryset, 'core_message', 'message_project_created_idx')
+
+    def test_skill_exact_and_prefix_lookups(self):
+        Skill.objects.create(name='Python', key='python')
+        self.assertUsesIndex(matching_skills('Python'), 'core_skill')
+        self.assertUsesIndex(matching_skills('Py', prefix=True), 'core_skill')
+
+
+@override_settings(QUERY_INSTRUMENTATION_ENABLED=True)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        QueryReportStore().reset()
+        self.staff = User.objects.create_user(username='staff', user_type='client', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_recorder_flags_repeated_statement_shapes(self):
+        users = [User.objects.create_user(username=f'user{i}') for i in range(3)]
+        with QueryRecorder() as recorder:
+            for user in users:
+                User.objects.get(pk=user.pk)
+            User.objects.get(pk=users[0].pk)
+        summary = recorder.summary()
+        self.assertEqual(summary['queries'], 4)
+        self.assertEqual(summary['duplicates'], 1)
+        self.assertEqual(list(summary['n_plus_one'].values()), [3])
+
+    def test_requests_are_aggregated_per_view(self):
+        for _ in range(2):
+            response = self.client.get(reverse('core:browse_freelancers'))
+            self.assertIn('X-Query-Count', response)
+        report = self.client.get(reverse('core:api_query_budget_report')).json()
+        views = {row['view']: row for row in report['views']}
+        self.assertEqual(views['core:browse_freelancers']['requests'], 2)
+        self.assertEqual(
+            views['core:browse_freelancers']['queries'],
+            2 * int(response['X-Query-Count']),
+        )
+
+    def test_report_is_staff_only(self):
+        self.client.force_login(User.objects.create_user(username='client', user_type='client'))
+        response = self.client.get(reverse('core:api_query_budget_report'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_samples_wait_for_a_concurrent_update(self):
+        store = QueryReportStore()
+        summary = {'queries': 2, 'db_time': 0.001, 'duplicates': 0, 'n_plus_one': {}}
+        store.record('core:index', summary)
+        # As held by another worker halfway through its read-modify-write
+        with store.locked('query-budget:core:index'):
+            thread = threading.Thread(target=store.record, args=('core:index', summary))
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive())
+        thread.join()
+        [row] = store.report()
+        self.assertEqual((row['requests'], row['queries']), (2, 4))
+
+    async def test_async_views_are_recorded_without_a_thread(self):
+        async def view(request):
+            return HttpResponse()
+        self.assertTrue(iscoroutinefunction(QueryBudgetMiddleware(view)))
+
+        await self.async_client.aforce_login(self.staff)
+        project = await sync_to_async(Project.objects.create)(
+            client=self.staff, title='Site', description='Build it', budget=100,
+        )
+        response = await self.async_client.get(reverse('core:api_get_new_messages', args=[project.id]), {'last_id': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Query-Count', response)
+
+
+class MessageParticipantCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        self.project = Project.objects.create(client=self.client_user, title='Site', description='Build it', budget=100)
+        self.proposal = Proposal.objects.create(
+            project=self.project, freelancer=self.freelancer, cover_letter='Hi', bid_amount=90,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.proposal.status = 'accepted'
+            self.proposal.save()
+        self.client.force_login(self.freelancer)
+
+    def test_authorization_is_served_from_cache(self):
+        url = reverse('core:api_get_new_messages', args=[self.project.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'last_id': 0})
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(query['sql'] for query in ctx.captured_queries)
+        self.assertNotIn('core_proposal', tables)
+        self.assertNotIn('"core_project"', tables)
+
+    def test_access_is_revoked_when_hire_is_undone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.proposal.status = 'rejected'
+            self.proposal.save()
+        response = self.client.post(reverse('core:api_send_message', args=[self.project.id]), {'content': 'Hi'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_hire_made_elsewhere_is_seen_despite_a_cached_open_project(self):
+        project = Project.objects.create(client=self.client_user, title='App', description='Build it', budget=100)
+        proposal = Proposal.objects.create(project=project, freelancer=self.freelancer, cover_letter='Hi', bid_amount=90)
+        self.assertFalse(can_message(project.id, self.freelancer))
+        # As left behind by another process before the hire; the hire itself primes a different cache
+        cache_participants(project.id, self.client_user.id, None)
+        Proposal.objects.filter(pk=proposal.pk).update(status='accepted')
+        Project.objects.filter(pk=project.pk).update(status='in_progress')
+
+        self.assertTrue(can_message(project.id, self.freelancer))
+        response = self.client.get(reverse('core:api_get_new_messages', args=[project.id]), {'last_id': 0})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_project_is_not_found(self):
+        response = self.client.get(reverse('core:api_get_new_messages', args=[self.project.id + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.freelancers = [
+            User.objects.create_user(username=f'freelancer{i}', user_type='freelancer') for i in range(2)
+        ]
+        self.users = [self.client_user, *self.freelancers]
+        # Counters are only kept for users with a stats row
+        for user in self.users:
+            get_user_stats(user)
+
+    def assertCountersMatchRebuild(self):
+        self.assertEqual(rebuild_user_stats(check_only=True), (len(self.users), 0))
+        for user in self.users:
+            self.assertEqual(get_user_stats(user), {f'{k}_count': v for k, v in count_user_stats(user).items()})
+
+    def create_project(self, title):
+        self.client.force_login(self.client_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('core:project_create'), {'title': title, 'description': 'Work', 'budget': 100})
+        return Project.objects.get(title=title)
+
+    def bid(self, freelancer, project):
+        self.client.force_login(freelancer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('core:proposal_create', args=[project.pk]), {'cover_letter': 'Hi', 'bid_amount': 90},
+            )
+        return Proposal.objects.get(project=project, freelancer=freelancer)
+
+    def test_counters_follow_the_views(self):
+        site, app = self.create_project('Site'), self.create_project('App')
+        winner = self.bid(self.freelancers[0], site)
+        self.bid(self.freelancers[1], site)
+        self.bid(self.freelancers[1], app)
+        self.assertEqual(get_user_stats(self.client_user)['pending_proposals_count'], 3)
+        self.assertCountersMatchRebuild()
+
+        self.client.force_login(self.client_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('core:proposal_accept', args=[winner.pk]))
+        self.assertEqual(get_user_stats(self.freelancers[0])['active_projects_count'], 1)
+        self.assertCountersMatchRebuild()
+
+        site.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            site.status = 'completed'
+            site.save()
+        self.assertEqual(get_user_stats(self.freelancers[0])['completed_projects_count'], 1)
+        self.assertCountersMatchRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Proposal.objects.get(project=app).delete()
+        self.assertCountersMatchRebuild()
+
+        # Cascades from the project through its proposals
+        self.bid(self.freelancers[0], app)
+        with self.captureOnCommitCallbacks(execute=True):
+            app.delete()
+            site.delete()
+        self.assertEqual(get_user_stats(self.client_user), dict.fromkeys(
+            ['active_projects_count', 'completed_projects_count', 'pending_proposals_count'], 0,
+        ))
+        self.assertCountersMatchRebuild()
+
+    def test_status_left_out_of_update_fields_is_not_counted(self):
+        site = self.create_project('Site')
+        proposal = self.bid(self.freelancers[0], site)
+        with self.captureOnCommitCallbacks(execute=True):
+            site.status = 'completed'
+            site.title = 'Renamed site'
+            site.save(update_fields=['title'])
+            proposal.status = 'accepted'
+            proposal.cover_letter = 'Hello'
+            proposal.save(update_fields=['cover_letter'])
+        self.assertEqual(get_user_stats(self.freelancers[0])['pending_proposals_count'], 1)
+        self.assertCountersMatchRebuild()
+
+        # The status is written once it is saved after all
+        with self.captureOnCommitCallbacks(execute=True):
+            proposal.save(update_fields=['status'])
+        self.assertEqual(get_user_stats(self.freelancers[0])['active_projects_count'], 1)
+        self.assertCountersMatchRebuild()
+
+
+class FreelancerSidebarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        FreelancerProfile.objects.create(user=cls.freelancer)
+        client_user = User.objects.create_user(username='client', user_type='client')
+        project = Project.objects.create(client=client_user, title='Site', description='Work', budget=100)
+        cls.proposal = Proposal.objects.create(
+            project=project, freelancer=cls.freelancer, cover_letter='Hi', bid_amount=90,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def sidebar(self):
+        request = RequestFactory().get('/')
+        request.user = self.freelancer
+        return freelancer_sidebar(request)
+
+    def test_unrendered_sidebar_costs_nothing(self):
+        with self.assertNumQueries(0):
+            self.sidebar()
+
+    def test_counters_are_cached_until_they_change(self):
+        self.assertEqual(self.sidebar()['pending_proposals_count'](), 1)
+        sidebar = self.sidebar()
+        with self.assertNumQueries(0):
+            self.assertEqual(sidebar['pending_proposals_count'](), 1)
+            self.assertEqual(sidebar['active_projects_count'](), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            accept_proposal(self.proposal)
+        sidebar = self.sidebar()
+        # The bumped version misses the cache: one read of the UserStats row
+        with self.assertNumQueries(1):
+            self.assertEqual(sidebar['pending_proposals_count'](), 0)
+            self.assertEqual(sidebar['active_projects_count'](), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.sidebar()['active_projects_count'](), 1)
+
+
+class FinancialSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user(username='client', user_type='client')
+        cls.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        cls.url = reverse('core:api_financial_summary')
+
+    def hire(self, title, bid, accepted_at, completed_at=None):
+        project = Project.objects.create(client=self.client_user, title=title, description='Work', budget=1000)
+        proposal = Proposal.objects.create(
+            project=project, freelancer=self.freelancer, cover_letter='Hi', bid_amount=bid,
+        )
+        accept_proposal(proposal)
+        Proposal.objects.filter(pk=proposal.pk).update(accepted_at=accepted_at)
+        if completed_at:
+            project.status = 'completed'
+            project.save()
+            Project.objects.filter(pk=project.pk).update(completed_at=completed_at)
+        return project
+
+    def summary(self, user, **params):
+        self.client.force_login(user)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        # Amounts are decimal strings; compare them as numbers
+        data['total'] = Decimal(data['total'])
+        data['series'] = [(row['period'], Decimal(row['total'])) for row in data['series']]
+        return data
+
+    def test_spend_and_earnings_by_period(self):
+        utc = dt_timezone.utc
+        self.hire('Site', 100, datetime(2024, 1, 10, tzinfo=utc), datetime(2024, 3, 1, tzinfo=utc))
+        self.hire('App', 250, datetime(2024, 3, 5, tzinfo=utc))
+        Project.objects.create(client=self.client_user, title='Open', description='Work', budget=1000)
+
+        spent = self.summary(self.client_user)
+        self.assertEqual((spent['kind'], spent['total']), ('spent', 350))
+        self.assertEqual(spent['series'], [('2024-01', 100), ('2024-03', 250)])
+        earned = self.summary(self.freelancer, period='year')
+        self.assertEqual((earned['kind'], earned['total']), ('earned', 100))
+        self.assertEqual(earned['series'], [('2024', 100)])
+
+    def test_later_edits_do_not_move_money_between_periods(self):
+        project = self.hire(
+            'Site', 100, datetime(2024, 1, 10, tzinfo=dt_timezone.utc), datetime(2024, 2, 1, tzinfo=dt_timezone.utc),
+        )
+        project.refresh_from_db()
+        project.description = 'Edited'
+        project.save()
+        proposal = project.proposals.get()
+        proposal.cover_letter = 'Edited'
+        proposal.save()
+        self.assertEqual(self.summary(self.client_user)['series'], [('2024-01', 100)])
+        self.assertEqual(self.summary(self.freelancer)['series'], [('2024-02', 100)])
+
+    def test_completion_is_stamped_on_the_status_change(self):
+        project = self.hire('Site', 100, timezone.now())
+        self.assertIsNone(project.completed_at)
+        project.status = 'completed'
+        project.save(update_fields=['status'])
+        completed_at = Project.objects.get(pk=project.pk).completed_at
+        self.assertIsNotNone(completed_at)
+        project.save()
+        self.assertEqual(Project.objects.get(pk=project.pk).completed_at, completed_at)
+
+    def test_rejects_unknown_periods(self):
+        self.client.force_login(self.client_user)
+        self.assertEqual(self.client.get(self.url, {'period': 'week'}).status_code, 400)
+
+
+class ProposalAcceptanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.project = Project.objects.create(client=self.client_user, title='Site', description='Build it', budget=100)
+        self.proposals = [
+            Proposal.objects.create(
+                project=self.project, cover_letter='Hi', bid_amount=90,
+                freelancer=User.objects.create_user(username=f'freelancer{i}', user_type='freelancer'),
+            )
+            for i in range(3)
+        ]
+        self.users = [self.client_user] + [proposal.freelancer for proposal in self.proposals]
+        for user in self.users:
+            get_user_stats(user)
+
+    def test_accepting_hires_one_and_rejects_the_rest(self):
+        published = []
+        record = events.subscriber('proposal.accepted', 'proposal.rejected')(published.append)
+        self.addCleanup(events.unsubscribe, record)
+
+        winner, *losers = self.proposals
+        self.client.force_login(self.client_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('core:proposal_accept', args=[winner.pk]))
+        self.assertRedirects(response, reverse('core:project_proposals', args=[self.project.pk]))
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, 'in_progress')
+        self.assertEqual(
+            dict(Proposal.objects.values_list('pk', 'status')),
+            {winner.pk: 'accepted', losers[0].pk: 'rejected', losers[1].pk: 'rejected'},
+        )
+        self.assertEqual(
+            sorted((event.name, event['freelancer_id']) for event in published),
+            sorted([('proposal.accepted', winner.freelancer_id)]
+                   + [('proposal.rejected', loser.freelancer_id) for loser in losers]),
+        )
+        self.assertTrue(can_message(self.project.pk, winner.freelancer))
+        # Counters moved in the transaction match a recount
+        for user in self.users:
+            self.assertEqual(get_user_stats(user), {f'{k}_count': v for k, v in count_user_stats(user).items()})
+
+    def test_only_one_proposal_can_win(self):
+        first, second, _ = self.proposals
+        accept_proposal(first)
+        # Both were pending when the second click's page was loaded
+        with self.assertRaises(ProjectNotOpen):
+            accept_proposal(second)
+        # Even on a reopened project, a rejected proposal stays rejected
+        self.project.status = 'open'
+        self.project.save()
+        with self.assertRaises(ProposalNotPending):
+            accept_proposal(second)
+        self.assertEqual(list(Proposal.objects.filter(status='accepted')), [first])
+
+
+class MessagePayloadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        self.project = Project.objects.create(
+            client=self.client_user, title='Site', description='Build it', budget=100, status='in_progress',
+        )
+        Proposal.objects.create(
+            project=self.project, freelancer=self.freelancer, cover_letter='Hi', bid_amount=90, status='accepted',
+        )
+        self.url = reverse('core:api_get_messages', args=[self.project.id])
+        self.client.force_login(self.client_user)
+
+    def send(self, count):
+        for i in range(count):
+            sender = self.client_user if i % 2 else self.freelancer
+            Message.objects.create(project=self.project, sender=sender, content=f'Message {i}')
+
+    def test_query_count_is_independent_of_message_count(self):
+        self.send(2)
+        self.client.get(self.url)  # warm the participant cache and read marker
+        self.send(2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url)
+        self.send(16)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.json()['messages']), 20)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_unchanged_thread_is_not_modified(self):
+        self.send(3)
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        self.send(1)
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_epoch_timestamps(self):
+        self.send(1)
+        message = self.client.get(self.url, {'timestamps': 'epoch'}).json()['messages'][0]
+        created = Message.objects.get().created_at
+        self.assertEqual(message['created_at'], int(created.timestamp() * 1000))
+        self.assertTrue(message['is_sent'] is False)
+
+    def test_history_is_loaded_in_windows(self):
+        self.send(5)
+        ids = list(Message.objects.order_by('id').values_list('id', flat=True))
+        data = self.client.get(self.url, {'limit': 2}).json()
+        self.assertEqual([m['id'] for m in data['messages']], ids[3:])
+        self.assertEqual(data['history']['before_id'], ids[3])
+        data = self.client.get(self.url, {'limit': 2, 'before_id': ids[3]}).json()
+        self.assertEqual([m['id'] for m in data['messages']], ids[1:3])
+        data = self.client.get(self.url, {'limit': 2, 'before_id': ids[1]}).json()
+        self.assertEqual([m['id'] for m in data['messages']], ids[:1])
+        self.assertFalse(data['history']['has_more'])
+
+    @override_settings(MESSAGE_HISTORY_LIMIT=3)
+    def test_message_page_renders_newest_window(self):
+        self.send(5)
+        url = reverse('core:project_messages', args=[self.project.id])
+        response = self.client.get(url)
+        self.assertEqual([m.content for m in response.context['messages_list']], ['Message 2', 'Message 3', 'Message 4'])
+        older = self.client.get(url, {'before_id': response.context['history'].oldest_id, 'partial': 1})
+        self.assertContains(older, 'Message 1')
+        self.assertNotContains(older, 'Send a Message')
+
+
+@override_settings(MESSAGE_STREAM_HEARTBEAT=0.05, MESSAGE_STREAM_TIMEOUT=0.2)
+class MessageStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user(username='client', user_type='client')
+        cls.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        cls.project = Project.objects.create(
+            client=cls.client_user, title='Site', description='Build it', budget=100, status='in_progress',
+        )
+        Proposal.objects.create(
+            project=cls.project, freelancer=cls.freelancer, cover_letter='Hi', bid_amount=90, status='accepted',
+        )
+        cls.messages = [
+            Message.objects.create(project=cls.project, sender=cls.freelancer, content=f'Message {i}')
+            for i in range(3)
+        ]
+        cls.url = reverse('core:api_stream_messages', args=[cls.project.id])
+
+    def setUp(self):
+        cache.clear()
+
+    async def open_stream(self, user=None, **kwargs):
+        await self.async_client.aforce_login(user or self.client_user)
+        return await self.async_client.get(self.url, **kwargs)
+
+    def event_ids(self, body):
+        return [int(pk) for pk in re.findall(r'^id: (\d+)$', body, re.M)]
+
+    async def read_all(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+    async def test_catches_up_from_last_id(self):
+        first = self.messages[0]
+        body = await self.read_all(await self.open_stream(query_params={'last_id': first.pk}))
+        self.assertEqual(self.event_ids(body), [message.pk for message in self.messages[1:]])
+        self.assertIn('event: heartbeat', body)
+
+    async def test_resumes_from_last_event_id(self):
+        response = await self.open_stream(
+            query_params={'last_id': 0}, headers={'Last-Event-ID': str(self.messages[1].pk)},
+        )
+        body = await self.read_all(response)
+        self.assertEqual(self.event_ids(body), [self.messages[2].pk])
+
+    async def test_live_messages_follow_the_catch_up(self):
+        response = await self.open_stream(query_params={'last_id': self.messages[-1].pk})
+        stream = aiter(response.streaming_content)
+        self.assertIn('retry:', (await anext(stream)).decode())
+        # Subscribed before the first frame: a publish now is delivered, once
+        payload = await sync_to_async(message_event)(self.messages[-1])
+        get_broker().publish(project_channel(self.project.id), dict(payload, id=payload['id'] + 1))
+        get_broker().publish(project_channel(self.project.id), payload)
+        body = ''.join([chunk.decode() async for chunk in stream])
+        self.assertEqual(self.event_ids(body), [payload['id'] + 1])
+
+    async def test_delivered_messages_are_marked_read(self):
+        response = await self.open_stream(query_params={'last_id': 0})
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        for _ in self.messages:
+            await anext(stream)
+        await anext(stream)  # the catch-up is marked read before the next frame
+        self.assertEqual(await self.unread_count(), 0)
+
+        reply = await Message.objects.acreate(project=self.project, sender=self.freelancer, content='Again')
+        self.assertEqual(await self.unread_count(), 1)
+        get_broker().publish(project_channel(self.project.id), await sync_to_async(message_event)(reply))
+        [chunk async for chunk in stream]
+        self.assertEqual(await self.unread_count(), 0)
+
+    async def unread_count(self):
+        inbox = await sync_to_async(conversation_inbox)(self.client_user)
+        return inbox[0]['unread_count']
+
+    async def test_outsiders_are_refused(self):
+        outsider = await User.objects.acreate(username='outsider', user_type='freelancer')
+        response = await self.open_stream(outsider)
+        self.assertEqual(response.status_code, 403)
+
+    def test_falls_back_to_polling_under_wsgi(self):
+        self.client.force_login(self.client_user)
+        self.assertEqual(self.client.get(self.url).status_code, 501)
+
+
+class LongPollTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user(username='client', user_type='client')
+        cls.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        cls.project = Project.objects.create(
+            client=cls.client_user, title='Site', description='Build it', budget=100, status='in_progress',
+        )
+        Proposal.objects.create(
+            project=cls.project, freelancer=cls.freelancer, cover_letter='Hi', bid_amount=90, status='accepted',
+        )
+        cls.first = Message.objects.create(project=cls.project, sender=cls.freelancer, content='Hello')
+        cls.url = reverse('core:api_get_new_messages', args=[cls.project.id])
+
+    async def poll(self, **params):
+        await self.async_client.aforce_login(self.client_user)
+        response = await self.async_client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [message['id'] for message in response.json()['messages']]
+
+    async def test_returns_at_once_when_messages_are_waiting(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.assertEqual(await self.poll(last_id=0, wait=5), [self.first.pk])
+        self.assertLess(loop.time() - started, 1)
+
+    async def test_times_out_empty(self):
+        self.assertEqual(await self.poll(last_id=self.first.pk, wait=0.1), [])
+
+    async def test_wakes_up_on_publish(self):
+        waiting = asyncio.ensure_future(self.poll(last_id=self.first.pk, wait=5))
+        await asyncio.sleep(0.1)
+        self.assertFalse(waiting.done())
+        reply = await Message.objects.acreate(project=self.project, sender=self.freelancer, content='Again')
+        get_broker().publish(project_channel(self.project.id), await sync_to_async(message_event)(reply))
+        self.assertEqual(await asyncio.wait_for(waiting, 2), [reply.pk])
+
+    def test_rejects_invalid_waits(self):
+        self.client.force_login(self.client_user)
+        for wait in ['soon', 'nan', 'inf', '-inf']:
+            with self.subTest(wait=wait):
+                response = self.client.get(self.url, {'last_id': self.first.pk, 'wait': wait})
+                self.assertEqual(response.status_code, 400)
+
+
+class InboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user(username='client', user_type='client')
+        cls.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        cls.projects = []
+        for title in ['Site', 'App']:
+            project = Project.objects.create(
+                client=cls.client_user, title=title, description='Work', budget=100, status='in_progress',
+            )
+            Proposal.objects.create(
+                project=project, freelancer=cls.freelancer, cover_letter='Hi', bid_amount=90, status='accepted',
+            )
+            cls.projects.append(project)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.client_user)
+
+    def send(self, project, sender, count=1):
+        return [Message.objects.create(project=project, sender=sender, content='Hi') for _ in range(count)]
+
+    def unread_counts(self):
+        response = self.client.get(reverse('core:all_messages'))
+        return {item['project'].title: item['unread_count'] for item in response.context['project_list']}
+
+    def test_counts_only_unread_messages_from_the_other_side(self):
+        site, app = self.projects
+        self.send(site, self.freelancer, 3)
+        self.send(site, self.client_user, 2)
+        self.send(app, self.freelancer)
+        self.assertEqual(self.unread_counts(), {'Site': 3, 'App': 1})
+        # Most recent activity first
+        response = self.client.get(reverse('core:all_messages'))
+        self.assertEqual([item['project'].title for item in response.context['project_list']], ['App', 'Site'])
+
+    def test_opening_or_polling_a_chat_marks_it_read(self):
+        site, app = self.projects
+        first = self.send(site, self.freelancer, 2)[0]
+        self.send(app, self.freelancer)
+        self.client.get(reverse('core:api_get_messages', args=[site.id]))
+        self.assertEqual(self.unread_counts(), {'Site': 0, 'App': 1})
+
+        self.send(app, self.freelancer)
+        self.client.get(reverse('core:api_get_new_messages', args=[app.id]), {'last_id': first.pk})
+        self.assertEqual(self.unread_counts(), {'Site': 0, 'App': 0})
+
+        # Each user has their own read marker
+        self.client.force_login(self.freelancer)
+        self.send(site, self.client_user)
+        self.assertEqual(self.unread_counts(), {'Site': 1, 'App': 0})
+
+
+class MessageAttachmentTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.freelancer = User.objects.create_user(username='freelancer', user_type='freelancer')
+        self.project = Project.objects.create(
+            client=self.client_user, title='Site', description='Build it', budget=100, status='in_progress',
+        )
+        Proposal.objects.create(
+            project=self.project, freelancer=self.freelancer, cover_letter='Hi', bid_amount=90, status='accepted',
+        )
+        self.client.force_login(self.client_user)
+
+    def upload(self, name='spec.pdf', content=b'0123456789' * 100):
+        self.client.post(
+            reverse('core:api_send_message', args=[self.project.id]),
+            {'attachment': SimpleUploadedFile(name, content)},
+        )
+        return Message.objects.latest('id')
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.upload('a.pdf')
+        second = self.upload('b.pdf')
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertEqual((first.attachment_name, second.attachment_name), ('a.pdf', 'b.pdf'))
+
+    def test_range_and_conditional_requests(self):
+        message = self.upload()
+        url = reverse('core:message_attachment', args=[message.id, message.attachment_filename])
+        response = self.client.get(url, headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1000')
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_outsiders_cannot_download(self):
+        message = self.upload()
+        self.client.force_login(User.objects.create_user(username='other', user_type='freelancer'))
+        url = reverse('core:message_attachment', args=[message.id, message.attachment_filename])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, CHAT_UPLOAD_TEMP_DIR=os.path.join(media_root, 'partial'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.project = Project.objects.create(
+            client=self.client_user, title='Site', description='Build it', budget=100, status='in_progress',
+        )
+        self.client.force_login(self.client_user)
+        self.data = os.urandom(1000)
+
+    def start(self, **extra):
+        response = self.client.post(
+            reverse('core:api_start_attachment_upload', args=[self.project.id]),
+            {'filename': 'design.pdf', 'size': len(self.data), **extra},
+        )
+        self.assertEqual(response.status_code, 201)
+        return reverse('core:api_attachment_upload', args=[response.json()['upload_id']])
+
+    def put(self, url, offset, chunk, **headers):
+        return self.client.put(
+            url, chunk, content_type='application/octet-stream', headers={'Upload-Offset': str(offset), **headers},
+        )
+
+    def test_resumes_from_server_offset_and_completes(self):
+        url = self.start(sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(self.put(url, 0, self.data[:400]).json()['offset'], 400)
+
+        # A client that lost the response and retries the same chunk is told where to resume
+        retry = self.put(url, 0, self.data[:400])
+        self.assertEqual((retry.status_code, retry.json()['offset']), (409, 400))
+        self.assertEqual(self.client.get(url).json()['offset'], 400)
+        self.assertTrue(self.put(url, 400, self.data[400:]).json()['complete'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url + 'complete/', {'content': 'Latest mockups'})
+        self.assertEqual(response.status_code, 200)
+        message = Message.objects.get(pk=response.json()['id'])
+        self.assertEqual((message.content, message.attachment_name), ('Latest mockups', 'design.pdf'))
+        with message.attachment.open('rb') as fh:
+            self.assertEqual(fh.read(), self.data)
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertEqual(os.listdir(upload_dir()), [])
+
+    def test_rejects_corrupt_chunks_and_incomplete_uploads(self):
+        url = self.start()
+        response = self.put(url, 0, self.data[:400], **{'X-Chunk-SHA256': '0' * 64})
+        self.assertEqual((response.status_code, response.json()['offset']), (400, 0))
+        self.put(url, 0, self.data[:400])
+
+        response = self.client.post(url + 'complete/')
+        self.assertEqual((response.status_code, response.json()['offset']), (400, 400))
+        self.assertFalse(Message.objects.exists())
+
+    def test_chunk_arriving_while_another_streams_is_refused(self):
+        url = self.start()
+        upload = AttachmentUpload.objects.get()
+        with open(partial_path(upload), 'r+b') as fh:
+            # Held by a request still reading its chunk off the network
+            self.assertTrue(locks.lock(fh, locks.LOCK_EX | locks.LOCK_NB))
+            response = self.put(url, 0, self.data[:400])
+            locks.unlock(fh)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 0))
+        self.assertEqual(self.put(url, 0, self.data[:400]).json()['offset'], 400)
+
+
+class ProfileThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, THUMBNAIL_BACKGROUND=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def picture(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'teal').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('me.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def create_profile(self, username):
+        user = User.objects.create_user(username=username, user_type='freelancer')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = FreelancerProfile.objects.create(user=user, profile_pic=self.picture())
+        profile.refresh_from_db()
+        return profile
+
+    def test_thumbnails_are_rendered_without_metadata(self):
+        profile = self.create_profile('alice')
+        self.assertEqual(len(profile.profile_pic_digest), 64)
+        for fmt in ('webp', 'jpeg'):
+            with default_storage.open(thumbnail_name(profile.profile_pic_digest, 96, fmt)) as fh:
+                thumbnail = Image.open(fh)
+                self.assertEqual(thumbnail.size, (96, 96))
+                self.assertFalse(thumbnail.getexif())
+
+        # Same picture, same thumbnails; a new upload waits for its own
+        other = self.create_profile('bob')
+        self.assertEqual(other.profile_pic_digest, profile.profile_pic_digest)
+        other.profile_pic = self.picture()
+        other.save()
+        self.assertEqual(other.profile_pic_digest, '')
+
+    def test_list_pages_ship_thumbnails(self):
+        profile = self.create_profile('alice')
+        self.client.force_login(User.objects.create_user(username='client', user_type='client'))
+        response = self.client.get(reverse('core:browse_freelancers'))
+        self.assertContains(response, thumbnail_name(profile.profile_pic_digest, 200, 'webp'))
+        self.assertNotContains(response, profile.profile_pic.url)
+
+
+@skipUnless(np is not None, 'Recommendations need NumPy')
+class ProjectRecommendationTests(TestCase):
+    def setUp(self):
+        model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, model_dir)
+        settings_override = override_settings(MATCHING_MODEL_PATH=os.path.join(model_dir, 'matching.npz'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.freelancer = User.objects.create_user(username='djangodev', user_type='freelancer')
+        FreelancerProfile.objects.create(user=self.freelancer, skills='Python, Django')
+        FreelancerProfile.objects.create(
+            user=User.objects.create_user(username='mobiledev', user_type='freelancer'), skills='Swift, iOS',
+        )
+        self.api = self.create_project('Django REST API', 'Python, Django', 1000)
+        self.app = self.create_project('iPhone app', 'Swift, iOS', 5000)
+        self.bid_on = self.create_project('Django admin', 'Python, Django', 800)
+        Proposal.objects.create(project=self.bid_on, freelancer=self.freelancer, cover_letter='Hi', bid_amount=750)
+        self.client.force_login(self.freelancer)
+
+    def create_project(self, title, skills, budget):
+        project = Project.objects.create(client=self.client_user, title=title, description=title, budget=budget)
+        set_project_skills(project, skills)
+        return project
+
+    def best_matches(self):
+        return list(self.client.get(reverse('freelancer:dashboard')).context['open_projects'])
+
+    def test_dashboard_serves_precomputed_matches(self):
+        rebuild_project_recommendations()
+        self.assertEqual(
+            list(ProjectRecommendation.objects.filter(freelancer=self.freelancer).values_list('project', flat=True)),
+            [self.api.pk],
+        )
+        # The match comes first; the rest is topped up with the newest projects not bid on
+        self.assertEqual(self.best_matches(), [self.api, self.app])
+
+    def test_new_projects_and_proposals_update_matches(self):
+        rebuild_project_recommendations()
+        with self.captureOnCommitCallbacks(execute=True):
+            newer = self.create_project('Django migration', 'Django', 900)
+        self.assertTrue(ProjectRecommendation.objects.filter(freelancer=self.freelancer, project=newer).exists())
+        self.assertEqual(set(self.best_matches()[:2]), {self.api, newer})
+
+        Proposal.objects.create(project=self.api, freelancer=self.freelancer, cover_letter='Hi', bid_amount=900)
+        self.assertNotIn(self.api, self.best_matches())
+
+
+class FreelancerSuggestionTests(TestCase):
+    def setUp(self):
+        model_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, model_dir)
+        settings_override = override_settings(MATCHING_MODEL_PATH=os.path.join(model_dir, 'matching.npz'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.veteran = self.create_freelancer('veteran', 'Python, Django')
+        self.newcomer = self.create_freelancer('newcomer', 'Django')
+        self.create_freelancer('mobiledev', 'Swift, iOS')
+        self.project = Project.objects.create(
+            client=self.client_user, title='Django REST API', description='An API for our shop', budget=1000,
+        )
+        set_project_skills(self.project, 'Python, Django')
+
+    def create_freelancer(self, username, skills):
+        user = User.objects.create_user(username=username, user_type='freelancer')
+        FreelancerProfile.objects.create(user=user, skills=skills)
+        return user
+
+    def review(self, freelancer, rating):
+        project = Project.objects.create(client=self.client_user, title='Done', description='Done', budget=100)
+        Review.objects.create(project=project, client=self.client_user, freelancer=freelancer, rating=rating)
+
+    def suggested(self):
+        return [profile.user for profile in suggested_freelancers(self.project)]
+
+    def test_falls_back_to_skill_matches_without_a_model(self):
+        self.review(self.newcomer, 5)
+        self.assertEqual(self.suggested(), [self.newcomer, self.veteran])
+
+    @skipUnless(np, 'NumPy is not installed')
+    def test_ranks_by_skills_and_reputation(self):
+        self.review(self.veteran, 4)
+        rebuild_project_recommendations()
+        self.assertEqual(self.suggested(), [self.veteran, self.newcomer])
+
+        # Freelancers who already bid are in the proposals list instead
+        Proposal.objects.create(project=self.project, freelancer=self.veteran, cover_letter='Hi', bid_amount=900)
+        self.assertEqual(self.suggested(), [self.newcomer])
+
+    @skipUnless(np, 'NumPy is not installed')
+    def test_changes_since_the_rebuild_are_picked_up(self):
+        rebuild_project_recommendations()
+        joined = self.create_freelancer('joined', 'Python, Django')
+        for _ in range(3):
+            self.review(joined, 5)
+        self.assertEqual(self.suggested()[0], joined)
+
+        profile = FreelancerProfile.objects.get(user=joined)
+        profile.skills = 'Swift'
+        profile.save()
+        self.assertNotIn(joined, self.suggested())
+
+    @skipUnless(np, 'NumPy is not installed')
+    @override_settings(CANDIDATE_OVERLAY_MAX_SIZE=1)
+    def test_large_overlays_are_folded_into_the_model(self):
+        rebuild_project_recommendations()
+        joined = self.create_freelancer('joined', 'Python, Django')
+        for _ in range(3):
+            self.review(joined, 5)
+        profile = FreelancerProfile.objects.get(user=self.newcomer)
+        profile.skills = 'Swift'
+        profile.save()
+
+        self.assertEqual(self.suggested(), [joined, self.veteran])
+        index = get_candidate_index()
+        self.assertIsNone(index.overlay)
+        self.assertEqual(sorted(index.model.freelancer_ids.tolist()),
+                         sorted(FreelancerProfile.objects.values_list('pk', flat=True)))
+
+    def test_shown_to_the_owner_of_an_open_project(self):
+        self.client.force_login(self.client_user)
+        response = self.client.get(reverse('core:project_detail', args=[self.project.pk]))
+        self.assertContains(response, 'Suggested Freelancers')
+        self.assertEqual([p.user for p in response.context['suggested_freelancers']], [self.veteran, self.newcomer])
+
+        self.client.force_login(self.veteran)
+        response = self.client.get(reverse('core:project_detail', args=[self.project.pk]))
+        self.assertIsNone(response.context['suggested_freelancers'])
+
+
+class DomainEventTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', user_type='client')
+        self.received = []
+
+    def subscribe(self, *names, **options):
+        handler = events.subscriber(*names, **options)(self.received.append)
+        self.addCleanup(events.unsubscribe, handler)
+
+    def create_project(self):
+        return Project.objects.create(client=self.client_user, title='Site', description='Build it', budget=100)
+
+    def test_delivered_after_commit_and_dropped_on_rollback(self):
+        self.subscribe('project.created')
+        with self.captureOnCommitCallbacks(execute=True):
+            project = self.create_project()
+            self.assertEqual(self.received, [])
+        self.assertEqual([event.payload for event in self.received],
+                         [{'project_id': project.pk, 'client_id': self.client_user.pk}])
+        self.assertTrue(OutboxEvent.objects.get(pk=self.received[0].id).delivered_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.create_project()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_failed_events_are_redelivered_in_batches(self):
+        def flaky(batch):
+            raise RuntimeError('search index is down')
+        events.subscriber('project.created', batch=True)(flaky)
+        self.addCleanup(events.unsubscribe, flaky)
+        with self.assertLogs('core.events', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            projects = [self.create_project() for _ in range(3)]
+        self.assertEqual(OutboxEvent.objects.filter(delivered_at__isnull=True, attempts=1).count(), 3)
+
+        events.unsubscribe(flaky)
+        self.subscribe('project.created', batch=True)
+        self.assertEqual(events.deliver_pending(min_age=timedelta(0)), 3)
+        self.assertEqual([[event['project_id'] for event in batch] for batch in self.received],
+                         [[project.pk for project in projects]])
+        self.assertFalse(OutboxEvent.objects.filter(delivered_at__isnull=True).exists())
+
+    @override_settings(EVENT_OUTBOX_MAX_ATTEMPTS=2)
+    def test_redelivery_skips_live_subscribers_and_exhausted_events(self):
+        pushed = []
+        def flaky(event):
+            raise RuntimeError('search index is down')
+        for handler, options in ((flaky, {}), (pushed.append, {'redeliver': False})):
+            events.subscriber('project.created', **options)(handler)
+            self.addCleanup(events.unsubscribe, handler)
+        with self.assertLogs('core.events', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            project = self.create_project()
+        self.assertEqual(len(pushed), 1)
+
+        # Fails a second time, reaching the limit, and is then left alone
+        with self.assertLogs('core.events', 'ERROR'):
+            self.assertEqual(events.deliver_pending(min_age=timedelta(0)), 0)
+        self.assertEqual(events.deliver_pending(min_age=timedelta(0)), 0)
+        self.assertEqual(OutboxEvent.objects.get(payload__project_id=project.pk).attempts, 2)
+        self.assertEqual(len(pushed), 1)
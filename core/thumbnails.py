@@ -0,0 +1,149 @@
+"""Avatar thumbnails for profile pictures.
+
+Profile pictures are shown at 40-100px but stored as uploaded. When a
+``FreelancerProfile`` or ``ClientProfile`` gets a new picture, a background
+worker renders a square crop at every size in ``THUMBNAIL_SIZES`` as both
+WebP and JPEG. Orientation is applied first and EXIF, ICC and other
+metadata are then left out. The files are named by the SHA-256 of the
+original (``thumbnails/<aa>/<digest>-<px>.<ext>``), so identical pictures
+share thumbnails and a thumbnail's content never changes.
+
+The digest is written to ``profile_pic_digest`` only after every thumbnail
+exists. Until then ``avatar_url`` and the ``{% avatar %}`` tag fall back to
+the original picture.
+
+Pillow releases the GIL while decoding, resizing and encoding, so a thread
+pool is enough to keep the work off request threads. Set
+``THUMBNAIL_BACKGROUND = False`` to render inline after commit instead.
+Pictures uploaded before this existed are backfilled by the
+``generate_thumbnails`` command.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .storage import content_digest
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_PREFIX = 'thumbnails/'
+
+# format -> (file extension, Pillow save options); no exif/icc_profile is passed, which strips them
+THUMBNAIL_FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', {'small': 96, 'medium': 200})
+
+
+def thumbnail_name(digest, px, fmt):
+    extension = THUMBNAIL_FORMATS[fmt][0]
+    return f'{THUMBNAIL_PREFIX}{digest[:2]}/{digest}-{px}.{extension}'
+
+
+def avatar_url(profile, size='small', fmt='jpeg'):
+    """URL of a profile's avatar at ``size``, the original while thumbnails are pending, or None"""
+    if profile is None or not profile.profile_pic:
+        return None
+    if not profile.profile_pic_digest:
+        return profile.profile_pic.url
+    return default_storage.url(thumbnail_name(profile.profile_pic_digest, get_sizes()[size], fmt))
+
+
+def user_profile(user):
+    """The freelancer or client profile of ``user`` (ideally select_related), or None"""
+    for attr in ('freelancerprofile', 'clientprofile'):
+        try:
+            return getattr(user, attr)
+        except ObjectDoesNotExist:
+            pass
+    return None
+
+
+def _encode(image, fmt):
+    extension, options = THUMBNAIL_FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha: flatten transparent pictures onto white
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def render_thumbnails(source, digest, storage=default_storage):
+    """Write every missing thumbnail of the image in file ``source``"""
+    sizes = sorted(set(get_sizes().values()), reverse=True)
+    image = Image.open(source)
+    # Let the JPEG decoder downscale while reading instead of decoding every pixel
+    image.draft('RGB', (sizes[0], sizes[0]))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+
+    for px in sizes:
+        square = ImageOps.fit(image, (px, px), Image.Resampling.LANCZOS)
+        for fmt in THUMBNAIL_FORMATS:
+            name = thumbnail_name(digest, px, fmt)
+            if not storage.exists(name):
+                storage.save(name, _encode(square, fmt))
+
+
+def process_profile_picture(model, pk, name):
+    """Render thumbnails for picture ``name`` and record its digest if it is still current"""
+    storage = model._meta.get_field('profile_pic').storage
+    try:
+        with storage.open(name, 'rb') as source:
+            digest = content_digest(source)
+            source.seek(0)
+            render_thumbnails(source, digest)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Could not render thumbnails for %s', name, exc_info=True)
+        return False
+    # Skipped if another picture was uploaded in the meantime
+    return bool(model.objects.filter(pk=pk, profile_pic=name).update(profile_pic_digest=digest))
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2), thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def _process_in_worker(model, pk, name):
+    try:
+        process_profile_picture(model, pk, name)
+    finally:
+        # Worker threads open their own connections; don't leave them dangling
+        connections.close_all()
+
+
+def schedule_thumbnails(profile):
+    """Render the profile's picture once the transaction saving it commits"""
+    model, pk, name = type(profile), profile.pk, profile.profile_pic.name
+    if getattr(settings, 'THUMBNAIL_BACKGROUND', True):
+        transaction.on_commit(lambda: get_executor().submit(_process_in_worker, model, pk, name))
+    else:
+        transaction.on_commit(lambda: process_profile_picture(model, pk, name))
@@ -0,0 +1,231 @@
+"""Chunked, resumable chat attachment uploads.
+
+Large files are sent in pieces instead of one multipart request:
+
+1. ``POST api/messages/<project_id>/uploads/`` with ``filename``, ``size`` and
+   optionally ``sha256`` starts an upload and returns its id
+2. ``PUT api/uploads/<id>/`` with the raw bytes as the body and an
+   ``Upload-Offset`` header appends a chunk; an optional ``X-Chunk-SHA256``
+   header is checked before the chunk is accepted
+3. ``POST api/uploads/<id>/complete/`` with optional ``content`` turns the
+   finished file into a ``Message``
+
+Chunks are streamed from the request straight into a partial file, so
+neither the chunk nor the file is ever held in memory. The offset of every
+chunk must equal the bytes already received; after a dropped connection the
+client reads the offset back with ``GET api/uploads/<id>/`` (a mismatched
+``PUT`` is answered with 409 and the offset too) and carries on from there.
+Bytes that arrived before a disconnect are kept. A chunk is streamed while
+holding a lock on the partial file, not a database transaction, so a slow
+client never blocks writes; a second ``PUT`` arriving meanwhile gets a 409.
+
+Partial files live in ``CHAT_UPLOAD_TEMP_DIR`` (``FILE_UPLOAD_TEMP_DIR`` or
+the system temp dir by default). Abandoned uploads are removed by the
+``purge_chat_uploads`` management command.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File, locks
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AttachmentUpload, Message
+from .storage import content_digest
+
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+WRITE_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    status = 400
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadConflict(UploadError):
+    """The chunk does not start where the upload left off"""
+    status = 409
+
+
+def get_max_size():
+    return getattr(settings, 'CHAT_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+
+
+def get_max_chunk_size():
+    return getattr(settings, 'CHAT_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def upload_dir():
+    directory = (
+        getattr(settings, 'CHAT_UPLOAD_TEMP_DIR', None)
+        or os.path.join(settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(), 'chat-uploads')
+    )
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def partial_path(upload):
+    return os.path.join(upload_dir(), f'{upload.pk}.part')
+
+
+def upload_status(upload):
+    return {
+        'upload_id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': get_max_chunk_size(),
+        'complete': upload.received == upload.size,
+    }
+
+
+def start_upload(project_id, user, filename, size, sha256=''):
+    """Validate the declared file and create an empty partial file for it"""
+    filename = os.path.basename(filename or '').strip()[:255]
+    if not filename:
+        raise UploadError('filename is required')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be an integer')
+    if size <= 0:
+        raise UploadError('size must be positive')
+    if size > get_max_size():
+        raise UploadError(f'Attachments are limited to {get_max_size()} bytes')
+    sha256 = (sha256 or '').lower()
+    if sha256 and not SHA256_RE.match(sha256):
+        raise UploadError('sha256 must be 64 hex digits')
+
+    upload = AttachmentUpload.objects.create(
+        project_id=project_id, uploader=user, filename=filename, size=size, sha256=sha256,
+    )
+    open(partial_path(upload), 'wb').close()
+    return upload
+
+
+def _write_chunk(fh, offset, stream, length, digest):
+    """Copy up to ``length`` bytes from ``stream`` into ``fh`` at ``offset``"""
+    written = 0
+    fh.seek(offset)
+    fh.truncate()
+    try:
+        while written < length:
+            block = stream.read(min(WRITE_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            fh.write(block)
+            digest.update(block)
+            written += len(block)
+    except OSError:
+        # Client went away mid-chunk: keep what made it to disk
+        pass
+    return written
+
+
+def append_chunk(upload, offset, stream, length, checksum=None):
+    """
+    Append ``length`` bytes read from ``stream`` at ``offset`` and return the
+    refreshed upload. A chunk cut short by a disconnect still advances the
+    offset unless a checksum was given, in which case it is discarded.
+    """
+    if length > get_max_chunk_size():
+        raise UploadError(f'Chunks are limited to {get_max_chunk_size()} bytes')
+    try:
+        fh = open(partial_path(upload), 'r+b')
+    except FileNotFoundError:
+        raise UploadError('Upload has expired; start a new upload')
+    with fh:
+        # Two requests streaming into one file would mix their bytes; the later one backs off
+        if not locks.lock(fh, locks.LOCK_EX | locks.LOCK_NB):
+            raise UploadConflict('Another chunk is being written', offset=upload.received)
+        try:
+            # Re-read under the lock: a chunk may have landed since ``upload`` was fetched
+            upload.refresh_from_db(fields=['received', 'size'])
+            if offset != upload.received:
+                raise UploadConflict('Offset does not match the bytes received', offset=upload.received)
+            if offset + length > upload.size:
+                raise UploadError('Chunk runs past the declared size', offset=upload.received)
+
+            digest = hashlib.sha256()
+            written = _write_chunk(fh, offset, stream, length, digest)
+            if checksum is not None and (written != length or digest.hexdigest() != checksum.lower()):
+                fh.truncate(offset)
+                raise UploadError('Chunk checksum does not match', offset=upload.received)
+
+            # Only moves on from the offset the chunk was written at, so a stale offset is never saved
+            now = timezone.now()
+            moved = AttachmentUpload.objects.filter(pk=upload.pk, received=offset).update(
+                received=offset + written, updated_at=now,
+            )
+            if not moved:
+                raise UploadConflict('Offset does not match the bytes received', offset=upload.received)
+        finally:
+            locks.unlock(fh)
+    upload.received, upload.updated_at = offset + written, now
+    return upload
+
+
+def complete_upload(upload, content=''):
+    """Check and store the finished file, then attach it to a new Message in one short transaction"""
+    if upload.received != upload.size:
+        raise UploadError('Upload is incomplete', offset=upload.received)
+
+    # Hashing and copying a large file must not hold the database's write lock
+    field = Message._meta.get_field('attachment')
+    try:
+        fh = open(partial_path(upload), 'rb')
+    except FileNotFoundError:
+        raise UploadError('Upload has expired; start a new upload')
+    with fh:
+        attachment = File(fh, name=upload.filename)
+        digest = content_digest(attachment)
+        if upload.sha256 and digest != upload.sha256:
+            raise UploadError('File does not match the declared sha256; start a new upload')
+        # Saves ContentAddressedStorage from hashing the file a second time
+        attachment.sha256 = digest
+        # Stored files are shared and never deleted, so one left behind by a failure below is harmless
+        stored_name = field.storage.save(field.generate_filename(None, upload.filename), attachment)
+
+    with transaction.atomic():
+        try:
+            upload = AttachmentUpload.objects.select_for_update().get(pk=upload.pk)
+        except AttachmentUpload.DoesNotExist:
+            raise UploadConflict('Upload has already been completed or removed')
+        if upload.received != upload.size:
+            raise UploadError('Upload is incomplete', offset=upload.received)
+        message = Message.objects.create(
+            project_id=upload.project_id, sender_id=upload.uploader_id, content=content,
+            attachment=stored_name, attachment_name=upload.filename,
+        )
+        # Removes the partial file once committed (see core.signals)
+        upload.delete()
+    return message
+
+
+def discard_partial_file(upload):
+    path = partial_path(upload)
+    transaction.on_commit(lambda: _remove(path))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_stale_uploads(max_age=None):
+    """Delete uploads that have not received a chunk within ``max_age``; returns how many"""
+    if max_age is None:
+        max_age = timedelta(hours=getattr(settings, 'CHAT_UPLOAD_EXPIRY_HOURS', 24))
+    # Deleted through the ORM so post_delete removes each partial file
+    deleted, _ = AttachmentUpload.objects.filter(updated_at__lt=timezone.now() - max_age).delete()
+    return deleted
@@ -16,10 +16,21 @@ urlpatterns = [
     path('proposals/my/', views.proposal_list, name='proposal_list'),
     path('proposals/<int:proposal_id>/accept/', views.proposal_accept, name='proposal_accept'),
     path('messages/', views.all_messages, name='all_messages'),
+    path('messages/<int:message_id>/attachment/<str:filename>', views.message_attachment, name='message_attachment'),
     path('freelancers/', views.browse_freelancers, name='browse_freelancers'),
     
     # API endpoints for messaging
     path('api/messages/<int:project_id>/', api_views.get_messages, name='api_get_messages'),
     path('api/messages/<int:project_id>/send/', api_views.send_message, name='api_send_message'),
     path('api/messages/<int:project_id>/new/', api_views.get_new_messages, name='api_get_new_messages'),
+    path('api/messages/<int:project_id>/stream/', api_views.stream_messages, name='api_stream_messages'),
+    path('api/messages/<int:project_id>/uploads/', api_views.start_attachment_upload, name='api_start_attachment_upload'),
+    path('api/uploads/<uuid:upload_id>/', api_views.attachment_upload, name='api_attachment_upload'),
+    path('api/uploads/<uuid:upload_id>/complete/', api_views.complete_attachment_upload, name='api_complete_attachment_upload'),
+    
+    # API endpoint for dashboard charts
+    path('api/finance/summary/', api_views.financial_summary, name='api_financial_summary'),
+    
+    # API endpoint for query budget reports (staff only)
+    path('api/query-budget/', api_views.query_budget_report, name='api_query_budget_report'),
 ]
@@ -1,62 +1,98 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Avg
-from .models import Project, Proposal, Message, Review
+from django.db import transaction
+from django.http import Http404
+from .models import Project, Proposal, Message
 from .forms import ProjectForm, ProposalForm, MessageForm
-from users.models import User
-from freelancer.models import FreelancerProfile
+from .attachments import serve_attachment
+from .candidates import suggested_freelancers
+from .hiring import AcceptanceError, accept_proposal
+from .pagination import paginate
+from .search import get_search_backend
+from .skills import projects_with_skill, set_project_skills
+from .history import get_before_id, get_history_limit, history_window
+from .inbox import conversation_inbox, mark_conversation_read
+from .participants import can_message
+from .stats import get_user_stats
+from .directory import (
+    DIRECTORY_SORT_ORDERINGS, DEFAULT_DIRECTORY_SORT, search_freelancers, directory_entries,
+)
 
 
 def index(request):
     return render(request, 'index.html')
 
 
+# Keyset orderings for each sort option; ``id`` breaks ties so cursors are unique
+PROJECT_SORT_ORDERINGS = {
+    'relevance': ('search_rank', '-created_at', '-id'),
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+    '-budget': ('-budget', '-id'),
+    'budget': ('budget', 'id'),
+}
+
+
+def _parse_budget(value):
+    """Parse a budget filter from the query string, ignoring bad input"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _search_open_projects(request):
+    """Search, filter and paginate open projects through the search index"""
+    query = request.GET.get('q', '').strip()
+    skill = request.GET.get('skill', '').strip()
+    min_budget = request.GET.get('min_budget', '')
+    max_budget = request.GET.get('max_budget', '')
+    
+    projects = get_search_backend().search(
+        query,
+        status='open',
+        min_budget=_parse_budget(min_budget),
+        max_budget=_parse_budget(max_budget),
+    )
+    if skill:
+        projects = projects.filter(projects_with_skill(skill))
+    
+    # Best matches first when searching, newest first otherwise
+    sort_by = request.GET.get('sort') or ('relevance' if query else '-created_at')
+    if sort_by not in PROJECT_SORT_ORDERINGS:
+        sort_by = '-created_at'
+    page = paginate(request, projects, PROJECT_SORT_ORDERINGS[sort_by])
+    
+    filters = {
+        'query': query,
+        'skill': skill,
+        'min_budget': min_budget,
+        'max_budget': max_budget,
+        'sort_by': sort_by,
+    }
+    return page, filters
+
+
 @login_required
 def project_list(request):
     """List all open projects with search & filtering (accessible to freelancers)"""
     if request.user.user_type == 'freelancer':
         # Freelancers see all open projects with search/filtering
-        projects = Project.objects.filter(status='open')
-        
-        # Search by title or description
-        query = request.GET.get('q')
-        if query:
-            projects = projects.filter(
-                Q(title__icontains=query) | Q(description__icontains=query)
-            )
-        
-        # Filter by minimum budget
-        min_budget = request.GET.get('min_budget')
-        if min_budget:
-            try:
-                projects = projects.filter(budget__gte=float(min_budget))
-            except ValueError:
-                pass
-        
-        # Filter by maximum budget
-        max_budget = request.GET.get('max_budget')
-        if max_budget:
-            try:
-                projects = projects.filter(budget__lte=float(max_budget))
-            except ValueError:
-                pass
-        
-        # Sort by
-        sort_by = request.GET.get('sort', '-created_at')
-        if sort_by in ['-created_at', 'created_at', '-budget', 'budget']:
-            projects = projects.order_by(sort_by)
+        page, filters = _search_open_projects(request)
     else:
         # Clients see their own projects
-        projects = Project.objects.filter(client=request.user)
+        page = paginate(request, Project.objects.filter(client=request.user))
+        filters = {
+            'query': request.GET.get('q', ''),
+            'min_budget': request.GET.get('min_budget', ''),
+            'max_budget': request.GET.get('max_budget', ''),
+            'sort_by': request.GET.get('sort', '-created_at'),
+        }
     
-    context = {
-        'projects': projects,
-        'query': request.GET.get('q', ''),
-        'min_budget': request.GET.get('min_budget', ''),
-        'max_budget': request.GET.get('max_budget', ''),
-        'sort_by': request.GET.get('sort', '-created_at'),
-    }
+    context = {'projects': page, 'page': page, **filters}
     return render(request, 'core/project_list.html', context)
 
 
@@ -67,44 +103,9 @@ def freelancer_find_work(request):
         messages.error(request, "This page is only accessible to freelancers.")
         return redirect('core:index')
     
-    # Get all open projects
-    projects = Project.objects.filter(status='open')
-    
-    # Search by title or description
-    query = request.GET.get('q')
-    if query:
-        projects = projects.filter(
-            Q(title__icontains=query) | Q(description__icontains=query)
-        )
+    page, filters = _search_open_projects(request)
     
-    # Filter by minimum budget
-    min_budget = request.GET.get('min_budget')
-    if min_budget:
-        try:
-            projects = projects.filter(budget__gte=float(min_budget))
-        except ValueError:
-            pass
-    
-    # Filter by maximum budget
-    max_budget = request.GET.get('max_budget')
-    if max_budget:
-        try:
-            projects = projects.filter(budget__lte=float(max_budget))
-        except ValueError:
-            pass
-    
-    # Sort by
-    sort_by = request.GET.get('sort', '-created_at')
-    if sort_by in ['-created_at', 'created_at', '-budget', 'budget']:
-        projects = projects.order_by(sort_by)
-    
-    context = {
-        'projects': projects,
-        'query': request.GET.get('q', ''),
-        'min_budget': request.GET.get('min_budget', ''),
-        'max_budget': request.GET.get('max_budget', ''),
-        'sort_by': request.GET.get('sort', '-created_at'),
-    }
+    context = {'projects': page, 'page': page, **filters}
     return render(request, 'core/freelancer_project_list.html', context)
 
 
@@ -120,7 +121,10 @@ def project_create(request):
         if form.is_valid():
             project = form.save(commit=False)
             project.client = request.user
-            project.save()
+            # Commit the skills with the project so on_commit hooks see both
+            with transaction.atomic():
+                project.save()
+                set_project_skills(project, form.cleaned_data['skills'])
             messages.success(request, "Project created successfully!")
             return redirect('core:project_detail', project_id=project.id)
     else:
@@ -150,9 +154,15 @@ def project_detail(request, project_id):
         except Proposal.DoesNotExist:
             user_proposal = None
     
+    # Point the client at freelancers worth inviting while the project is open
+    suggestions = None
+    if proposals is not None and project.status == 'open':
+        suggestions = suggested_freelancers(project)
+    
     context = {
         'project': project,
         'proposals': proposals,
+        'suggested_freelancers': suggestions,
         'user_proposal': user_proposal,
         'can_submit_proposal': request.user.user_type == 'freelancer' and project.status == 'open' and user_proposal is None,
     }
@@ -220,37 +230,33 @@ def proposal_list(request):
         messages.error(request, "Only freelancers can view their proposals.")
         return redirect('core:index')
     
-    proposals = Proposal.objects.filter(freelancer=request.user)
-    return render(request, 'core/proposal_list.html', {'proposals': proposals})
+    proposals = Proposal.objects.filter(freelancer=request.user).select_related('project', 'project__client')
+    page = paginate(request, proposals)
+    return render(request, 'core/proposal_list.html', {'proposals': page, 'page': page})
 
 
 @login_required
 def proposal_accept(request, proposal_id):
     """Accept a proposal (clients only)"""
-    proposal = get_object_or_404(Proposal, id=proposal_id)
+    proposal = get_object_or_404(Proposal.objects.select_related('project', 'freelancer'), id=proposal_id)
     
-    if request.user.user_type != 'client' or proposal.project.client != request.user:
+    if request.user.user_type != 'client' or proposal.project.client_id != request.user.id:
         messages.error(request, "You don't have permission to accept this proposal.")
         return redirect('client:dashboard')
     
     if proposal.status != 'pending':
         messages.warning(request, "This proposal has already been processed.")
-        return redirect('core:project_proposals', project_id=proposal.project.id)
+        return redirect('core:project_proposals', project_id=proposal.project_id)
     
     if request.method == 'POST':
-        # Accept the proposal
-        proposal.status = 'accepted'
-        proposal.save()
-        
-        # Reject all other proposals for this project
-        Proposal.objects.filter(project=proposal.project, status='pending').exclude(id=proposal.id).update(status='rejected')
-        
-        # Change project status to in_progress
-        proposal.project.status = 'in_progress'
-        proposal.project.save()
-        
-        messages.success(request, f"Proposal accepted! Project status updated to 'In Progress'.")
-        return redirect('core:project_proposals', project_id=proposal.project.id)
+        # Rejects the other pending proposals and starts the project in one transaction
+        try:
+            accept_proposal(proposal)
+        except AcceptanceError as e:
+            messages.warning(request, str(e))
+        else:
+            messages.success(request, f"Proposal accepted! Project status updated to 'In Progress'.")
+        return redirect('core:project_proposals', project_id=proposal.project_id)
     
     return render(request, 'core/proposal_accept.html', {'proposal': proposal})
 
@@ -258,22 +264,16 @@ def proposal_accept(request, proposal_id):
 @login_required
 def project_messages(request, project_id):
     """View and send messages for a project"""
-    project = get_object_or_404(Project, id=project_id)
-    
-    # Get the accepted proposal to find the freelancer
-    accepted_proposal = project.proposals.filter(status='accepted').first()
-    
     # Check permissions: Only client who owns project or hired freelancer can access
-    can_access = False
-    if request.user.user_type == 'client' and project.client == request.user:
-        can_access = True
-    elif request.user.user_type == 'freelancer' and accepted_proposal and accepted_proposal.freelancer == request.user:
-        can_access = True
-    
-    if not can_access:
+    if not can_message(project_id, request.user):
         messages.error(request, "You don't have permission to access this conversation.")
         return redirect('core:project_list')
     
+    project = get_object_or_404(Project, id=project_id)
+    
+    # Get the accepted proposal to find the freelancer
+    accepted_proposal = project.proposals.filter(status='accepted').select_related('freelancer').first()
+    
     # Only allow messaging on in-progress projects
     if project.status != 'in_progress':
         messages.warning(request, "Messaging is only available for projects in progress.")
@@ -292,12 +292,22 @@ def project_messages(request, project_id):
     else:
         form = MessageForm()
     
-    # Get all messages for this project
-    project_messages = project.messages.all()
+    # Newest messages first; older ones are loaded with ?before_id= as the user scrolls up
+    try:
+        before_id = get_before_id(request)
+    except ValueError:
+        before_id = None
+    window = history_window(project.messages.select_related('sender'), before_id, get_history_limit(request))
+    if window and before_id is None:
+        mark_conversation_read(request.user, project.id, window.items[-1].id)
+    
+    if request.GET.get('partial'):
+        return render(request, 'core/message_history.html', {'messages_list': window, 'history': window})
     
     context = {
         'project': project,
-        'messages_list': project_messages,
+        'messages_list': window,
+        'history': window,
         'form': form,
         'accepted_proposal': accepted_proposal,
     }
@@ -305,10 +315,27 @@ def project_messages(request, project_id):
     return render(request, 'core/project_messages.html', context)
 
 
+@login_required
+def message_attachment(request, message_id, filename):
+    """Download a chat attachment (project participants only)"""
+    message = get_object_or_404(Message.objects.only('project_id', 'attachment', 'attachment_name'), id=message_id)
+    if not message.attachment or not can_message(message.project_id, request.user):
+        raise Http404('No attachment found.')
+    
+    try:
+        return serve_attachment(request, message.attachment.storage, message.attachment.name, message.attachment_filename)
+    except FileNotFoundError:
+        raise Http404('No attachment found.')
+
+
 @login_required
 def all_messages(request):
     """View all conversations for a user (WhatsApp-like interface)"""
-    project_list = []
+    # One query for the conversations; sidebar counts come from UserStats
+    context = {
+        'project_list': conversation_inbox(request.user),
+        **get_user_stats(request.user),
+    }
     
     if request.user.user_type == 'client':
         template_name = 'core/messages_client.html'
@@ -317,34 +344,7 @@ def all_messages(request):
             profile = request.user.clientprofile
         except:
             profile = None
-        
-        # Get all projects where user is client and project is in progress
-        projects = Project.objects.filter(client=request.user, status='in_progress')
-        for project in projects:
-            accepted_proposal = project.proposals.filter(status='accepted').first()
-            if accepted_proposal:
-                last_message = project.messages.order_by('-created_at').first()
-                project_list.append({
-                    'project': project,
-                    'accepted_proposal': accepted_proposal,
-                    'last_message': last_message,
-                })
-        
-        # Get stats for sidebar
-        active_projects = Project.objects.filter(client=request.user, status='in_progress')
-        completed_projects = Project.objects.filter(client=request.user, status='completed')
-        pending_proposals = Proposal.objects.filter(project__client=request.user, status='pending')
-        
-        # Sort by last message time
-        project_list.sort(key=lambda x: x['last_message'].created_at if x['last_message'] else x['project'].created_at, reverse=True)
-        
-        context = {
-            'project_list': project_list,
-            'profile': profile,
-            'active_projects_count': active_projects.count(),
-            'completed_projects_count': completed_projects.count(),
-            'pending_proposals_count': pending_proposals.count(),
-        }
+        context['profile'] = profile
     else:
         template_name = 'core/messages_freelancer.html'
         # Get freelancer's profile
@@ -353,42 +353,12 @@ def all_messages(request):
         except:
             profile = None
         
-        # Get all projects where user is the accepted freelancer
-        accepted_proposals = Proposal.objects.filter(
-            freelancer=request.user, 
-            status='accepted',
-            project__status='in_progress'
-        ).select_related('project')
-        
-        for proposal in accepted_proposals:
-            last_message = proposal.project.messages.order_by('-created_at').first()
-            project_list.append({
-                'project': proposal.project,
-                'accepted_proposal': proposal,
-                'last_message': last_message,
-            })
-        
-        # Sort by last message time
-        project_list.sort(key=lambda x: x['last_message'].created_at if x['last_message'] else x['project'].created_at, reverse=True)
-        
-        # Get stats for sidebar
-        active_jobs = Proposal.objects.filter(freelancer=request.user, status='accepted')
-        pending_proposals = Proposal.objects.filter(freelancer=request.user, status='pending')
-        completed_jobs = Proposal.objects.filter(freelancer=request.user, project__status='completed', status='accepted')
-        
         # Get rating and review count from profile
-        avg_rating = profile.avg_rating if profile else 0
-        review_count = profile.review_count if profile else 0
-        
-        context = {
-            'project_list': project_list,
+        context.update({
             'profile': profile,
-            'active_projects_count': active_jobs.count(),
-            'pending_proposals_count': pending_proposals.count(),
-            'completed_projects_count': completed_jobs.count(),
-            'avg_rating': avg_rating,
-            'review_count': review_count,
-        }
+            'avg_rating': profile.avg_rating if profile else 0,
+            'review_count': profile.review_count if profile else 0,
+        })
     
     return render(request, template_name, context)
 
@@ -401,42 +371,22 @@ def browse_freelancers(request):
         messages.error(request, "Only clients can browse freelancers.")
         return redirect('core:index')
     
-    # Get all freelancers with profiles
-    freelancers = User.objects.filter(user_type='freelancer')
-    
-    # Search by name or skills
-    query = request.GET.get('q')
-    if query:
-        freelancers = freelancers.filter(
-            Q(username__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query) |
-            Q(freelancerprofile__skills__icontains=query)
-        )
-    
-    # Get freelancer data with ratings
-    freelancer_list = []
-    for freelancer in freelancers:
-        try:
-            profile = freelancer.freelancerprofile
-            avg_rating = Review.objects.filter(freelancer=freelancer).aggregate(
-                avg_rating=Avg('rating')
-            )['avg_rating'] or 0
-            review_count = Review.objects.filter(freelancer=freelancer).count()
-            
-            freelancer_list.append({
-                'freelancer': freelancer,
-                'profile': profile,
-                'avg_rating': round(avg_rating, 1),
-                'review_count': review_count,
-            })
-        except FreelancerProfile.DoesNotExist:
-            # Skip freelancers without profiles
-            pass
+    query = request.GET.get('q', '').strip()
+    skill = request.GET.get('skill', '').strip()
+    sort_by = request.GET.get('sort', DEFAULT_DIRECTORY_SORT)
+    if sort_by not in DIRECTORY_SORT_ORDERINGS:
+        sort_by = DEFAULT_DIRECTORY_SORT
+    
+    # One joined query per page: ratings come from the denormalized profile columns
+    freelancers = search_freelancers(query=query, skill=skill)
+    page = paginate(request, freelancers, DIRECTORY_SORT_ORDERINGS[sort_by])
     
     context = {
-        'freelancer_list': freelancer_list,
-        'query': request.GET.get('q', ''),
+        'freelancer_list': directory_entries(page),
+        'page': page,
+        'query': query,
+        'skill': skill,
+        'sort_by': sort_by,
     }
     
     return render(request, 'core/browse_freelancers.html', context)
@@ -448,7 +398,7 @@ def proposal_list_client(request):
         messages.error(request, "Only clients can view this page.")
         return redirect('core:index')
     
-    projects = Project.objects.filter(client=request.user)
-    proposals = Proposal.objects.filter(project__in=projects)
+    proposals = Proposal.objects.filter(project__client=request.user).select_related('project', 'freelancer')
+    page = paginate(request, proposals)
     
-    return render(request, 'core/proposal_list_client.html', {'proposals': proposals})
\ No newline at end of file
+    return render(request, 'core/proposal_list_client.html', {'proposals': page, 'page': page})
\ No newline at end of file
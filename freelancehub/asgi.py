@@ -3,6 +3,10 @@ ASGI config for freelancehub project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the project through this entry point (e.g. ``uvicorn freelancehub.asgi:application``)
+so the streaming chat endpoint (``core.api_views.stream_messages``) holds open
+connections on the event loop instead of tying up a worker thread each.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Outermost after security so session and auth queries count too
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -138,3 +140,107 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+
+# Project search
+# Full-text index backend used by the project listings (see core/search.py)
+
+PROJECT_SEARCH_BACKEND = 'core.search.SQLiteFTSBackend'
+
+# Pagination
+# Listing views and the messages API use keyset pagination (see core/pagination.py)
+
+PAGINATION_PAGE_SIZE = 20
+PAGINATION_MAX_PAGE_SIZE = 100
+
+# Cache
+# Dashboard counters and the freelancer sidebar (core/stats.py) are cached under a per-user
+# version that is bumped when the counters move, and chat participants (core/participants.py)
+# are dropped when a hire is undone. With several worker processes this cache must be shared
+# (Redis, memcached): a per-process LocMemCache would keep serving entries another process
+# has already invalidated.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Real-time messaging
+# Broker that fans new chat messages out to open streams (see core/realtime.py).
+# Use 'core.realtime.RedisBroker' with MESSAGE_BROKER_URL when running several workers.
+# The SSE stream needs an ASGI server (freelancehub/asgi.py); under WSGI the chat long-polls.
+
+MESSAGE_BROKER_BACKEND = 'core.realtime.InMemoryBroker'
+MESSAGE_BROKER_URL = 'redis://localhost:6379/0'
+MESSAGE_STREAM_HEARTBEAT = 15  # seconds between heartbeat events on an idle stream
+MESSAGE_STREAM_TIMEOUT = 300  # seconds before a stream closes and the client reconnects
+LONG_POLL_MAX_WAIT = 30  # upper bound for ?wait= on api/messages/<id>/new/
+LONG_POLL_MAX_WAITERS = 500  # parked long-poll requests per worker before answering immediately
+LONG_POLL_BATCH_WINDOW = 0.05  # seconds to gather messages sent back-to-back
+
+# Chat history
+# Conversations open at their newest messages; older ones load in windows (see core/history.py)
+
+MESSAGE_HISTORY_LIMIT = 50
+MESSAGE_HISTORY_MAX_LIMIT = 200
+
+# Chat attachments
+# Stored content-addressed and served with access checks (see core/storage.py, core/attachments.py).
+# Set to 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd) to let the web server stream files;
+# for nginx, map CHAT_ATTACHMENT_ACCEL_PREFIX to MEDIA_ROOT in an `internal` location.
+
+CHAT_ATTACHMENT_SENDFILE = None
+CHAT_ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+
+# Large attachments are uploaded in resumable chunks (see core/uploads.py); run the
+# purge_chat_uploads command periodically to remove abandoned uploads.
+
+CHAT_UPLOAD_MAX_SIZE = 100 * 1024 * 1024  # bytes per attachment
+CHAT_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024  # bytes per PUT
+CHAT_UPLOAD_TEMP_DIR = None  # partial files; defaults to FILE_UPLOAD_TEMP_DIR or the system temp dir
+CHAT_UPLOAD_EXPIRY_HOURS = 24  # abandoned after this long without a chunk
+
+# Profile picture thumbnails
+# Avatars are rendered in the background as WebP and JPEG (see core/thumbnails.py). Files under
+# MEDIA_ROOT/thumbnails/ are named by content hash and never change, so they can be served with
+# far-future cache headers. Backfill existing pictures with the generate_thumbnails command.
+
+THUMBNAIL_SIZES = {'small': 96, 'medium': 200}  # square edge in pixels; ~2x the largest display size
+THUMBNAIL_BACKGROUND = True  # render in a thread pool; False renders inline after commit
+THUMBNAIL_WORKERS = 2
+
+# Matching and recommendations
+# Vectorized freelancer/project matching (see core/matching.py, core/recommendations.py). Run the
+# rebuild_recommendations command periodically (e.g. nightly); every web process reads the saved model.
+
+MATCHING_MODEL_PATH = BASE_DIR / 'var' / 'matching.npz'
+MATCHING_MAX_TERMS = 2048  # TF-IDF vocabulary size
+MATCHING_MAX_SKILLS = 4096
+MATCHING_WEIGHTS = {'skills': 0.55, 'terms': 0.3, 'budget': 0.15}
+RECOMMENDATION_TOP_K = 20  # best matches stored per freelancer
+RECOMMENDATION_MIN_SCORE = 0.1
+RECOMMENDATION_FANOUT = 1000  # most freelancers a newly posted project is added for
+CANDIDATE_TOP_K = 6  # freelancers suggested to a client on their open project
+CANDIDATE_REPUTATION_WEIGHT = 0.25  # share of the ranking that comes from ratings
+CANDIDATE_RATING_PRIOR = 5  # reviews at the site-wide average every rating starts from
+CANDIDATE_OVERLAY_MAX_SIZE = 1000  # freelancers changed since the rebuild before they are folded in
+
+# Domain events
+# State changes are published as events after commit (see core/events.py). With an outbox, run the
+# deliver_events command periodically (e.g. every few minutes) to retry undelivered events.
+
+EVENT_OUTBOX_BACKEND = 'core.events.DatabaseOutbox'  # None to skip durable delivery
+EVENT_OUTBOX_RETENTION_DAYS = 7  # delivered events kept for inspection
+EVENT_OUTBOX_MAX_ATTEMPTS = 10  # failed deliveries before deliver_events stops retrying an event
+EVENT_BACKGROUND = True  # run background subscribers in a thread pool; False runs them inline
+EVENT_WORKERS = 2
+EVENT_BATCH_SIZE = 500  # most events handed to a batch subscriber at once
+
+# Query budgets
+# Per-view SQL instrumentation (see core/instrumentation.py). Reports are served at
+# api/query-budget/ to staff and by the query_budget_report management command.
+
+QUERY_INSTRUMENTATION_ENABLED = False
+QUERY_INSTRUMENTATION_CACHE = 'default'  # use a shared cache to aggregate across workers
+QUERY_INSTRUMENTATION_BUDGET = 20  # queries per request before a view counts as over budget
+QUERY_INSTRUMENTATION_N_PLUS_ONE_THRESHOLD = 3  # repeats of one statement shape flagged as N+1
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_rating_sum(apps, schema_editor):
+    FreelancerProfile = apps.get_model('freelancer', 'FreelancerProfile')
+    Review = apps.get_model('core', 'Review')
+    totals = Review.objects.order_by().values('freelancer').annotate(total=Sum('rating'))
+    for row in totals:
+        FreelancerProfile.objects.filter(user_id=row['freelancer']).update(rating_sum=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freelancer', '0004_freelancerprofile_avg_rating_and_more'),
+        ('core', '0003_review'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, help_text='Running total of review ratings'),
+        ),
+        migrations.RunPython(backfill_rating_sum, migrations.RunPython.noop),
+    ]
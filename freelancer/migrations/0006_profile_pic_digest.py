@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freelancer', '0005_freelancerprofile_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='profile_pic_digest',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 of profile_pic once its thumbnails exist', max_length=64),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def _parse(text):
+    # Same rules as core.skills.parse_skills, frozen here for the migration
+    skills = {}
+    for part in (text or '').split(','):
+        name = ' '.join(part.split())[:100]
+        if name:
+            skills.setdefault(name.casefold()[:100], name)
+    return skills
+
+
+def backfill_skill_tags(apps, schema_editor):
+    FreelancerProfile = apps.get_model('freelancer', 'FreelancerProfile')
+    Skill = apps.get_model('core', 'Skill')
+    Link = FreelancerProfile.skill_tags.through
+
+    parsed = {
+        user_id: _parse(text)
+        for user_id, text in FreelancerProfile.objects.exclude(skills='').values_list('user_id', 'skills').iterator()
+    }
+    names = {}
+    for skills in parsed.values():
+        for key, name in skills.items():
+            names.setdefault(key, name)
+    Skill.objects.bulk_create(
+        [Skill(key=key, name=name) for key, name in names.items()], batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+    skill_ids = dict(Skill.objects.values_list('key', 'id'))
+    Link.objects.bulk_create(
+        [
+            Link(freelancerprofile_id=user_id, skill_id=skill_ids[key])
+            for user_id, skills in parsed.items() for key in skills
+        ],
+        batch_size=BATCH_SIZE, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_skill'),
+        ('freelancer', '0006_profile_pic_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='freelancerprofile',
+            name='skill_tags',
+            field=models.ManyToManyField(blank=True, help_text='Normalized from skills whenever the profile is saved', related_name='freelancers', to='core.skill'),
+        ),
+        migrations.RunPython(backfill_skill_tags, migrations.RunPython.noop),
+    ]
@@ -4,13 +4,26 @@ from users.models import User
 class FreelancerProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
     profile_pic = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_pic_digest = models.CharField(max_length=64, blank=True, editable=False,
+                                          help_text="SHA-256 of profile_pic once its thumbnails exist")
     skills = models.CharField(max_length=500, blank=True, help_text="Comma-separated list of skills")
+    skill_tags = models.ManyToManyField('core.Skill', related_name='freelancers', blank=True,
+                                        help_text="Normalized from skills whenever the profile is saved")
     bio = models.TextField(blank=True)
     avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
     review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0, help_text="Running total of review ratings")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      help_text="Last change to anything freelancer matching looks at")
 
     def __str__(self):
         return self.user.username
+
+    def save(self, *args, **kwargs):
+        # A new picture has no thumbnails until core.thumbnails renders them
+        if not self.profile_pic or not self.profile_pic._committed:
+            self.profile_pic_digest = ''
+        super().save(*args, **kwargs)
     
     def get_skills_list(self):
         """Returns skills as a list"""
@@ -6,6 +6,9 @@ from .forms import FreelancerRegistrationForm, FreelancerProfileForm
 from django.contrib.auth.forms import AuthenticationForm
 from users.models import User
 from core.models import Project, Proposal, Review
+from core.stats import get_user_stats
+from core.finance import total_amount
+from core.recommendations import recommended_projects
 
 def freelancer_register(request):
     if request.method == 'POST':
@@ -62,19 +65,15 @@ def freelancer_dashboard(request):
     
     # Get dashboard stats
     active_jobs = Proposal.objects.filter(freelancer=request.user, status='accepted')
-    pending_proposals = Proposal.objects.filter(freelancer=request.user, status='pending')
-    completed_jobs = Proposal.objects.filter(freelancer=request.user, project__status='completed', status='accepted')
     
-    # Best matches (open projects, limit to 3)
-    open_projects = Project.objects.filter(status='open').exclude(
-        proposals__freelancer=request.user
-    ).order_by('-created_at')[:3]
+    # Best matches, precomputed by core.recommendations
+    open_projects = recommended_projects(request.user, limit=3)
     
     # Active jobs for display
     active_jobs_display = active_jobs.select_related('project', 'project__client').order_by('-created_at')[:3]
     
     # Calculate total earnings (from completed projects)
-    total_earnings = sum(proposal.bid_amount for proposal in completed_jobs)
+    total_earnings = total_amount(request.user)
     
     # Get rating and review count from profile
     avg_rating = profile.avg_rating if profile else 0
@@ -83,9 +82,7 @@ def freelancer_dashboard(request):
     context = {
         'user': request.user,
         'profile': profile,
-        'active_projects_count': active_jobs.count(),
-        'pending_proposals_count': pending_proposals.count(),
-        'completed_projects_count': completed_jobs.count(),
+        **get_user_stats(request.user),
         'total_earnings': total_earnings,
         'open_projects': open_projects,
         'active_jobs': active_jobs_display,